@@ -3,20 +3,43 @@ Flask Backend for Sentiment Classification App
 Enhanced version with logging, better error handling, and input validation
 """
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
 import os
 import logging
-import pandas as pd
 from datetime import datetime
 from extensions import db, jwt, limiter
-from auth import auth_bp
-from models import Analysis
+from auth import auth_bp, operator_required, is_operator
+from jobs import jobs_bp
+from models import Analysis, TrainingJob
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, jwt_required
-from model_loader import predict_sentiment_bert, predict_aspect_sentiment, is_model_loaded, reload_model
-from scraper import get_youtube_comments
-from train import train
-import threading
+from model_loader import (
+    predict_sentiment_bulk, analyze_text, is_model_loaded, get_inference_stats,
+    activate_model, rollback_model, preload_model, get_readiness
+)
+from prediction_cache import text_hash
+from model_registry import list_versions
+from student_model import cascade_threshold
+from scraper import get_scraper
+from lexicon import list_lexicons, reload_lexicons
+from batch_scoring import (
+    SENTIMENT_LABELS, find_text_column, score_frame, sentiment_stats,
+    iter_file_chunks, stream_scored_chunks
+)
+from streaming import requested_stream_format, stream_events
+from training_runner import start_training_job, get_active_job, request_cancel
+from term_index import top_terms
+from rollups import trend, count_analyses, TREND_RANGES, TREND_BUCKETS
+from history import history_page, saved_sources, saved_run_status
+from saved_runs import SavedRun, file_source, url_source
+from history_writer import get_writer
+from migrations import upgrade as upgrade_database, schema_lock
+import metrics
+from metrics import timed
+
+# Heavy stacks (torch, transformers, datasets, pandas, the YouTube downloader)
+# are imported by the routes that need them, not here: the app answers
+# /api/health right after start-up. Checked by verify_startup.py.
 
 # Configure logging
 logging.basicConfig(
@@ -37,29 +60,51 @@ CORS(app)  # Enable CORS for API access
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sentiment.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = 'super-secret-key-change-this-in-production'
-
-# Global Training Status
-TRAINING_STATUS = {
-    'is_training': False,
-    'message': '',
-    'timestamp': None
+# Maximum rows scored per /api/batch-classify upload (0 = no limit)
+app.config['BATCH_MAX_ROWS'] = int(os.environ.get('BATCH_MAX_ROWS', '10000'))
+# Row limit in streaming mode (?stream=ndjson|sse), where memory stays flat (0 = no limit)
+app.config['BATCH_STREAM_MAX_ROWS'] = int(os.environ.get('BATCH_STREAM_MAX_ROWS', '0'))
+# Load and warm up the model in the background at start-up (see /api/ready)
+app.config['PRELOAD_MODEL'] = os.environ.get('SENTIMENT_PRELOAD_MODEL', '1') == '1'
+# Upper bounds for /api/scrape: comments per video and videos per request
+app.config['SCRAPE_MAX_LIMIT'] = int(os.environ.get('SCRAPE_MAX_LIMIT', '500'))
+app.config['SCRAPE_MAX_URLS'] = int(os.environ.get('SCRAPE_MAX_URLS', '10'))
+# Usernames allowed to activate/roll back model versions and reload lexicons
+# (comma-separated; empty: use the model_registry.py CLI instead)
+app.config['OPERATORS'] = {
+    name.strip() for name in os.environ.get('SENTIMENT_OPERATORS', '').split(',') if name.strip()
 }
+# Queue /api/classify history rows and write them in batches off the request path
+app.config['HISTORY_WRITE_BEHIND'] = os.environ.get('HISTORY_WRITE_BEHIND', '0') == '1'
 
 # Initialize Extensions
 db.init_app(app)
 jwt.init_app(app)
 limiter.init_app(app)
+metrics.init_app(app)
 
 # Register Blueprints
 app.register_blueprint(auth_bp)
+app.register_blueprint(jobs_bp)
 
-# Create Database Tables
-with app.app_context():
+# Create Database Tables and apply pending migrations (migrations.py),
+# one worker at a time
+with app.app_context(), schema_lock(db.engine):
     db.create_all()
+    upgrade_database(db.engine)
 
 # Configuration constants
 MIN_TEXT_LENGTH = 10
 MAX_TEXT_LENGTH = 1000
+# Comments per video when the request does not say
+SCRAPE_DEFAULT_LIMIT = 20
+# Scraped comments scored per batch (smaller in streaming mode, for a quick first result)
+SCRAPE_BATCH_SIZE = 32
+SCRAPE_STREAM_CHUNK_SIZE = 8
+# Seconds /api/classify waits for its history row id in write-behind mode
+HISTORY_ID_TIMEOUT = 5.0
+# Upper bound for /api/stats/wordcloud?limit=
+WORDCLOUD_MAX_TERMS = 200
 
 @app.route('/')
 def index():
@@ -78,14 +123,17 @@ def classify_sentiment():
     """
     API endpoint to classify sentiment from text input
     {
-        "text_input": "Your text here"
+        "text_input": "Your text here",
+        "domain": "restaurant",  (optional: restaurant, hotel, app, ecommerce)
+        "return_id": true        (optional: wait for the history row id in write-behind mode)
     }
     
     Returns JSON format:
     {
         "status": "success",
         "sentiment": "Positif/Negatif/Netral",
-        "text_length": 123
+        "text_length": 123,
+        "analysis_id": 42        (when saved to history and the id is known)
     }
     
     Error responses:
@@ -105,7 +153,8 @@ def classify_sentiment():
             }), 400
         
         # Get JSON data from request
-        data = request.get_json()
+        with timed('json_parse'):
+            data = request.get_json()
         
         # Check if data exists
         if data is None:
@@ -117,9 +166,18 @@ def classify_sentiment():
         
         # Extract text input
         text_input = data.get('text_input', '')
+        domain = data.get('domain')
+        
+        # Domain name of the aspect lexicon (unknown names are rejected by get_lexicon)
+        if domain is not None and not isinstance(domain, str):
+            logger.warning(f"Invalid domain type: {type(domain).__name__}")
+            return jsonify({
+                'status': 'error',
+                'message': 'Domain harus berupa teks'
+            }), 400
         
         # Validate input exists
-        if not text_input or text_input.strip() == '':
+        if not isinstance(text_input, str) or text_input.strip() == '':
             logger.warning("Empty text input received")
             return jsonify({
                 'status': 'error',
@@ -149,26 +207,41 @@ def classify_sentiment():
         # Log the analysis
         logger.info(f"Analyzing text ({text_length} characters): {text_input[:100]}...")
         
-        # Get sentiment prediction
-        sentiment, confidence = predict_sentiment_bert(text_input)
-        
-        # Get aspect-based sentiment
-        aspects = predict_aspect_sentiment(text_input)
+        # Get sentiment prediction and aspect-based sentiment
+        # (full text and aspect segments share one batched forward pass)
+        answered_by = []
+        sentiment, confidence, aspects = analyze_text(
+            text_input, domain, student_threshold=cascade_threshold('classify'), answered_by=answered_by
+        )
         
         # Save to DB if authenticated
+        analysis_id = None
         try:
-            verify_jwt_in_request(optional=True)
+            with timed('jwt_verify'):
+                verify_jwt_in_request(optional=True)
             current_user_id = get_jwt_identity()
             if current_user_id:
-                analysis = Analysis(
-                    user_id=current_user_id,
-                    text=text_input,
-                    sentiment=sentiment,
-                    confidence=confidence
-                )
-                db.session.add(analysis)
-                db.session.commit()
-                logger.info(f"Analysis saved for user {current_user_id}")
+                row = {
+                    'user_id': int(current_user_id),
+                    'text': text_input,
+                    'sentiment': sentiment,
+                    'confidence': confidence,
+                    # Lets batch and scrape runs reuse this result (saved_runs.py)
+                    'text_hash': text_hash(text_input),
+                    'model_fingerprint': answered_by[0]
+                }
+                if app.config['HISTORY_WRITE_BEHIND']:
+                    # Committed in the next batch, off the request path
+                    future = get_writer(app).submit(row)
+                    if data.get('return_id'):
+                        analysis_id = future.result(timeout=HISTORY_ID_TIMEOUT)
+                else:
+                    analysis = Analysis(**row)
+                    with timed('db_commit'):
+                        db.session.add(analysis)
+                        db.session.commit()
+                    analysis_id = analysis.id
+                    logger.info(f"Analysis saved for user {current_user_id}")
         except Exception as e:
             logger.warning(f"Failed to save analysis history: {e}")
             # Don't fail the request just because history saving failed
@@ -182,6 +255,8 @@ def classify_sentiment():
             'text_length': text_length,
             'timestamp': datetime.now().isoformat()
         }
+        if analysis_id is not None:
+            response['analysis_id'] = analysis_id
         
         logger.info(f"Classification successful: {sentiment}, Aspects: {len(aspects)}")
         return jsonify(response), 200
@@ -206,24 +281,47 @@ def classify_sentiment():
 @jwt_required()
 def get_history():
     """
-    Get analysis history for the current user
+    Get analysis history for the current user, newest first.
+    Pass the returned next_cursor as ?cursor= for the next page;
+    ?source= re-opens a saved batch or scrape run (see /api/history/sources),
+    with how its latest run ended in 'run';
+    ?include_total=1 adds the total number of analyses.
     """
-    current_user_id = get_jwt_identity()
-    page = request.args.get('page', 1, type=int)
+    current_user_id = int(get_jwt_identity())
+    cursor = request.args.get('cursor')
     per_page = request.args.get('per_page', 10, type=int)
-    
-    pagination = Analysis.query.filter_by(user_id=current_user_id)\
-        .order_by(Analysis.created_at.desc())\
-        .paginate(page=page, per_page=per_page, error_out=False)
-        
-    history = [item.to_dict() for item in pagination.items]
-    
+    source = request.args.get('source')
+
+    try:
+        items, next_cursor = history_page(current_user_id, cursor=cursor, per_page=per_page, source=source)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    response = {
+        'status': 'success',
+        'history': [item.to_dict() for item in items],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }
+    if source:
+        response['run'] = saved_run_status(current_user_id, source)
+    if request.args.get('include_total') in ('1', 'true') and not source:
+        # From the daily rollups, not a COUNT(*) over analyses
+        response['total'] = count_analyses(current_user_id)
+
+    return jsonify(response), 200
+
+
+@app.route('/api/history/sources', methods=['GET'])
+@jwt_required()
+def get_history_sources():
+    """
+    Saved batch and scrape runs of the current user
+    """
+    current_user_id = int(get_jwt_identity())
     return jsonify({
         'status': 'success',
-        'history': history,
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'current_page': page
+        'sources': saved_sources(current_user_id)
     }), 200
 
 
@@ -231,53 +329,33 @@ def get_history():
 @jwt_required()
 def get_sentiment_trend():
     """
-    Get daily sentiment counts for the last 7 days
+    Get sentiment counts over the last 7, 30 or 90 days (?range=),
+    per day or per week (?bucket=day|week)
     """
-    current_user_id = get_jwt_identity()
-    from sqlalchemy import func, text
-    from datetime import timedelta
-    
-    # Calculate date 7 days ago
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    
-    # Query to group by date and sentiment
-    # SQLite-specific date formatting
-    results = db.session.query(
-        func.date(Analysis.created_at).label('date'),
-        Analysis.sentiment,
-        func.count(Analysis.id)
-    ).filter(
-        Analysis.user_id == current_user_id,
-        Analysis.created_at >= seven_days_ago
-    ).group_by(
-        func.date(Analysis.created_at),
-        Analysis.sentiment
-    ).all()
-    
-    # Process results
-    dates = []
-    # Create a map for easy lookup
-    data_map = {}
-    
-    # Initialize last 7 days
-    for i in range(7):
-        d = (seven_days_ago + timedelta(days=i+1)).strftime('%Y-%m-%d')
-        dates.append(d)
-        data_map[d] = {'Positif': 0, 'Negatif': 0, 'Netral': 0}
-        
-    for r in results:
-        date_str = r[0]
-        sentiment = r[1]
-        count = r[2]
-        if date_str in data_map:
-            data_map[date_str][sentiment] = count
+    current_user_id = int(get_jwt_identity())
+    days = request.args.get('range', 7, type=int)
+    bucket = request.args.get('bucket', 'day')
+
+    if days not in TREND_RANGES:
+        return jsonify({
+            'status': 'error',
+            'message': f"range must be one of: {', '.join(map(str, TREND_RANGES))}"
+        }), 400
+    if bucket not in TREND_BUCKETS:
+        return jsonify({
+            'status': 'error',
+            'message': f"bucket must be one of: {', '.join(TREND_BUCKETS)}"
+        }), 400
+
+    # Read from the daily rollups maintained on every write
+    data = trend(current_user_id, days=days, bucket=bucket)
             
     # Format for Chart.js
     response = {
-        'dates': dates,
-        'positive': [data_map[d]['Positif'] for d in dates],
-        'negative': [data_map[d]['Negatif'] for d in dates],
-        'neutral': [data_map[d]['Netral'] for d in dates]
+        'dates': data['dates'],
+        'positive': data['Positif'],
+        'negative': data['Negatif'],
+        'neutral': data['Netral']
     }
     
     return jsonify(response), 200
@@ -288,44 +366,29 @@ def get_sentiment_trend():
 def get_wordcloud_data():
     """
     Get word frequency for word cloud
+    Optional query parameters: days (time window), sentiment, limit
     """
-    current_user_id = get_jwt_identity()
-    import re
-    from collections import Counter
-    
-    # Get all text from user's history
-    analyses = Analysis.query.filter_by(user_id=current_user_id).all()
-    
-    if not analyses:
-        return jsonify([]), 200
-        
-    all_text = " ".join([a.text.lower() for a in analyses])
-    
-    # Simple tokenization and cleanup
-    # Remove non-alphanumeric characters
-    words = re.findall(r'\w+', all_text)
-    
-    # Indonesian Stopwords (Basic list)
-    stopwords = set([
-        'yang', 'di', 'dan', 'itu', 'dengan', 'untuk', 'tidak', 'ini', 'dari',
-        'dalam', 'akan', 'pada', 'juga', 'saya', 'ke', 'karena', 'tersebut',
-        'bisa', 'ada', 'mereka', 'lebih', 'sudah', 'atau', 'saat', 'oleh',
-        'sebagai', 'adalah', 'apa', 'kita', 'kamu', 'dia', 'anda', 'aku',
-        'sangat', 'tapi', 'namun', 'jika', 'kalau', 'maka', 'sehingga',
-        'banyak', 'sedikit', 'kurang', 'cukup', 'paling', 'seperti', 'hanya'
-    ])
-    
-    # Filter words
-    filtered_words = [w for w in words if w not in stopwords and len(w) > 3]
-    
-    # Count frequency
-    word_counts = Counter(filtered_words)
-    
+    current_user_id = int(get_jwt_identity())
+    days = request.args.get('days', type=int)
+    sentiment = request.args.get('sentiment')
+    limit = request.args.get('limit', 50, type=int)
+
+    if days is not None and days < 1:
+        return jsonify({'status': 'error', 'message': 'days must be a positive number'}), 400
+    if sentiment and sentiment not in SENTIMENT_LABELS:
+        return jsonify({
+            'status': 'error',
+            'message': f"sentiment must be one of: {', '.join(SENTIMENT_LABELS)}"
+        }), 400
+    limit = max(1, min(limit, WORDCLOUD_MAX_TERMS))
+
+    # Counts are kept up to date on every write (term_index), nothing is tokenized here
+    terms = top_terms(current_user_id, limit=limit, days=days, sentiment=sentiment)
+
     # Format for word cloud library (e.g., [{text: 'word', weight: 10}])
-    # Return top 50
     result = [
-        {'text': word, 'weight': count} 
-        for word, count in word_counts.most_common(50)
+        {'text': word, 'weight': count}
+        for word, count in terms
     ]
     
     return jsonify(result), 200
@@ -334,55 +397,145 @@ def get_wordcloud_data():
 @app.route('/api/scrape', methods=['POST'])
 def scrape_and_analyze():
     """
-    Scrape comments from a URL and analyze sentiment
+    Scrape comments from one or more video URLs and analyze sentiment
+    {
+        "url": "https://youtu.be/...",   (or "urls": ["...", "..."], fetched concurrently)
+        "limit": 20                      (optional: comments per video, up to SCRAPE_MAX_LIMIT)
+    }
+    Add ?stream=ndjson or ?stream=sse to receive results as they are scored
     """
+    runs = {}
     try:
-        data = request.get_json()
-        url = data.get('url')
+        data = request.get_json(silent=True) or {}
+        urls = data.get('urls') or ([data['url']] if data.get('url') else [])
+        if isinstance(urls, str):
+            urls = [urls]
         
-        if not url:
+        if not urls or not all(isinstance(url, str) and url.strip() for url in urls):
             return jsonify({'status': 'error', 'message': 'URL is required'}), 400
+        if len(urls) > app.config['SCRAPE_MAX_URLS']:
+            return jsonify({
+                'status': 'error',
+                'message': f"At most {app.config['SCRAPE_MAX_URLS']} URLs per request"
+            }), 400
+
+        limit = data.get('limit', SCRAPE_DEFAULT_LIMIT)
+        max_limit = app.config['SCRAPE_MAX_LIMIT']
+        if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= max_limit:
+            return jsonify({'status': 'error', 'message': f'limit must be between 1 and {max_limit}'}), 400
+
+        urls = [url.strip() for url in urls]
+        runs = {url: _saved_run(url_source(url), 'scrape') for url in urls}
             
-        # Limit to 20 comments for performance
-        comments = get_youtube_comments(url, limit=20)
-        
-        if not comments:
-            return jsonify({'status': 'error', 'message': 'No comments found or invalid URL'}), 400
+        stream_format = requested_stream_format(request)
+        if stream_format:
+            return stream_events(_scrape_events(urls, limit, runs), stream_format)
             
         results = []
-        stats = {'Positif': 0, 'Negatif': 0, 'Netral': 0}
-        
-        for text in comments:
-            # Skip very short comments
-            if len(text) < 3:
+        stats = dict.fromkeys(SENTIMENT_LABELS, 0)
+        videos = []
+        # Videos download concurrently; each batch is scored as soon as it arrives
+        for kind, url, payload in get_scraper().iter_batches(urls, limit, SCRAPE_BATCH_SIZE):
+            if kind == 'done':
+                videos.append(_finish_video(payload, runs.get(url)))
                 continue
-                
-            sentiment, confidence = predict_sentiment_bert(text)
-            results.append({
-                'text': text,
-                'sentiment': sentiment,
-                'confidence': confidence
-            })
-            stats[sentiment] += 1
+            for record in _score_comments(url, payload, runs.get(url)):
+                results.append(record)
+                stats[record['sentiment']] = stats.get(record['sentiment'], 0) + 1
+        
+        if not results:
+            return jsonify({
+                'status': 'error',
+                'message': 'No comments found or invalid URL',
+                'videos': videos
+            }), 400
             
         return jsonify({
             'status': 'success',
             'results': results,
             'stats': stats,
-            'total': len(results)
+            'total': len(results),
+            'videos': videos
         }), 200
     except Exception as e:
         logger.error(f"Scrape error: {e}")
+        _finish_runs(runs.values(), str(e))
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+def _score_comments(url, comments, run=None):
+    """
+    Score one batch of scraped comments (and save it with a SavedRun)
+    """
+    # Skip very short comments
+    texts = [text for text in comments if len(text) >= 3]
+    if run is not None:
+        predictions = run.predict(texts)
+    else:
+        predictions = predict_sentiment_bulk(texts, student_threshold=cascade_threshold('scrape'))
+
+    records = [
+        {'text': text, 'sentiment': sentiment, 'confidence': confidence, 'url': url}
+        for text, (sentiment, confidence) in zip(texts, predictions)
+    ]
+    if run is not None:
+        run.save(records)
+    return records
+
+
+def _finish_video(info, run=None):
+    """Record how a URL's saved run ended (see saved_runs.py) and summarize it."""
+    if run is not None:
+        run.finish(info.get('error'))
+    return {**info, 'saved_run': run.summary() if run is not None else None}
+
+
+def _finish_runs(runs, error):
+    """Mark the saved runs still going when a request stops early as partial."""
+    for run in runs:
+        if run is not None:
+            run.finish(error)
+
+
+def _scrape_events(urls, limit, runs):
+    """
+    Streaming events for /api/scrape: comments are scored in small batches
+    while the rest are still downloading (and saved per batch with a SavedRun).
+    A 'video' event reports each finished URL.
+    """
+    stats = dict.fromkeys(SENTIMENT_LABELS, 0)
+    total = 0
+    error = 'Stream closed by the client'
+    try:
+        for kind, url, payload in get_scraper().iter_batches(urls, limit, SCRAPE_STREAM_CHUNK_SIZE):
+            if kind == 'done':
+                yield 'video', _finish_video(payload, runs.get(url))
+                continue
+            for record in _score_comments(url, payload, runs.get(url)):
+                stats[record['sentiment']] = stats.get(record['sentiment'], 0) + 1
+                total += 1
+                yield 'result', record
+        error = None
+    except Exception as e:
+        logger.error(f"Scrape stream error: {e}")
+        error = str(e)
+        yield 'error', {'message': error}
+        return
+    finally:
+        # Runs of URLs that did not finish (error, or the client went away)
+        _finish_runs(runs.values(), error)
+
+    yield 'stats', {'stats': stats, 'total': total}
 
 
 @app.route('/api/batch-classify', methods=['POST'])
 def batch_classify():
     """
     Classify sentiment for a batch of texts from CSV/Excel file
+    Add ?stream=ndjson or ?stream=sse to receive results as they are scored
+    (CSV files are then read in chunks and not limited to BATCH_MAX_ROWS)
     """
+    run = None
     try:
         if 'file' not in request.files:
             return jsonify({'status': 'error', 'message': 'No file part'}), 400
@@ -394,69 +547,86 @@ def batch_classify():
         if not (file.filename.endswith('.csv') or file.filename.endswith('.xlsx')):
             return jsonify({'status': 'error', 'message': 'File must be CSV or Excel'}), 400
             
+        run = _saved_run(file_source(file.filename), 'batch')
+        stream_format = requested_stream_format(request)
+        if stream_format:
+            return stream_events(_batch_events(file, run), stream_format)
+            
+        max_rows = app.config['BATCH_MAX_ROWS']
+        # Read one row past the limit to know whether the file was truncated
+        nrows = max_rows + 1 if max_rows else None
+
+        import pandas as pd
+
         # Read file
         try:
             if file.filename.endswith('.csv'):
-                df = pd.read_csv(file)
+                df = pd.read_csv(file, nrows=nrows)
             else:
-                df = pd.read_excel(file)
+                df = pd.read_excel(file, nrows=nrows)
         except Exception as e:
             return jsonify({'status': 'error', 'message': f'Error reading file: {str(e)}'}), 400
             
         # Find text column
-        text_col = None
-        possible_cols = ['text', 'review', 'content', 'komentar', 'ulasan', 'comment']
-        
-        for col in df.columns:
-            if col.lower() in possible_cols:
-                text_col = col
-                break
-                
-        if not text_col:
-            # If no matching column, take the first string column
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    text_col = col
-                    break
+        text_col = find_text_column(df)
                     
-        if not text_col:
+        if text_col is None:
              return jsonify({'status': 'error', 'message': 'Could not find a text column in the file'}), 400
              
-        # Limit rows for performance
-        if len(df) > 1000:
-            df = df.head(1000)
-            
-        results = []
-        stats = {'Positif': 0, 'Negatif': 0, 'Netral': 0}
-        
-        for index, row in df.iterrows():
-            text = str(row[text_col])
-            if len(text) < 3:
-                continue
-                
-            sentiment, confidence = predict_sentiment_bert(text)
+        # Apply the configurable row limit
+        truncated = bool(max_rows) and len(df) > max_rows
+        if truncated:
+            df = df.head(max_rows)
             
-            results.append({
-                'text': text,
-                'sentiment': sentiment,
-                'confidence': confidence,
-                'original_row': index
-            })
-            stats[sentiment] += 1
+        # Vectorized filtering, length-bucketed batched inference
+        scored = score_frame(df, text_col, cascade_threshold('batch'), run.predict if run else None)
+        stats = sentiment_stats(scored)
+        if run is not None:
+            run.save(scored[['text', 'sentiment', 'confidence']].to_dict('records'))
+            run.finish()
             
         return jsonify({
             'status': 'success',
-            'results': results,
+            'results': scored.to_dict('records'),
             'stats': stats,
-            'total': len(results),
-            'filename': file.filename
+            'total': len(scored),
+            'filename': file.filename,
+            'truncated': truncated,
+            'max_rows': max_rows,
+            'saved_run': run.summary() if run is not None else None
         }), 200
         
     except Exception as e:
         logger.error(f"Batch analysis error: {e}")
+        _finish_runs([run], str(e))
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+def _batch_events(file, run=None):
+    """
+    Streaming events for /api/batch-classify: the file is read and scored chunk
+    by chunk (and saved per chunk with a SavedRun), and running stats are
+    flushed at the end.
+    """
+    error = 'Stream closed by the client'
+    try:
+        chunks = iter_file_chunks(file, file.filename)
+        max_rows = app.config['BATCH_STREAM_MAX_ROWS']
+        for event_type, payload in stream_scored_chunks(chunks, max_rows, cascade_threshold('batch'), run):
+            if event_type == 'stats':
+                payload['filename'] = file.filename
+                error = None
+            elif event_type == 'error':
+                error = payload['message']
+            yield event_type, payload
+    except Exception as e:
+        logger.error(f"Batch stream error: {e}")
+        error = str(e)
+        yield 'error', {'message': error}
+    finally:
+        _finish_runs([run], error)
+
+
 @app.route('/api/feedback/<int:analysis_id>', methods=['POST'])
 @jwt_required()
 def submit_feedback(analysis_id):
@@ -475,11 +645,12 @@ def submit_feedback(analysis_id):
             return jsonify({'status': 'error', 'message': 'Analysis not found'}), 404
             
         # Ensure user owns this analysis
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         if analysis.user_id != current_user_id:
             return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
             
         analysis.correction = correction
+        analysis.corrected_at = datetime.utcnow()
         db.session.commit()
         
         logger.info(f"Feedback received for analysis {analysis_id}: {correction}")
@@ -511,43 +682,24 @@ def upload_train_data():
         if not file.filename.endswith('.csv'):
             return jsonify({'status': 'error', 'message': 'File must be CSV'}), 400
             
-        # Save file
+        # Save file (one per job, the process reads it later)
         upload_dir = 'uploads'
         if not os.path.exists(upload_dir):
             os.makedirs(upload_dir)
             
-        filepath = os.path.join(upload_dir, 'training_data.csv')
+        filepath = os.path.join(upload_dir, f"training_data-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.csv")
         file.save(filepath)
         
-        # Trigger training in background thread to avoid blocking
-        # Note: In production, use Celery/Redis
-        def run_training():
-            global TRAINING_STATUS
-            TRAINING_STATUS['is_training'] = True
-            TRAINING_STATUS['message'] = 'Training in progress...'
-            TRAINING_STATUS['timestamp'] = datetime.now().isoformat()
-            
-            try:
-                logger.info("Starting background training...")
-                train(data_path=filepath)
-                logger.info("Background training completed.")
-                
-                # Reload the model to use the new weights
-                reload_model()
-                
-                TRAINING_STATUS['message'] = 'Training completed successfully!'
-            except Exception as e:
-                logger.error(f"Training failed: {e}")
-                TRAINING_STATUS['message'] = f'Training failed: {str(e)}'
-            finally:
-                TRAINING_STATUS['is_training'] = False
-
-        thread = threading.Thread(target=run_training)
-        thread.start()
+        # Training runs in its own low-priority process (see training_runner.py)
+        job, error = start_training_job(app, data_path=filepath, user_id=_optional_user_id())
+        if error:
+            os.remove(filepath)
+            return jsonify({'status': 'error', 'message': error}), 409
         
         return jsonify({
             'status': 'success', 
-            'message': 'File uploaded. Training started in background.'
+            'message': 'File uploaded. Training started in background.',
+            'job': job.to_dict()
         }), 200
         
     except Exception as e:
@@ -558,9 +710,58 @@ def upload_train_data():
 @app.route('/api/training-status', methods=['GET'])
 def get_training_status():
     """
-    Get current training status
+    Get current training status (the active job, otherwise the latest one).
+    Shared by all app workers through the training_jobs table.
+    """
+    job = get_active_job() or TrainingJob.query.order_by(TrainingJob.created_at.desc()).first()
+    if job is None:
+        return jsonify({'is_training': False, 'message': '', 'timestamp': None, 'job': None}), 200
+
+    return jsonify({
+        'is_training': job.status in ('queued', 'running'),
+        'message': job.message or '',
+        'timestamp': (job.finished_at or job.started_at or job.created_at).isoformat(),
+        'job': job.to_dict()
+    }), 200
+
+
+@app.route('/api/training/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_training(job_id):
+    """
+    Cancel a queued or running training job (its uploader or an operator only)
     """
-    return jsonify(TRAINING_STATUS), 200
+    job = TrainingJob.query.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Training job not found'}), 404
+    user_id = int(get_jwt_identity())
+    if job.user_id != user_id and not is_operator(user_id):
+        return jsonify({'status': 'error', 'message': 'Not allowed to cancel this training job'}), 403
+    if job.status not in ('queued', 'running'):
+        return jsonify({'status': 'error', 'message': f'Training job already {job.status}'}), 409
+
+    request_cancel(job)
+    return jsonify({'status': 'success', 'job': job.to_dict()}), 200
+
+
+def _saved_run(source, endpoint):
+    """
+    SavedRun for an authenticated batch or scrape request (None for anonymous
+    requests or with ?save=0)
+    """
+    user_id = _optional_user_id()
+    if user_id is None or request.args.get('save') == '0':
+        return None
+    return SavedRun(user_id, source, cascade_threshold(endpoint))
+
+
+def _optional_user_id():
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        return None
+    return int(identity) if identity is not None else None
 
 
 @app.route('/api/health', methods=['GET'])
@@ -575,6 +776,109 @@ def health_check():
     }), 200
 
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: request, stage and model metrics of all
+    worker processes (see metrics.py)
+    """
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe for load balancers: 503 until the model is loaded, warmed
+    up, and its warm latency is under SENTIMENT_READY_MAX_LATENCY_MS
+    """
+    readiness = get_readiness()
+    readiness['status'] = 'ready' if readiness['ready'] else 'not_ready'
+    readiness['timestamp'] = datetime.now().isoformat()
+    return jsonify(readiness), 200 if readiness['ready'] else 503
+
+
+@app.route('/api/lexicons', methods=['GET'])
+def get_lexicons():
+    """
+    List available aspect lexicon domains
+    """
+    return jsonify({
+        'status': 'success',
+        'lexicons': list_lexicons()
+    }), 200
+
+
+@app.route('/api/lexicons/reload', methods=['POST'])
+@operator_required
+def reload_aspect_lexicons():
+    """
+    Reload aspect lexicon files without restarting the server
+    """
+    try:
+        domains = reload_lexicons()
+        return jsonify({'status': 'success', 'domains': domains}), 200
+    except Exception as e:
+        logger.error(f"Lexicon reload error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+
+@app.route('/api/inference/stats', methods=['GET'])
+def inference_stats():
+    """
+    Inference engine statistics: micro-batcher queue depth and batch-size histogram
+    """
+    return jsonify({
+        'status': 'success',
+        'inference': get_inference_stats()
+    }), 200
+
+
+@app.route('/api/models', methods=['GET'])
+def get_model_versions():
+    """
+    List registered model versions and the model currently serving
+    """
+    stats = get_inference_stats()
+    return jsonify({
+        'status': 'success',
+        'versions': list_versions(),
+        'serving': stats['model'],
+        'standby': stats['standby_model']
+    }), 200
+
+
+@app.route('/api/models/<version>/activate', methods=['POST'])
+@operator_required
+def activate_model_version(version):
+    """
+    Promote a model version. It is loaded and warmed up before it takes traffic.
+    """
+    try:
+        model = activate_model(version)
+        return jsonify({'status': 'success', 'serving': model.to_dict()}), 200
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Model activation error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/models/rollback', methods=['POST'])
+@operator_required
+def rollback_model_version():
+    """
+    Switch back to the previous model version
+    """
+    try:
+        model = rollback_model()
+        return jsonify({'status': 'success', 'serving': model.to_dict()}), 200
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    except Exception as e:
+        logger.error(f"Model rollback error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -603,6 +907,19 @@ def internal_error(error):
     }), 500
 
 
+def _should_preload():
+    if not app.config['PRELOAD_MODEL']:
+        return False
+    # `python app.py` runs the reloader: only its child process serves requests
+    if __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return False
+    return True
+
+
+if _should_preload():
+    preload_model()
+
+
 if __name__ == '__main__':
     logger.info("\n" + "="*50)
     logger.info("Starting Sentiment Classification Application")
@@ -1,4 +1,5 @@
-from flask import Blueprint, request, jsonify
+from functools import wraps
+from flask import Blueprint, request, jsonify, current_app
 from extensions import db, jwt, limiter
 from models import User
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
@@ -6,6 +7,28 @@ from datetime import timedelta
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+
+def is_operator(user_id):
+    """True if the user's username is listed in app.config['OPERATORS']."""
+    user = db.session.get(User, user_id)
+    return user is not None and user.username in current_app.config['OPERATORS']
+
+
+def operator_required(fn):
+    """
+    Like jwt_required(), for endpoints that change what every user is served
+    (model versions, lexicons): only usernames listed in app.config['OPERATORS']
+    may call them.
+    """
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if not is_operator(int(get_jwt_identity())):
+            return jsonify({'status': 'error', 'message': 'Operator access required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+
 @auth_bp.route('/register', methods=['POST'])
 @limiter.limit("5 per minute")
 def register():
@@ -0,0 +1,135 @@
+"""
+Helpers for scoring tabular text data (batch uploads, jobs).
+
+pandas is imported inside the functions that build DataFrames, so importing
+this module (and the app) does not pay for it.
+"""
+
+import os
+
+from model_loader import predict_sentiment_bulk
+
+# Column names recognised as the text column, in lowercase
+TEXT_COLUMNS = ['text', 'review', 'content', 'komentar', 'ulasan', 'comment']
+
+SENTIMENT_LABELS = ['Positif', 'Negatif', 'Netral']
+
+MIN_ROW_TEXT_LENGTH = 3
+
+# Rows read and scored per chunk in streaming mode
+STREAM_CHUNK_SIZE = int(os.environ.get('BATCH_STREAM_CHUNK_SIZE', '256'))
+
+
+def find_text_column(df):
+    """
+    Find the column holding the texts: a known name first, otherwise the first
+    string column. Returns None if there is none.
+    """
+    for col in df.columns:
+        if str(col).lower() in TEXT_COLUMNS:
+            return col
+
+    # If no matching column, take the first string column
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            return col
+
+    return None
+
+
+def score_frame(df, text_col, student_threshold=None, predict=None):
+    """
+    Score the text column of a DataFrame.
+    Empty and very short rows are skipped; the rest are predicted in
+    length-bucketed batches (confident texts by the student model first if a
+    student_threshold is given), or by ``predict`` (e.g. SavedRun.predict).
+
+    Returns:
+        DataFrame: text, sentiment, confidence, original_row (in row order).
+    """
+    texts = df[text_col].dropna().astype(str)
+    texts = texts[texts.str.len() >= MIN_ROW_TEXT_LENGTH]
+
+    if predict is not None:
+        predictions = predict(texts.tolist())
+    else:
+        predictions = predict_sentiment_bulk(texts.tolist(), student_threshold=student_threshold)
+
+    import pandas as pd
+    return pd.DataFrame({
+        'text': texts.to_numpy(),
+        'sentiment': [sentiment for sentiment, _ in predictions],
+        'confidence': [confidence for _, confidence in predictions],
+        'original_row': texts.index.to_numpy(),
+    })
+
+
+def sentiment_stats(scored):
+    """Count results per sentiment label."""
+    counts = scored['sentiment'].value_counts()
+    return {label: int(counts.get(label, 0)) for label in SENTIMENT_LABELS}
+
+
+def iter_file_chunks(file, filename, chunksize=STREAM_CHUNK_SIZE):
+    """
+    Yield DataFrame chunks of an uploaded file.
+    CSV files are read incrementally; Excel files cannot be, so they are read
+    once and sliced.
+    """
+    import pandas as pd
+
+    if filename.endswith('.csv'):
+        yield from pd.read_csv(file, chunksize=chunksize)
+    else:
+        df = pd.read_excel(file)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+def stream_scored_chunks(chunks, max_rows=0, student_threshold=None, run=None):
+    """
+    Score DataFrame chunks one at a time, yielding streaming events:
+    ('result', record) for every scored row, then a final ('stats', summary).
+    Only one chunk is held in memory at a time. With a SavedRun, stored
+    results are reused and every chunk is saved to history.
+    """
+    stats = dict.fromkeys(SENTIMENT_LABELS, 0)
+    total = 0
+    rows_read = 0
+    truncated = False
+    text_col = None
+
+    for chunk in chunks:
+        if text_col is None:
+            text_col = find_text_column(chunk)
+            if text_col is None:
+                yield 'error', {'message': 'Could not find a text column in the file'}
+                return
+
+        if max_rows and rows_read + len(chunk) > max_rows:
+            chunk = chunk.head(max_rows - rows_read)
+            truncated = True
+        rows_read += len(chunk)
+
+        scored = score_frame(chunk, text_col, student_threshold, run.predict if run else None)
+        if run is not None:
+            run.save(scored[['text', 'sentiment', 'confidence']].to_dict('records'))
+        for label, count in sentiment_stats(scored).items():
+            stats[label] += count
+        total += len(scored)
+
+        for record in scored.to_dict('records'):
+            yield 'result', record
+
+        if truncated:
+            break
+
+    summary = {
+        'stats': stats,
+        'total': total,
+        'rows_read': rows_read,
+        'truncated': truncated
+    }
+    if run is not None:
+        summary['saved_run'] = run.summary()
+    yield 'stats', summary
@@ -0,0 +1,163 @@
+"""
+Dynamic micro-batching for model inference.
+
+Callers submit single items to a queue; a background worker groups them into
+batches (up to ``max_batch_size`` items, or whatever arrived within
+``max_wait_ms`` of the first item) and runs one batched prediction for the
+whole group. Each caller receives only its own result.
+
+The batcher groups work, it does not serialize access to the model: bulk
+scoring, batch jobs and the readiness check call the model from their own
+threads. Whatever predict_fn calls must be safe to call concurrently (see
+LoadedModel.run_lock in model_loader).
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Groups concurrent single-item predictions into batched calls.
+
+    Args:
+        predict_fn (callable): Takes a list of items, returns a list of results
+            in the same order.
+        max_batch_size (int): Maximum number of items per batch.
+        max_wait_ms (float): Maximum time to wait for a batch to fill up.
+        name (str): Name of the worker thread (for logs).
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, name='micro-batcher'):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+
+        # Stats
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._batch_size_histogram = {}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the worker after the items already queued have been processed."""
+        self._stopped = True
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    def submit(self, item):
+        """
+        Queue an item for prediction.
+
+        Returns:
+            Future: Resolves to the result for this item.
+        """
+        if self._thread is None:
+            self.start()
+
+        future = Future()
+        self._queue.put((item, future))
+
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        return future
+
+    def predict(self, item, timeout=None):
+        """Submit an item and block until its result is available."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    entry = self._queue.get(timeout=remaining)
+                else:
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Shutdown marker: finish this batch, then let the loop exit
+                self._queue.put(None)
+                break
+            batch.append(entry)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                if self._stopped:
+                    break
+                continue
+
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            self._record_batch(len(batch))
+
+            try:
+                results = self.predict_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"predict_fn returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                logger.error(f"Batch prediction failed ({len(items)} items): {e}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def _record_batch(self, size):
+        with self._lock:
+            self._batches += 1
+            self._items += size
+            self._batch_size_histogram[size] = self._batch_size_histogram.get(size, 0) + 1
+
+    def stats(self):
+        """Return queue depth and batch-size statistics."""
+        with self._lock:
+            histogram = dict(sorted(self._batch_size_histogram.items()))
+            batches = self._batches
+            items = self._items
+
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self._max_queue_depth,
+            'batches': batches,
+            'items': items,
+            'avg_batch_size': (items / batches) if batches else 0.0,
+            'batch_size_histogram': histogram,
+        }
@@ -0,0 +1,162 @@
+"""
+Helpers for reading and writing analysis history: keyset pagination, bulk
+inserts, and the hooks that keep the derived per-user tables (term index,
+daily rollups) in step with the analyses table.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import event, func, tuple_
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Analysis, SavedRunStatus
+import rollups
+import term_index
+
+BULK_INSERT_CHUNK_SIZE = 1000
+MAX_PAGE_SIZE = 100
+
+
+def _as_row(analysis):
+    return {
+        'user_id': analysis.user_id,
+        'text': analysis.text,
+        'sentiment': analysis.sentiment,
+        'created_at': analysis.created_at
+    }
+
+
+def index_analyses(connection, rows, sign=1):
+    """
+    Update the derived tables for inserted (sign=1) or deleted (sign=-1) analyses,
+    in the same transaction as the write.
+    """
+    term_index.apply(connection, rows, sign)
+    rollups.apply(connection, rows, sign)
+
+
+@event.listens_for(Session, 'after_flush')
+def _index_flushed_analyses(session, flush_context):
+    """ORM writes (db.session.add / delete) of Analysis objects."""
+    added = [_as_row(obj) for obj in session.new if isinstance(obj, Analysis)]
+    deleted = [_as_row(obj) for obj in session.deleted if isinstance(obj, Analysis)]
+    if not added and not deleted:
+        return
+
+    connection = session.connection()
+    if added:
+        index_analyses(connection, added, 1)
+    if deleted:
+        index_analyses(connection, deleted, -1)
+
+
+def bulk_insert_analyses(rows, chunk_size=BULK_INSERT_CHUNK_SIZE, return_ids=False):
+    """
+    Insert Analysis rows with one executemany per chunk instead of one ORM
+    object per row. The caller commits.
+
+    Args:
+        rows (list): Dicts with user_id, text, sentiment, confidence
+            (created_at and correction are optional).
+        return_ids (bool): Return the new row ids, in the order of ``rows``.
+
+    Returns:
+        list: The row ids if return_ids, otherwise None.
+    """
+    if not rows:
+        return [] if return_ids else None
+
+    now = datetime.utcnow()
+    table = Analysis.__table__
+    stmt = table.insert()
+    if return_ids:
+        stmt = stmt.returning(table.c.id, sort_by_parameter_order=True)
+
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = [
+            {
+                'created_at': now, 'correction': None, 'corrected_at': None,
+                'source': None, 'text_hash': None, 'model_fingerprint': None,
+                **row
+            }
+            for row in rows[start:start + chunk_size]
+        ]
+        result = db.session.execute(stmt, chunk)
+        if return_ids:
+            ids.extend(result.scalars().all())
+        # Core inserts bypass the ORM flush hook
+        index_analyses(db.session.connection(), chunk, 1)
+    return ids if return_ids else None
+
+def encode_cursor(analysis):
+    """Opaque cursor pointing after ``analysis`` in newest-first order."""
+    raw = json.dumps([analysis.created_at.isoformat(), analysis.id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns: (created_at, id)
+    Raises: ValueError for a cursor that was not made by encode_cursor().
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, analysis_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(analysis_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def history_page(user_id, cursor=None, per_page=10, source=None):
+    """
+    One page of a user's analyses, newest first, by keyset on (created_at, id):
+    served from ix_analyses_user_created at the same cost however deep the page is.
+    With a source, only the rows of that saved run (ix_analyses_user_source).
+
+    Returns:
+        tuple: (list of Analysis, cursor of the next page or None)
+    """
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    query = Analysis.query.filter(Analysis.user_id == user_id)
+    if source:
+        query = query.filter(Analysis.source == source)
+    if cursor:
+        query = query.filter(tuple_(Analysis.created_at, Analysis.id) < decode_cursor(cursor))
+
+    # One extra row tells whether there is a next page, without a COUNT(*)
+    items = query.order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(per_page + 1).all()
+    if len(items) > per_page:
+        return items[:per_page], encode_cursor(items[per_page - 1])
+    return items, None
+
+
+def saved_sources(user_id):
+    """
+    Saved batch and scrape runs of a user, most recent first, with how the
+    latest run of each ended (see saved_runs.py; None for runs saved before
+    run states were recorded).
+    Returns: [{'source', 'count', 'last_saved_at', 'run'}, ...]
+    """
+    last_saved = func.max(Analysis.created_at)
+    rows = db.session.query(Analysis.source, func.count(Analysis.id), last_saved).filter(
+        Analysis.user_id == user_id,
+        Analysis.source.isnot(None)
+    ).group_by(Analysis.source).order_by(last_saved.desc()).all()
+    runs = {run.source: run.to_dict() for run in SavedRunStatus.query.filter_by(user_id=user_id)}
+    return [
+        {
+            'source': source, 'count': count, 'last_saved_at': last.isoformat() if last else None,
+            'run': runs.get(source)
+        }
+        for source, count, last in rows
+    ]
+
+
+def saved_run_status(user_id, source):
+    """How the latest run saved under ``source`` ended (dict), or None."""
+    run = db.session.get(SavedRunStatus, (user_id, source))
+    return run.to_dict() if run is not None else None
@@ -0,0 +1,152 @@
+"""
+Write-behind persistence of analysis history.
+
+With HISTORY_WRITE_BEHIND=1, /api/classify does not commit its Analysis row
+inside the request. Rows are queued and a background thread writes them with
+one bulk insert and one commit per batch, when HISTORY_FLUSH_SIZE rows are
+waiting or HISTORY_FLUSH_INTERVAL seconds after the oldest one arrived. The
+queue is flushed when the process exits.
+
+submit() returns a Future resolving to the new row id, for callers that need
+it right away (e.g. to send feedback on the analysis).
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from extensions import db
+from history import bulk_insert_analyses
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = int(os.environ.get('HISTORY_FLUSH_SIZE', '200'))
+FLUSH_INTERVAL = float(os.environ.get('HISTORY_FLUSH_INTERVAL', '0.2'))
+# Rows waiting before submit() blocks the request (backpressure)
+MAX_PENDING = int(os.environ.get('HISTORY_MAX_PENDING', '10000'))
+CLOSE_TIMEOUT = 10.0
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """Queue of Analysis rows written in batches by one background thread."""
+
+    def __init__(self, app, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.app = app
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        """
+        Queue one row (dict with user_id, text, sentiment, confidence).
+        Returns: Future of the new row id.
+        """
+        future = Future()
+        self._queue.put(({'created_at': datetime.utcnow(), **row}, future))
+        return future
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Write everything still queued and stop the thread."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put((_STOP, None))
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"History writer still busy after {timeout}s, {self._queue.qsize()} rows not written")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item[0] is _STOP:
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item[0] is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+            if stop:
+                # Rows queued behind the stop marker
+                self._drain()
+                return
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] is not _STOP:
+                batch.append(item)
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        rows = [row for row, _ in batch]
+        with self.app.app_context():
+            try:
+                with timed('db_commit'):
+                    ids = bulk_insert_analyses(rows, return_ids=True)
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.failed += len(rows)
+                logger.error(f"Failed to write {len(rows)} analyses to history: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            finally:
+                db.session.remove()
+
+        self.written += len(rows)
+        self.batches += 1
+        for (_, future), row_id in zip(batch, ids):
+            future.set_result(row_id)
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'failed': self.failed
+        }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(app):
+    """The process-wide writer, started on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = HistoryWriter(app)
+            atexit.register(_writer.close)
+    return _writer
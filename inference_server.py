@@ -0,0 +1,461 @@
+"""
+Multi-process inference server.
+
+The model is loaded once in the server process, then N worker processes are
+forked from it. The weights are shared copy-on-write instead of being copied
+into every web worker. Each worker pins its own torch thread count and
+micro-batches the requests it takes from a shared task queue.
+
+Web workers talk to the server over a local socket (multiprocessing.connection)
+through InferenceClient. Set SENTIMENT_INFERENCE_SERVER to the server address
+and model_loader uses the client in place of a local pipeline.
+
+The protocol unpickles what it receives, so connections are authenticated with
+a shared secret: SENTIMENT_INFERENCE_AUTHKEY, or else a random key the server
+writes to SENTIMENT_INFERENCE_AUTHKEY_FILE (owner-only permissions) for clients
+on the same machine to read. Listening on a non-loopback address requires
+SENTIMENT_INFERENCE_AUTHKEY.
+
+A 'reload' request (InferenceClient.reload, sent by model_loader when a model
+version is activated or rolled back) loads and warms the new weights in the
+server process, then forks a new generation of workers from it. The old
+workers finish the requests they have taken and exit. Every response reports
+the fingerprint and version of the model that produced it. A version activated
+in the registry by other means (CLI, training run) is picked up the same way.
+
+Usage:
+    python inference_server.py --workers 4 --address 127.0.0.1:6001
+"""
+
+import argparse
+import ipaddress
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = '127.0.0.1:6001'
+AUTHKEY_FILE = os.environ.get('SENTIMENT_INFERENCE_AUTHKEY_FILE', os.path.join('instance', 'inference.key'))
+REQUEST_TIMEOUT = float(os.environ.get('SENTIMENT_INFERENCE_TIMEOUT', '60'))
+# A reload loads and warms a model before answering
+RELOAD_TIMEOUT = float(os.environ.get('SENTIMENT_INFERENCE_RELOAD_TIMEOUT', '600'))
+
+# Texts per forward pass inside a worker
+WORKER_MAX_BATCH = int(os.environ.get('SENTIMENT_INFERENCE_MAX_BATCH', '32'))
+
+
+def parse_address(address):
+    """'host:port' -> (host, port); anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return (host or '127.0.0.1', int(port))
+    return address
+
+
+def _is_loopback(address):
+    if not isinstance(address, tuple):
+        # Unix socket: reachable from this machine only
+        return True
+    host = address[0]
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def load_authkey(create=False):
+    """
+    The shared secret of server and clients: SENTIMENT_INFERENCE_AUTHKEY, or the
+    contents of AUTHKEY_FILE. With create=True (server) a missing file is
+    created with a random key, readable by its owner only.
+    """
+    key = os.environ.get('SENTIMENT_INFERENCE_AUTHKEY')
+    if key:
+        return key.encode('utf-8')
+
+    try:
+        with open(AUTHKEY_FILE, 'rb') as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+
+    if not create:
+        raise RuntimeError(
+            f"No inference server key: set SENTIMENT_INFERENCE_AUTHKEY or start the server "
+            f"on this machine first (it writes {AUTHKEY_FILE})"
+        )
+
+    os.makedirs(os.path.dirname(AUTHKEY_FILE) or '.', exist_ok=True)
+    key = secrets.token_hex(32).encode('ascii')
+    try:
+        fd = os.open(AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Created concurrently (or left empty): read it again
+        return load_authkey(create=False)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    logger.info(f"Generated inference server key in {AUTHKEY_FILE}")
+    return key
+
+
+class InferenceClient:
+    """
+    Client for the inference server, called like the transformers pipeline
+    (list of texts in, list of {'label', 'score'} out).
+
+    Args:
+        address (str): 'host:port' or Unix socket path.
+        pool_size (int): Maximum open connections (concurrent requests).
+    """
+
+    def __init__(self, address, pool_size=8, timeout=REQUEST_TIMEOUT):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._authkey = load_authkey()
+        self.fingerprint = None
+        self.version = None
+        self.info = self._request(('info',))
+        self.fingerprint = self.info['fingerprint']
+        self.version = self.info['version']
+
+    def _request(self, message, timeout=None):
+        timeout = timeout or self.timeout
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = Client(self.address, authkey=self._authkey)
+
+            try:
+                conn.send(message)
+                if not conn.poll(timeout):
+                    raise TimeoutError(f"Inference server did not answer within {timeout}s")
+                status, payload = conn.recv()
+            except Exception:
+                conn.close()
+                raise
+
+            self._pool.put(conn)
+        finally:
+            self._slots.release()
+
+        if status != 'ok':
+            raise RuntimeError(f"Inference server error: {payload}")
+        return payload
+
+    def predict(self, texts, max_length=512):
+        """
+        Returns: (outputs, fingerprint of the model that computed them), the
+        fingerprint taken from this reply rather than the shared attribute
+        """
+        result = self._request(('predict', list(texts), max_length))
+        self.fingerprint, self.version = result['fingerprint'], result['version']
+        return result['outputs'], result['fingerprint']
+
+    def __call__(self, texts, truncation=True, max_length=512, batch_size=None):
+        if isinstance(texts, str):
+            texts = [texts]
+        return self.predict(texts, max_length)[0]
+
+    def reload(self, version=None):
+        """
+        Make the server serve a registry version (None: the active one).
+        Returns: {'fingerprint', 'version'} of the model now served.
+        """
+        result = self._request(('reload', version), timeout=RELOAD_TIMEOUT)
+        self.fingerprint, self.version = result['fingerprint'], result['version']
+        return result
+
+
+def _worker_loop(worker_index, task_queue, result_queue, num_threads):
+    """Worker process: forked after the model is loaded, so it shares the weights."""
+    import torch
+    import model_loader
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    torch.set_num_threads(num_threads)
+    model = model_loader._current
+    pipeline = model.classifier
+    served = {'fingerprint': model.fingerprint, 'version': model.version}
+
+    if model.backend == 'onnx':
+        # ONNX Runtime sessions do not survive fork(): open one per worker
+        from onnx_backend import OnnxSentimentClassifier
+        pipeline = OnnxSentimentClassifier(
+            pipeline.onnx_path, pipeline.tokenizer, pipeline.id2label, num_threads=num_threads
+        )
+    logger.info(
+        f"Inference worker {worker_index} (pid {os.getpid()}) ready, {num_threads} threads, "
+        f"model {model.fingerprint}"
+    )
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        # Micro-batch: take whatever else is already waiting, up to WORKER_MAX_BATCH texts
+        tasks = [task]
+        size = len(task[1])
+        while size < WORKER_MAX_BATCH:
+            try:
+                extra = task_queue.get_nowait()
+            except queue.Empty:
+                break
+            if extra is None:
+                task_queue.put(None)
+                break
+            tasks.append(extra)
+            size += len(extra[1])
+
+        # One forward pass per max_length: each text is truncated as its caller asked
+        groups = {}
+        for task in tasks:
+            groups.setdefault(task[2], []).append(task)
+        for max_length, group in groups.items():
+            texts = [text for _, batch, _ in group for text in batch]
+            try:
+                with torch.inference_mode():
+                    outputs = pipeline(texts, truncation=True, max_length=max_length, batch_size=len(texts))
+            except Exception as e:
+                for request_id, _, _ in group:
+                    result_queue.put((request_id, 'error', str(e)))
+                continue
+
+            start = 0
+            for request_id, batch, _ in group:
+                result_queue.put((request_id, 'ok', {**served, 'outputs': outputs[start:start + len(batch)]}))
+                start += len(batch)
+
+
+class InferenceServer:
+    """
+    Args:
+        address (str): Listen address, 'host:port' or Unix socket path.
+        workers (int): Number of worker processes.
+        threads_per_worker (int): torch intra-op threads per worker.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, workers=2, threads_per_worker=None):
+        self.address = parse_address(address)
+        self.num_workers = max(1, int(workers))
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.num_workers)
+
+        self._ctx = multiprocessing.get_context('fork')
+        # One task queue per worker generation; replaced on reload
+        self._task_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._workers = []
+        self._workers_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._pending = {}  # request_id -> [Event, status, payload]
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._running = True
+
+    def _start_worker(self, index):
+        # Caller holds _workers_lock (or no other thread runs yet)
+        process = self._ctx.Process(
+            target=_worker_loop,
+            args=(index, self._task_queue, self._result_queue, self.threads_per_worker),
+            name=f'inference-worker-{index}',
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def _dispatch_results(self):
+        while self._running:
+            try:
+                request_id, status, payload = self._result_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._pending_lock:
+                slot = self._pending.pop(request_id, None)
+            if slot is not None:
+                slot[1], slot[2] = status, payload
+                slot[0].set()
+
+    def _monitor_workers(self):
+        while self._running:
+            with self._workers_lock:
+                for index, process in enumerate(self._workers):
+                    if not process.is_alive() and self._running:
+                        logger.error(f"Inference worker {index} died (exit code {process.exitcode}), restarting")
+                        self._workers[index] = self._start_worker(index)
+            time.sleep(1)
+
+    def _predict(self, texts, max_length):
+        request_id = next(self._ids)
+        slot = [threading.Event(), None, None]
+        with self._pending_lock:
+            self._pending[request_id] = slot
+
+        # Under the lock: a task never lands behind the stop markers of a replaced generation
+        with self._workers_lock:
+            self._task_queue.put((request_id, texts, max_length))
+        if not slot[0].wait(REQUEST_TIMEOUT):
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            return 'error', 'timeout'
+        return slot[1], slot[2]
+
+    def _reload(self, version=None):
+        """
+        Load and warm ``version`` (None: the active registry version) in this
+        process, then replace the workers with ones forked from it.
+        """
+        import model_loader
+
+        with self._reload_lock:
+            model = model_loader.reload_model(version)
+            with self._workers_lock:
+                old_queue, old_workers = self._task_queue, self._workers
+                self._task_queue = self._ctx.Queue()
+                self._workers = [self._start_worker(i) for i in range(self.num_workers)]
+                # Old workers finish the tasks queued before these markers, then exit
+                for _ in old_workers:
+                    old_queue.put(None)
+            logger.info(f"Inference server now serving model {model.fingerprint} (version {model.version})")
+        threading.Thread(target=self._join_workers, args=(old_workers,), daemon=True).start()
+        return {'fingerprint': model.fingerprint, 'version': model.version}
+
+    @staticmethod
+    def _join_workers(workers):
+        for process in workers:
+            process.join(timeout=REQUEST_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+
+    def _follow_registry(self):
+        """Reload when another process moves the registry's active version."""
+        import model_loader
+        import model_registry
+
+        signature = model_registry.state_signature()
+        while self._running:
+            time.sleep(model_loader.REGISTRY_POLL_INTERVAL)
+            current = model_registry.state_signature()
+            if current == signature:
+                continue
+            # Also on failure: a broken version is not retried until the registry changes again
+            signature = current
+            active = model_registry.read_state().get('active')
+            if active and active != model_loader._current.version:
+                logger.info(f"Model registry switched to version {active}, reloading")
+                try:
+                    self._reload(active)
+                except Exception as e:
+                    logger.error(f"Could not switch to model version {active}: {e}")
+
+    def _handle_connection(self, conn):
+        import model_loader
+
+        try:
+            while True:
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    break
+
+                if message[0] == 'info':
+                    model = model_loader._current
+                    conn.send(('ok', {
+                        'fingerprint': model.fingerprint,
+                        'version': model.version,
+                        'workers': self.num_workers,
+                        'threads_per_worker': self.threads_per_worker
+                    }))
+                elif message[0] == 'predict':
+                    _, texts, max_length = message
+                    conn.send(self._predict(texts, max_length))
+                elif message[0] == 'reload':
+                    try:
+                        conn.send(('ok', self._reload(message[1])))
+                    except Exception as e:
+                        logger.error(f"Reload failed, still serving the previous model: {e}")
+                        conn.send(('error', f'Reload failed: {e}'))
+                else:
+                    conn.send(('error', f'Unknown command: {message[0]}'))
+        except Exception as e:
+            logger.warning(f"Inference connection closed: {e}")
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        import model_loader
+
+        if not _is_loopback(self.address) and not os.environ.get('SENTIMENT_INFERENCE_AUTHKEY'):
+            raise RuntimeError(
+                f"Refusing to listen on {self.address} without SENTIMENT_INFERENCE_AUTHKEY: "
+                f"anyone reaching the port could run code on the server"
+            )
+        authkey = load_authkey(create=True)
+
+        # Load weights in this process only; never connect to ourselves
+        model_loader.INFERENCE_SERVER = None
+        model_loader.load_model()
+
+        # Fork after load: workers share the weights copy-on-write
+        self._workers = [self._start_worker(i) for i in range(self.num_workers)]
+        threading.Thread(target=self._dispatch_results, daemon=True).start()
+        threading.Thread(target=self._monitor_workers, daemon=True).start()
+        if model_loader.REGISTRY_POLL_INTERVAL:
+            threading.Thread(target=self._follow_registry, daemon=True).start()
+
+        listener = Listener(self.address, authkey=authkey)
+        logger.info(
+            f"Inference server listening on {self.address} with {self.num_workers} workers "
+            f"x {self.threads_per_worker} threads (model {model_loader.get_model_fingerprint()})"
+        )
+
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning(f"Rejected inference connection: {e}")
+                    continue
+                threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+        except KeyboardInterrupt:
+            logger.info("Shutting down inference server...")
+        finally:
+            self._running = False
+            with self._workers_lock:
+                workers = self._workers
+                for _ in workers:
+                    self._task_queue.put(None)
+            for process in workers:
+                process.join(timeout=5)
+            listener.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Multi-process sentiment inference server")
+    parser.add_argument('--address', default=os.environ.get('SENTIMENT_INFERENCE_SERVER', DEFAULT_ADDRESS))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SENTIMENT_INFERENCE_WORKERS', '2')))
+    parser.add_argument('--threads-per-worker', type=int, default=None)
+    args = parser.parse_args()
+
+    InferenceServer(args.address, args.workers, args.threads_per_worker).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
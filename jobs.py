@@ -0,0 +1,390 @@
+"""
+Asynchronous batch scoring jobs.
+
+    POST /api/jobs                  Submit a CSV/Excel file, returns the job id
+    GET  /api/jobs                  List the current user's jobs
+    GET  /api/jobs/<id>             Poll status and progress
+    GET  /api/jobs/<id>/events      Subscribe to progress (Server-Sent Events)
+    POST /api/jobs/<id>/cancel      Cancel a queued or running job
+    GET  /api/jobs/<id>/download    Scored output (?format=csv|parquet)
+
+Jobs run in a worker pool outside the request threads. Their state lives in
+the batch_jobs table, so any app worker can report on or cancel any job. The
+pool itself lives in the app worker that accepted the upload: a job still
+queued when that process exits is never started, and is failed once its
+worker is found gone or after BATCH_JOB_QUEUED_STALE_SECONDS.
+
+Jobs submitted while logged in are private to their owner. Anonymous jobs can
+be read, downloaded and cancelled by anyone who has the job id (a random
+128-bit value returned only to the submitter).
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import Blueprint, request, jsonify, current_app, send_file
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, jwt_required
+
+from extensions import db
+from models import BatchJob
+from batch_scoring import SENTIMENT_LABELS, find_text_column, iter_file_chunks, score_frame, sentiment_stats
+from saved_runs import SavedRun, file_source, mark_partial
+from streaming import stream_events
+from student_model import cascade_threshold
+
+logger = logging.getLogger(__name__)
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+JOB_DIR = os.environ.get('BATCH_JOB_DIR', os.path.join('uploads', 'jobs'))
+JOB_WORKERS = int(os.environ.get('BATCH_JOB_WORKERS', '2'))
+JOB_CHUNK_SIZE = int(os.environ.get('BATCH_JOB_CHUNK_SIZE', '1000'))
+# Running jobs without a heartbeat for this long are considered dead
+JOB_STALE_SECONDS = int(os.environ.get('BATCH_JOB_STALE_SECONDS', '600'))
+# Queued jobs not started after this long are considered lost
+JOB_QUEUED_STALE_SECONDS = int(os.environ.get('BATCH_JOB_QUEUED_STALE_SECONDS', '3600'))
+EVENTS_POLL_INTERVAL = 1.0
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='batch-job')
+    return _executor
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _current_user_id():
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        return None
+    return int(identity) if identity is not None else None
+
+
+def _estimate_rows(path, filename):
+    """Data rows of a CSV file by counting lines (quoted newlines make it an estimate)."""
+    if not filename.endswith('.csv'):
+        return None
+
+    lines = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+    return max(lines - 1, 0)
+
+
+def run_job(app, job_id):
+    """Worker entry point: score a job's file chunk by chunk."""
+    with app.app_context():
+        try:
+            _run_job(job_id)
+        finally:
+            db.session.remove()
+
+
+def _run_job(job_id):
+    now = datetime.utcnow()
+
+    # Claim the job; no-op if it was cancelled or taken while queued
+    claimed = BatchJob.query.filter_by(id=job_id, status='queued').update({
+        'status': 'running',
+        'started_at': now,
+        'heartbeat_at': now,
+        'worker': _worker_id()
+    })
+    db.session.commit()
+    if not claimed:
+        return
+
+    job = BatchJob.query.get(job_id)
+    logger.info(f"Batch job {job_id} started ({job.filename})")
+
+    stats = dict.fromkeys(SENTIMENT_LABELS, 0)
+    text_col = None
+    write_header = True
+    run = None
+    if job.save_to_history and job.user_id is not None:
+        run = SavedRun(job.user_id, file_source(job.filename), cascade_threshold('jobs'))
+
+    try:
+        with open(job.input_path, 'rb') as f:
+            for chunk in iter_file_chunks(f, job.filename, JOB_CHUNK_SIZE):
+                # The cancel flag may have been set by any app worker
+                if db.session.query(BatchJob.cancel_requested).filter_by(id=job_id).scalar():
+                    job.status = 'cancelled'
+                    break
+
+                if text_col is None:
+                    text_col = find_text_column(chunk)
+                    if text_col is None:
+                        raise ValueError('Could not find a text column in the file')
+
+                scored = score_frame(chunk, text_col, cascade_threshold('jobs'), run.predict if run else None)
+                scored.to_csv(job.output_path, mode='w' if write_header else 'a', header=write_header, index=False)
+                write_header = False
+
+                if run is not None:
+                    run.save(scored[['text', 'sentiment', 'confidence']].to_dict('records'))
+
+                for label, count in sentiment_stats(scored).items():
+                    stats[label] += count
+
+                job.processed_rows += len(chunk)
+                job.scored_rows += len(scored)
+                job.stats = json.dumps(stats)
+                job.heartbeat_at = datetime.utcnow()
+                db.session.commit()
+            else:
+                job.status = 'completed'
+
+        if write_header:
+            # Nothing scored: still produce a valid (empty) output file
+            with open(job.output_path, 'w', encoding='utf-8') as out:
+                out.write('text,sentiment,confidence,original_row\n')
+
+    except Exception as e:
+        logger.error(f"Batch job {job_id} failed: {e}")
+        db.session.rollback()
+        job = BatchJob.query.get(job_id)
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = datetime.utcnow()
+    if job.status == 'completed':
+        job.total_rows = job.processed_rows
+    db.session.commit()
+    if run is not None:
+        # Rows saved before a failure or cancellation stay, marked partial
+        run.finish(None if job.status == 'completed' else job.error or f'Job {job.status}')
+    logger.info(f"Batch job {job_id} {job.status}: {job.scored_rows} rows scored")
+
+
+def _worker_gone(worker):
+    """True if ``worker`` (host:pid) is a process of this host that has exited."""
+    host, _, pid = (worker or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit() or os.name == 'nt':
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+def _mark_if_stale(job):
+    """
+    Fail a running job whose worker stopped sending heartbeats, and a queued
+    job whose worker exited (or that waited too long) before starting it.
+    """
+    now = datetime.utcnow()
+    if job.status == 'running' and job.heartbeat_at is not None:
+        if now - job.heartbeat_at <= timedelta(seconds=JOB_STALE_SECONDS):
+            return
+        error = f'Worker {job.worker} stopped responding'
+    elif job.status == 'queued' and job.created_at is not None:
+        if not _worker_gone(job.worker) and now - job.created_at <= timedelta(seconds=JOB_QUEUED_STALE_SECONDS):
+            return
+        error = f'Worker {job.worker} exited before starting the job, please submit it again'
+    else:
+        return
+
+    # Conditional: the job may have been claimed or finished meanwhile
+    failed = BatchJob.query.filter_by(id=job.id, status=job.status).update({
+        'status': 'failed',
+        'error': error,
+        'finished_at': now
+    })
+    if failed and job.status == 'running' and job.save_to_history and job.user_id is not None:
+        mark_partial(job.user_id, file_source(job.filename), error)
+    db.session.commit()
+    db.session.refresh(job)
+
+
+def _get_job_or_error(job_id):
+    """
+    Returns: (job, None) or (None, error_response)
+    """
+    job = BatchJob.query.get(job_id)
+    if not job:
+        return None, (jsonify({'status': 'error', 'message': 'Job not found'}), 404)
+
+    # Jobs submitted while logged in are private to their owner
+    if job.user_id is not None and job.user_id != _current_user_id():
+        return None, (jsonify({'status': 'error', 'message': 'Unauthorized'}), 403)
+
+    _mark_if_stale(job)
+    return job, None
+
+
+@jobs_bp.route('', methods=['POST'])
+def submit_job():
+    """
+    Submit a CSV/Excel file for background scoring.
+    Form fields: file, save_to_history (optional, requires login)
+    """
+    try:
+        if 'file' not in request.files:
+            return jsonify({'status': 'error', 'message': 'No file part'}), 400
+
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'status': 'error', 'message': 'No selected file'}), 400
+
+        if not (file.filename.endswith('.csv') or file.filename.endswith('.xlsx')):
+            return jsonify({'status': 'error', 'message': 'File must be CSV or Excel'}), 400
+
+        user_id = _current_user_id()
+        save_to_history = request.form.get('save_to_history', 'false').lower() in ('1', 'true', 'yes')
+        if save_to_history and user_id is None:
+            return jsonify({'status': 'error', 'message': 'Login required to save results to history'}), 401
+
+        job_id = uuid.uuid4().hex
+        os.makedirs(JOB_DIR, exist_ok=True)
+        extension = os.path.splitext(file.filename)[1]
+        input_path = os.path.join(JOB_DIR, f"{job_id}-input{extension}")
+        file.save(input_path)
+
+        job = BatchJob(
+            id=job_id,
+            user_id=user_id,
+            filename=file.filename,
+            input_path=input_path,
+            output_path=os.path.join(JOB_DIR, f"{job_id}-output.csv"),
+            save_to_history=save_to_history,
+            total_rows=_estimate_rows(input_path, file.filename),
+            # The process whose pool will run it
+            worker=_worker_id()
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        _get_executor().submit(run_job, current_app._get_current_object(), job_id)
+        logger.info(f"Batch job {job_id} queued ({file.filename})")
+
+        return jsonify({'status': 'success', 'job': job.to_dict()}), 202
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Job submit error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@jobs_bp.route('', methods=['GET'])
+@jwt_required()
+def list_jobs():
+    user_id = _current_user_id()
+    jobs = BatchJob.query.filter_by(user_id=user_id)\
+        .order_by(BatchJob.created_at.desc())\
+        .limit(50).all()
+    return jsonify({'status': 'success', 'jobs': [job.to_dict() for job in jobs]}), 200
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job, error = _get_job_or_error(job_id)
+    if error:
+        return error
+    return jsonify({'status': 'success', 'job': job.to_dict()}), 200
+
+
+@jobs_bp.route('/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-Sent Events: a 'progress' event whenever the job changes,
+    then a final 'done' event.
+    """
+    job, error = _get_job_or_error(job_id)
+    if error:
+        return error
+
+    def events():
+        last = None
+        while True:
+            job = BatchJob.query.get(job_id)
+            _mark_if_stale(job)
+            data = job.to_dict()
+            # End the read transaction before sleeping
+            db.session.rollback()
+
+            if data != last:
+                yield 'progress', data
+                last = data
+            if data['status'] in TERMINAL_STATUSES:
+                yield 'done', data
+                return
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    return stream_events(events(), 'sse')
+
+
+@jobs_bp.route('/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job, error = _get_job_or_error(job_id)
+    if error:
+        return error
+
+    if job.status in TERMINAL_STATUSES:
+        return jsonify({'status': 'error', 'message': f'Job already {job.status}'}), 409
+
+    job.cancel_requested = True
+    if job.status == 'queued':
+        job.status = 'cancelled'
+        job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+    return jsonify({'status': 'success', 'job': job.to_dict()}), 200
+
+
+@jobs_bp.route('/<job_id>/download', methods=['GET'])
+def download_job(job_id):
+    """
+    Download the scored rows as CSV (default) or Parquet (?format=parquet).
+    """
+    job, error = _get_job_or_error(job_id)
+    if error:
+        return error
+
+    if job.status != 'completed':
+        return jsonify({'status': 'error', 'message': f'Job is {job.status}'}), 409
+
+    fmt = request.args.get('format', 'csv').lower()
+    name = os.path.splitext(job.filename)[0]
+
+    if fmt == 'csv':
+        return send_file(os.path.abspath(job.output_path), mimetype='text/csv',
+                         as_attachment=True, download_name=f"{name}-scored.csv")
+
+    if fmt == 'parquet':
+        parquet_path = os.path.splitext(job.output_path)[0] + '.parquet'
+        if not os.path.exists(parquet_path):
+            try:
+                import pandas as pd
+                tmp_path = f"{parquet_path}.tmp-{os.getpid()}"
+                pd.read_csv(job.output_path).to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, parquet_path)
+            except ImportError:
+                return jsonify({'status': 'error', 'message': 'Parquet export requires pyarrow'}), 400
+        return send_file(os.path.abspath(parquet_path), mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f"{name}-scored.parquet")
+
+    return jsonify({'status': 'error', 'message': 'Format must be csv or parquet'}), 400
@@ -0,0 +1,261 @@
+"""
+Aspect lexicons for aspect-based sentiment analysis.
+
+Each domain (restaurant, hotel, app, ecommerce, ...) is a JSON file in
+LEXICON_DIR mapping aspect names to keywords. The keywords of a domain are
+compiled once into a single trie-shaped alternation regex with word
+boundaries, so matching a segment costs O(len(segment)) no matter how many
+keywords the lexicon has.
+
+Lexicons are reloaded atomically: a new set is fully parsed and compiled
+before it replaces the current one, and a broken file never takes down the
+lexicons already in use.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LEXICON_DIR = os.environ.get(
+    'SENTIMENT_LEXICON_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicons')
+)
+DEFAULT_DOMAIN = os.environ.get('SENTIMENT_DEFAULT_DOMAIN', 'restaurant')
+
+# How often (seconds) to check LEXICON_DIR for changed files. 0 disables.
+AUTO_RELOAD_INTERVAL = float(os.environ.get('SENTIMENT_LEXICON_RELOAD_INTERVAL', '5'))
+
+# Common Indonesian suffixes allowed after a keyword ("harga" -> "harganya")
+DEFAULT_SUFFIXES = ['nya', 'an', 'annya', 'kan', 'lah', 'pun']
+
+# Split text into segments by punctuation and common conjunctions
+SEGMENT_SPLIT_PATTERN = re.compile(
+    r'[,.]|\b(?:tapi|namun|sedangkan|dan|serta|walaupun|meskipun)\b'
+)
+
+MIN_SEGMENT_LENGTH = 3
+
+
+def _trie_regex(words):
+    """
+    Build a regex alternation shaped like a trie of ``words``.
+
+    Shared prefixes are factored out ("harga|hargai" -> "harga(?:i)?"), so the
+    regex engine walks at most one keyword's length from each start position.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        if '' in node and len(node) == 1:
+            return None
+
+        alternatives = []
+        single_chars = []
+        for char in sorted(k for k in node if k):
+            sub = build(node[char])
+            if sub is None:
+                single_chars.append(re.escape(char))
+            else:
+                alternatives.append(re.escape(char) + sub)
+
+        if single_chars:
+            if len(single_chars) == 1:
+                alternatives.append(single_chars[0])
+            else:
+                alternatives.append('[' + ''.join(single_chars) + ']')
+
+        if len(alternatives) == 1:
+            result = alternatives[0]
+        else:
+            result = '(?:' + '|'.join(alternatives) + ')'
+
+        if '' in node:
+            # A keyword ends here: everything after this point is optional
+            result = '(?:' + result + ')?'
+        return result
+
+    return build(trie) or ''
+
+
+class AspectLexicon:
+    """
+    Compiled keyword matcher for one domain.
+
+    Args:
+        domain (str): Domain name, e.g. 'restaurant'.
+        aspects (dict): Ordered mapping of aspect name -> list of keywords.
+            When a segment mentions several aspects, the one listed first wins.
+        suffixes (list, optional): Suffixes allowed after a keyword.
+    """
+
+    def __init__(self, domain, aspects, suffixes=None):
+        self.domain = domain
+        self.aspects = list(aspects.keys())
+
+        # keyword -> (priority, aspect); first aspect listing a keyword keeps it
+        self._keywords = {}
+        for priority, (aspect, keywords) in enumerate(aspects.items()):
+            for keyword in keywords:
+                keyword = ' '.join(str(keyword).lower().split())
+                if keyword and keyword not in self._keywords:
+                    self._keywords[keyword] = (priority, aspect)
+
+        if not self._keywords:
+            raise ValueError(f"Lexicon '{domain}' has no keywords")
+
+        if suffixes is None:
+            suffixes = DEFAULT_SUFFIXES
+        suffix_pattern = _trie_regex(suffixes) if suffixes else ''
+
+        self._pattern = re.compile(
+            r'\b(' + _trie_regex(self._keywords) + r')'
+            + (r'(?:' + suffix_pattern + r')?' if suffix_pattern else '')
+            + r'\b'
+        )
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a lexicon from a JSON file; the domain defaults to the file name."""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        domain = data.get('domain') or os.path.splitext(os.path.basename(path))[0]
+        aspects = data.get('aspects')
+        if not isinstance(aspects, dict) or not aspects:
+            raise ValueError(f"{path}: 'aspects' must be a non-empty object")
+
+        return cls(domain, aspects, suffixes=data.get('suffixes'))
+
+    @property
+    def keyword_count(self):
+        return len(self._keywords)
+
+    def match_aspect(self, segment):
+        """
+        Return the aspect mentioned in a (lowercase) segment, or None.
+        """
+        best = None
+        for match in self._pattern.finditer(segment):
+            priority, aspect = self._keywords[match.group(1)]
+            if best is None or priority < best[0]:
+                best = (priority, aspect)
+                if priority == 0:
+                    break
+        return best[1] if best else None
+
+    def extract_segments(self, text):
+        """
+        Split text into segments and tag the ones that mention an aspect
+        Returns: List of (aspect, segment)
+        """
+        matches = []
+        for segment in SEGMENT_SPLIT_PATTERN.split(text.lower()):
+            segment = segment.strip()
+            if len(segment) < MIN_SEGMENT_LENGTH:
+                continue
+
+            aspect = self.match_aspect(segment)
+            if aspect:
+                matches.append((aspect, segment))
+        return matches
+
+    def to_dict(self):
+        return {
+            'domain': self.domain,
+            'aspects': self.aspects,
+            'keywords': self.keyword_count
+        }
+
+
+_lexicons = {}
+_signature = None
+_last_check = 0.0
+_reload_lock = threading.Lock()
+
+
+def _directory_signature(directory):
+    entries = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            stat = os.stat(os.path.join(directory, name))
+            entries.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+
+def reload_lexicons(directory=None):
+    """
+    Load every lexicon file from the directory and swap them in atomically.
+    If any file fails to load, the current lexicons are kept and the error is raised.
+
+    Returns:
+        list: Loaded domain names.
+    """
+    global _lexicons, _signature, _last_check
+    directory = directory or LEXICON_DIR
+
+    with _reload_lock:
+        signature = _directory_signature(directory)
+        loaded = {}
+        for name, _, _ in signature:
+            lexicon = AspectLexicon.from_file(os.path.join(directory, name))
+            loaded[lexicon.domain] = lexicon
+
+        if not loaded:
+            raise ValueError(f"No lexicon files found in {directory}")
+
+        # Single assignment: readers see either the old or the new set
+        _lexicons = loaded
+        _signature = signature
+        _last_check = time.monotonic()
+
+    logger.info(f"Loaded aspect lexicons: {', '.join(sorted(loaded))}")
+    return sorted(loaded)
+
+
+def _maybe_reload():
+    global _last_check
+    if AUTO_RELOAD_INTERVAL <= 0 or time.monotonic() - _last_check < AUTO_RELOAD_INTERVAL:
+        return
+
+    _last_check = time.monotonic()
+    try:
+        if _directory_signature(LEXICON_DIR) != _signature:
+            logger.info("Lexicon files changed, reloading...")
+            reload_lexicons()
+    except Exception as e:
+        logger.error(f"Failed to reload lexicons, keeping current set: {e}")
+
+
+def get_lexicon(domain=None):
+    """
+    Get the compiled lexicon for a domain (default: DEFAULT_DOMAIN).
+    Raises ValueError for unknown domains.
+    """
+    if not _lexicons:
+        reload_lexicons()
+    else:
+        _maybe_reload()
+
+    lexicons = _lexicons
+    domain = domain or DEFAULT_DOMAIN
+    if domain not in lexicons:
+        raise ValueError(f"Unknown aspect domain: {domain}")
+    return lexicons[domain]
+
+
+def list_lexicons():
+    if not _lexicons:
+        reload_lexicons()
+    else:
+        _maybe_reload()
+    return [lexicon.to_dict() for _, lexicon in sorted(_lexicons.items())]
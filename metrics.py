@@ -0,0 +1,479 @@
+"""
+Request, stage and model metrics with Prometheus text exposition.
+
+Counters and histograms are kept in memory by each process; recording one is
+a dict lookup, a bisect and two additions under a per-metric lock. Every
+process writes a snapshot of its metrics to METRICS_DIR every
+METRICS_FLUSH_INTERVAL seconds and at exit, and /metrics merges all snapshots,
+so every worker answers a scrape with the same totals. Counters and
+histograms of exited workers keep counting towards the totals (like the
+Prometheus client's multiprocess mode): their snapshots are folded into a
+single retired-*.json file, so METRICS_DIR does not grow with every worker
+restart. Gauges are only reported for live processes. Empty METRICS_DIR when
+deploying (python metrics.py reset).
+
+Stages in sentiment_stage_seconds:
+    json_parse, jwt_verify     request handling of /api/classify
+    aspect_segmentation        lexicon segmentation of a text
+    tokenize                   tokenizer calls (length bucketing, model input encoding)
+    forward                    model forward passes, without tokenization (with the
+                               inference server: the whole round trip)
+    db_commit                  history writes
+
+Cache hit ratios are exposed as hit/miss counters per cache, which (unlike
+ratios) add up correctly across workers.
+
+Usage:
+    python metrics.py show
+    python metrics.py reset
+"""
+
+import argparse
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get('SENTIMENT_METRICS', '1') == '1'
+METRICS_DIR = os.environ.get('SENTIMENT_METRICS_DIR', os.path.join('instance', 'metrics'))
+METRICS_FLUSH_INTERVAL = float(os.environ.get('SENTIMENT_METRICS_FLUSH_INTERVAL', '5'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOAD_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+_registry = {}
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def snapshot(self):
+        return {
+            'type': self.kind,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'samples': self._samples()
+        }
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, the last one is +Inf; then the sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    def snapshot(self):
+        return {**super().snapshot(), 'buckets': list(self.buckets)}
+
+
+STAGE_SECONDS = Histogram('sentiment_stage_seconds', 'Time spent in each processing stage', ['stage'])
+HTTP_REQUESTS = Counter(
+    'sentiment_http_requests_total', 'HTTP requests by endpoint, method and status', ['endpoint', 'method', 'status']
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'sentiment_http_request_seconds', 'Time until the response is built (streams keep running after)', ['endpoint']
+)
+MODEL_LOAD_SECONDS = Histogram(
+    'sentiment_model_load_seconds', 'Model load, warm-up and full reload durations', ['phase'], LOAD_BUCKETS
+)
+BATCH_SIZE = Histogram('sentiment_batch_size', 'Texts per model forward pass', (), SIZE_BUCKETS)
+CACHE_LOOKUPS = Counter(
+    'sentiment_cache_lookups_total', 'Prediction lookups per cache (memory, store, student) and result', ['cache', 'result']
+)
+PROCESS_RSS = Gauge('sentiment_process_resident_memory_bytes', 'Resident memory of each worker process', ['pid'])
+
+
+def timed(stage):
+    """Context manager timing one stage into sentiment_stage_seconds."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return None
+        # Peak rather than current RSS, in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Snapshot files
+
+_process_started = time.time()
+_flusher = None
+_flusher_lock = threading.Lock()
+_dir_warning_logged = False
+
+
+def _snapshot_path():
+    return os.path.join(METRICS_DIR, f"{os.getpid()}-{int(_process_started * 1000)}.json")
+
+
+def _snapshot():
+    PROCESS_RSS.reset()
+    rss = _rss_bytes()
+    if rss is not None:
+        PROCESS_RSS.set(rss, pid=os.getpid())
+    return {
+        'pid': os.getpid(),
+        'written_at': time.time(),
+        'metrics': {name: metric.snapshot() for name, metric in _registry.items()}
+    }
+
+
+def write_snapshot():
+    """Write this process's metrics to its snapshot file. Returns the snapshot."""
+    global _dir_warning_logged
+    snapshot = _snapshot()
+    path = _snapshot_path()
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        if not _dir_warning_logged:
+            logger.warning(f"Cannot write metrics snapshots to {METRICS_DIR}, /metrics covers this process only: {e}")
+            _dir_warning_logged = True
+    return snapshot
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except Exception as e:
+            logger.warning(f"Metrics snapshot failed: {e}")
+
+
+def start():
+    """Start writing periodic snapshots (idempotent)."""
+    global _flusher
+    if not METRICS_ENABLED:
+        return
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+            _flusher.start()
+
+
+def _after_fork():
+    # A forked worker starts from zero, not from a copy of its parent's counts
+    global _process_started, _flusher, _flusher_lock
+    restart = _flusher is not None
+    _process_started = time.time()
+    _flusher = None
+    _flusher_lock = threading.Lock()
+    for metric in _registry.values():
+        metric._lock = threading.Lock()
+        metric._values.clear()
+    # Threads do not survive a fork (e.g. gunicorn --preload)
+    if restart:
+        start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+atexit.register(lambda: METRICS_ENABLED and write_snapshot())
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        # os.kill() terminates the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _retire(paths):
+    """
+    Fold the snapshots of exited processes (and earlier retired files) into one
+    retired file. Each file is claimed by renaming it first, so concurrent
+    collectors never fold the same snapshot twice.
+    Returns: The retired snapshot, or None if nothing was claimed.
+    """
+    snapshots = []
+    claimed = []
+    for path in paths:
+        claim = f"{path}.{os.getpid()}.retiring"
+        try:
+            os.rename(path, claim)
+        except OSError:
+            continue  # claimed by another process
+        claimed.append(claim)
+        snapshot = _read_snapshot(claim)
+        if snapshot is not None:
+            snapshots.append(snapshot)
+    if not claimed:
+        return None
+
+    retired = {
+        'pid': None,
+        'retired': True,
+        'written_at': time.time(),
+        'metrics': {
+            name: {
+                'type': metric['type'],
+                'help': metric['help'],
+                'labelnames': metric['labelnames'],
+                'buckets': metric['buckets'],
+                'samples': [[list(key), list(value)] if metric['type'] == 'histogram' else [list(key), value]
+                            for key, value in metric['values'].items()]
+            }
+            for name, metric in _merge(snapshots).items()
+        }
+    }
+    path = os.path.join(METRICS_DIR, f"retired-{os.getpid()}-{time.time_ns()}.json")
+    try:
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(retired, f)
+        os.replace(f"{path}.tmp", path)
+        for claim in claimed:
+            os.remove(claim)
+    except OSError as e:
+        logger.warning(f"Could not fold exited workers' metrics snapshots: {e}")
+    return retired
+
+
+def collect():
+    """
+    Merge the snapshots of all processes (this one freshly taken, unless
+    metrics are disabled in this process).
+    Returns: {name: {'type', 'help', 'labelnames', 'buckets', 'values': {labels: value}}}
+    """
+    own_path = _snapshot_path()
+    snapshots = [write_snapshot()] if METRICS_ENABLED else []
+    retired = []
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        if path == own_path:
+            continue
+        snapshot = _read_snapshot(path)
+        if snapshot is None:
+            continue
+        if snapshot.get('retired') or not _pid_alive(snapshot.get('pid', 0)):
+            retired.append((path, snapshot))
+        else:
+            snapshots.append(snapshot)
+
+    # One retired file at most: fold in the snapshots of workers that exited
+    if len(retired) > 1 or (retired and not retired[0][1].get('retired')):
+        folded = _retire([path for path, _ in retired])
+        retired = [(None, folded)] if folded is not None else []
+    return _merge(snapshots + [snapshot for _, snapshot in retired], live=snapshots)
+
+
+def _merge(snapshots, live=()):
+    """Sum snapshots per metric; gauges only from the ``live`` ones."""
+    merged = {}
+    for snapshot in snapshots:
+        alive = any(snapshot is s for s in live)
+        for name, metric in snapshot.get('metrics', {}).items():
+            if metric['type'] == 'gauge' and not alive:
+                continue
+            entry = merged.setdefault(name, {
+                'type': metric['type'],
+                'help': metric['help'],
+                'labelnames': metric['labelnames'],
+                'buckets': metric.get('buckets'),
+                'values': {}
+            })
+            if entry['labelnames'] != metric['labelnames'] or entry['buckets'] != metric.get('buckets'):
+                # Written by a version of the app with a different definition
+                continue
+            values = entry['values']
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                if metric['type'] == 'histogram':
+                    counts, total = value
+                    if key in values:
+                        previous_counts, previous_total = values[key]
+                        counts = [a + b for a, b in zip(previous_counts, counts)]
+                        total += previous_total
+                    values[key] = (counts, total)
+                else:
+                    values[key] = values.get(key, 0) + value
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def render():
+    """All metrics of all processes in the Prometheus text format (0.0.4)."""
+    lines = []
+    for name, metric in sorted(collect().items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric['labelnames']
+        for key, value in sorted(metric['values'].items()):
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{_labels(names, key)} {_number(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(list(metric['buckets']) + ['+Inf'], counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_labels(names, key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, key)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(names, key)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    """Count and time every request of a Flask app, and start the snapshot writer."""
+    from flask import g, request
+
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        started = g.get('metrics_started')
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        return response
+
+    start()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Inspect or clear the metrics snapshots")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('show', help='Print the merged metrics of all processes')
+    sub.add_parser('reset', help='Delete all snapshot files')
+    args = parser.parse_args()
+
+    # The CLI only reads or clears the app processes' snapshots, it writes none
+    global METRICS_ENABLED
+    METRICS_ENABLED = False
+
+    if args.command == 'show':
+        print(render(), end='')
+    elif args.command == 'reset':
+        paths = glob.glob(os.path.join(METRICS_DIR, '*.json'))
+        for path in paths:
+            os.remove(path)
+        print(f"Deleted {len(paths)} snapshot files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Versioned database migrations.
+
+db.create_all() creates missing tables; the migrations here change existing
+ones (new columns, indexes, backfills of derived tables). The version of a
+database is kept in SQLite's PRAGMA user_version, and the app applies the
+pending migrations at start-up. Every migration is idempotent, so a fresh
+database created by create_all() goes through them without changes.
+
+Each migration and its version bump commit or roll back together, DDL
+included: pysqlite leaves ALTER/CREATE outside its implicit transactions, so
+migrations run on a separate engine with the driver's transaction handling
+turned off that emits BEGIN IMMEDIATE itself. Processes starting together
+(gunicorn workers) take a file lock next to the database (schema_lock) for
+create_all() and the upgrade; the first one migrates, the others find nothing
+left to do. In deployments, `python migrations.py upgrade` can also run as a
+separate step before the workers start.
+
+Add a migration by appending a function decorated with @migration; never
+reorder or remove existing ones.
+
+Usage:
+    python migrations.py status
+    python migrations.py upgrade
+"""
+
+import argparse
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import NullPool
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(description):
+    """Register the next migration; its version is its position in MIGRATIONS."""
+    def register(fn):
+        MIGRATIONS.append((len(MIGRATIONS) + 1, description, fn))
+        return fn
+    return register
+
+
+def _add_column(conn, table, column, column_type):
+    columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+@migration("Add analyses.correction (user feedback)")
+def _analyses_correction(conn):
+    _add_column(conn, 'analyses', 'correction', 'VARCHAR(20)')
+
+
+@migration("Add analyses.corrected_at (incremental training watermark)")
+def _analyses_corrected_at(conn):
+    _add_column(conn, 'analyses', 'corrected_at', 'DATETIME')
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_analyses_corrected_at ON analyses (corrected_at)"))
+
+
+@migration("Backfill the word cloud term index")
+def _backfill_term_index(conn):
+    import term_index
+    term_index.rebuild(connection=conn)
+
+
+@migration("Backfill the daily sentiment rollups")
+def _backfill_rollups(conn):
+    import rollups
+    rollups.rebuild(connection=conn)
+
+
+@migration("Add the (user_id, created_at, id) index for history pagination")
+def _analyses_history_index(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_analyses_user_created ON analyses (user_id, created_at, id)"
+    ))
+
+
+@migration("Add analyses.source, text_hash and model_fingerprint for saved batch and scrape runs")
+def _analyses_saved_runs(conn):
+    _add_column(conn, 'analyses', 'source', 'VARCHAR(255)')
+    _add_column(conn, 'analyses', 'text_hash', 'VARCHAR(64)')
+    _add_column(conn, 'analyses', 'model_fingerprint', 'VARCHAR(64)')
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_analyses_user_source ON analyses (user_id, source, created_at, id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_analyses_user_text_hash ON analyses (user_id, text_hash)"
+    ))
+
+
+def current_version(conn):
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+_lock_guard = threading.RLock()
+_lock_file = None
+_lock_depth = 0
+
+
+def _lock_path(engine):
+    database = engine.url.database
+    if not database or database == ':memory:':
+        return os.path.join('instance', 'schema.lock')
+    return f"{database}.schema.lock"
+
+
+def _lock_exclusive(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            # Retries for about 10 seconds, then raises
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock(lock_file):
+    if fcntl is None:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    lock_file.close()
+
+
+@contextmanager
+def schema_lock(engine):
+    """
+    Exclusive schema changes: a file lock next to the database across
+    processes, re-entrant within one.
+    """
+    global _lock_file, _lock_depth
+    with _lock_guard:
+        if _lock_depth == 0:
+            path = _lock_path(engine)
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            _lock_file = open(path, 'w')
+            _lock_exclusive(_lock_file)
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0:
+                _unlock(_lock_file)
+                _lock_file = None
+
+
+def _transactional_engine(engine):
+    """
+    An engine on the same database whose transactions cover DDL (SQLAlchemy's
+    recipe for pysqlite): the driver never begins or commits on its own, and
+    BEGIN IMMEDIATE takes the write lock when a transaction starts.
+    """
+    migration_engine = create_engine(engine.url, poolclass=NullPool)
+
+    @event.listens_for(migration_engine, 'connect')
+    def _disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(migration_engine, 'begin')
+    def _begin_immediate(conn):
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+    return migration_engine
+
+
+def upgrade(engine):
+    """
+    Apply pending migrations, each in one transaction together with its
+    version bump.
+    Returns: List of applied versions.
+    """
+    with engine.connect() as conn:
+        if current_version(conn) >= latest_version():
+            return []
+
+    applied = []
+    with schema_lock(engine):
+        migration_engine = _transactional_engine(engine)
+        try:
+            for version, description, fn in MIGRATIONS:
+                with migration_engine.begin() as conn:
+                    # Re-read under the lock: another process may have migrated meanwhile
+                    if current_version(conn) >= version:
+                        continue
+                    logger.info(f"Applying migration {version}: {description}")
+                    fn(conn)
+                    conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+                applied.append(version)
+        finally:
+            migration_engine.dispose()
+    return applied
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='Show applied and pending migrations')
+    sub.add_parser('upgrade', help='Apply pending migrations')
+    args = parser.parse_args()
+
+    # Importing the app creates missing tables and applies pending migrations
+    from app import app
+    from extensions import db
+
+    with app.app_context():
+        if args.command == 'upgrade':
+            applied = upgrade(db.engine)
+            print(f"Applied {len(applied)} migrations")
+
+        with db.engine.connect() as conn:
+            version = current_version(conn)
+        for number, description, _ in MIGRATIONS:
+            state = 'applied' if number <= version else 'pending'
+            print(f"{number:>3}  {state:<8} {description}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,132 +1,1007 @@
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
 import logging
-import re
 
 logger = logging.getLogger(__name__)
 
+import gc
 import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from itertools import cycle, islice
+
+import model_registry
+from model_registry import compute_model_fingerprint
+from batching import MicroBatcher
+from prediction_cache import PredictionCache, text_hash
+from result_store import ResultStore
+from lexicon import get_lexicon
+from student_model import CASCADE_ENABLED, get_student
+from metrics import timed, BATCH_SIZE, CACHE_LOOKUPS, MODEL_LOAD_SECONDS
 
 MODEL_NAME = "w11wo/indonesian-roberta-base-sentiment-classifier"
+# Pre-registry location of the fine-tuned model, imported into the registry on first load
 FINE_TUNED_DIR = "./fine_tuned_model"
-_sentiment_pipeline = None
+
+# The model serving requests (LoadedModel). Replaced as a single reference, so a
+# request sees either the old or the new model, never a mix of the two.
+_current = None
+# Previous model kept loaded for instant rollback (SENTIMENT_KEEP_PREVIOUS_MODEL=1)
+_standby = None
+_reload_lock = threading.RLock()
+
+KEEP_PREVIOUS_MODEL = os.environ.get('SENTIMENT_KEEP_PREVIOUS_MODEL', '0') == '1'
+# Seconds to wait for in-flight requests on a replaced model before freeing it
+DRAIN_TIMEOUT = float(os.environ.get('SENTIMENT_MODEL_DRAIN_TIMEOUT', '30'))
+# How often (seconds) to check the registry for a version promoted by another
+# worker or the CLI. 0 disables.
+REGISTRY_POLL_INTERVAL = float(os.environ.get('SENTIMENT_MODEL_REGISTRY_POLL', '10'))
+_registry_checked_at = 0.0
+_registry_signature = None
+
+# Synthetic batches run through a candidate model before it takes traffic, so
+# the first real requests do not pay for lazy initialization. One batch per
+# sequence length (in words, roughly tokens) warms every input shape.
+WARMUP_SENTENCE = "Makanannya enak tapi pelayanannya agak lambat. "
+WARMUP_SEQUENCE_LENGTHS = [
+    int(n) for n in os.environ.get('SENTIMENT_WARMUP_LENGTHS', '16,64,128,256,512').split(',')
+]
+WARMUP_BATCH_SIZE = 4
+# Timed single-text predictions after warm-up; their median is the warm latency
+WARMUP_LATENCY_ROUNDS = 5
+WARMUP_LATENCY_LENGTH = 64
+
+# Readiness (see get_readiness): the warm latency must be under this threshold
+READY_MAX_LATENCY_MS = float(os.environ.get('SENTIMENT_READY_MAX_LATENCY_MS', '500'))
+# Re-measure a too-slow warm latency at most this often (seconds)
+READY_RECHECK_INTERVAL = 10.0
+_preload_thread = None
+_preload_error = None
+_preload_lock = threading.Lock()
+
+# Inference backend: 'torch' (transformers pipeline) or 'onnx' (ONNX Runtime)
+INFERENCE_BACKEND = os.environ.get('SENTIMENT_BACKEND', 'torch').lower()
+# Exported ONNX graphs are cached next to the fine-tuned model
+ONNX_CACHE_DIR = os.environ.get('SENTIMENT_ONNX_CACHE_DIR', FINE_TUNED_DIR.rstrip('/') + '_onnx')
+
+# Opt-in dynamic INT8 quantization of linear layers (torch backend)
+QUANTIZE_INT8 = os.environ.get('SENTIMENT_QUANTIZE_INT8', '0') == '1'
+# Quantized artifacts are persisted per model fingerprint
+QUANTIZED_DIR = os.environ.get('SENTIMENT_QUANTIZED_DIR', FINE_TUNED_DIR.rstrip('/') + '_int8')
+
+# Address of a running inference_server.py ('host:port' or socket path).
+# When set, predictions are made by the server's worker pool instead of a local model.
+INFERENCE_SERVER = os.environ.get('SENTIMENT_INFERENCE_SERVER')
+INFERENCE_SERVER_CONNECTIONS = int(os.environ.get('SENTIMENT_INFERENCE_SERVER_CONNECTIONS', '8'))
+
+# Bulk scoring (batch files, scraped comments): texts per forward pass
+BULK_BATCH_SIZE = int(os.environ.get('SENTIMENT_BULK_BATCH_SIZE', '32'))
+
+# Micro-batching configuration
+BATCHING_ENABLED = os.environ.get('SENTIMENT_BATCHING', '1') == '1'
+BATCH_MAX_SIZE = int(os.environ.get('SENTIMENT_BATCH_MAX_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('SENTIMENT_BATCH_MAX_WAIT_MS', '5'))
+_batcher = None
+_batcher_lock = threading.Lock()
+
+# Prediction cache configuration (0 = unbounded / no TTL)
+CACHE_ENABLED = os.environ.get('SENTIMENT_CACHE', '1') == '1'
+CACHE_MAX_ENTRIES = int(os.environ.get('SENTIMENT_CACHE_MAX_ENTRIES', '10000'))
+CACHE_MAX_BYTES = int(os.environ.get('SENTIMENT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.environ.get('SENTIMENT_CACHE_TTL', '0'))
+_cache = PredictionCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL) if CACHE_ENABLED else None
+
+# Persistent result store shared by all workers (see result_store.py)
+RESULT_STORE_ENABLED = os.environ.get('SENTIMENT_RESULT_STORE_ENABLED', '1') == '1'
+_result_store = None
+_result_store_lock = threading.Lock()
+
+# Cascade counters: texts answered by the student model vs. escalated to the transformer
+_cascade_stats = {'student': 0, 'escalated': 0}
+_cascade_lock = threading.Lock()
+
+# Map labels to Indonesian
+# Common labels for this model: 'positive', 'neutral', 'negative'
+SENTIMENT_MAP = {
+    'positive': 'Positif',
+    'neutral': 'Netral',
+    'negative': 'Negatif',
+    'LABEL_0': 'Negatif',
+    'LABEL_1': 'Netral',
+    'LABEL_2': 'Positif'
+}
+
+class LoadedModel:
+    """
+    One loaded model version and everything needed to serve it.
+    Requests hold it for the duration of a forward pass, so a model that has
+    been swapped out is only freed once its in-flight requests are done.
+    The pipeline and its fast tokenizer are not thread-safe, and the
+    micro-batcher, bulk scoring, jobs and the readiness check all call them:
+    run_lock serializes those calls (torch already spreads one forward pass
+    over all intra-op threads). The inference server client needs no lock.
+    """
+
+    def __init__(self, classifier, tokenizer, fingerprint, backend, version=None):
+        self.classifier = classifier
+        self.tokenizer = tokenizer
+        self.fingerprint = fingerprint
+        self.backend = backend
+        self.version = version
+        self.run_lock = nullcontext() if backend == 'remote' else threading.Lock()
+        self.loaded_at = time.time()
+        self.warmup_ms = None
+        self.warm_latency_ms = None
+        self.latency_measured_at = None
+        self._inflight = 0
+        self._retired = False
+        self._idle = threading.Condition()
+
+    def acquire(self):
+        """Register an in-flight request. False if the model is being retired."""
+        with self._idle:
+            if self._retired:
+                return False
+            self._inflight += 1
+            return True
+
+    def release(self):
+        with self._idle:
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._idle.notify_all()
+
+    def drain(self, timeout=None):
+        """Stop accepting requests and wait for the in-flight ones to finish."""
+        with self._idle:
+            self._retired = True
+            return self._idle.wait_for(lambda: self._inflight == 0, timeout)
+
+    def unload(self):
+        self.classifier = None
+        self.tokenizer = None
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'fingerprint': self.fingerprint,
+            'backend': self.backend,
+            'loaded_at': self.loaded_at,
+            'warmup_ms': self.warmup_ms,
+            'warm_latency_ms': self.warm_latency_ms,
+            'inflight': self._inflight
+        }
+
 
 def load_model():
-    global _sentiment_pipeline
-    if _sentiment_pipeline is None:
-        reload_model()
+    with _reload_lock:
+        if _current is None:
+            reload_model()
 
-def reload_model():
-    global _sentiment_pipeline
+def _resolve_active_version():
+    """
+    Active registry version as (version, path), or None.
+    A model left in FINE_TUNED_DIR by older versions of the app is imported first.
+    """
     try:
-        # Check if fine-tuned model exists
-        target_model = MODEL_NAME
-        if os.path.exists(FINE_TUNED_DIR) and os.listdir(FINE_TUNED_DIR):
-            logger.info(f"Found fine-tuned model at {FINE_TUNED_DIR}. Loading...")
-            target_model = FINE_TUNED_DIR
+        model_registry.import_directory(FINE_TUNED_DIR)
+    except Exception as e:
+        logger.error(f"Could not import {FINE_TUNED_DIR} into the model registry: {e}")
+    return model_registry.get_active()
+
+def resolve_target_model():
+    """
+    Directory of the active registry version if there is one, otherwise the base model name
+    """
+    active = _resolve_active_version()
+    return active[1] if active else MODEL_NAME
+
+def _load_weights(target_model, fingerprint=None):
+    """
+    Load tokenizer and model (INT8-quantized if enabled)
+    Returns: (model, tokenizer, fingerprint)
+    """
+    # transformers/torch are imported on first load, not when the app starts
+    from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+
+    # Load tokenizer and model explicitly
+    tokenizer = AutoTokenizer.from_pretrained(target_model)
+    config = AutoConfig.from_pretrained(target_model)
+    fingerprint = fingerprint or compute_model_fingerprint(target_model, config)
+
+    if QUANTIZE_INT8 and INFERENCE_BACKEND == 'torch':
+        from quantization import load_or_quantize
+        model = load_or_quantize(target_model, os.path.join(QUANTIZED_DIR, fingerprint), config)
+        # Quantized predictions differ slightly: keep them apart in the caches
+        fingerprint = f"{fingerprint}-int8"
+    else:
+        if QUANTIZE_INT8:
+            logger.warning("INT8 quantization only applies to the torch backend, ignoring")
+        model = AutoModelForSequenceClassification.from_pretrained(target_model)
+
+    model.eval()
+    return model, tokenizer, fingerprint
+
+def _build_classifier(model, tokenizer, fingerprint):
+    """
+    Build the callable used for inference on the selected backend.
+    Both backends take a list of texts and return [{'label', 'score'}, ...].
+    Returns: (classifier, backend_name)
+    """
+    if INFERENCE_BACKEND == 'onnx':
+        try:
+            from onnx_backend import load_onnx_classifier
+            classifier = load_onnx_classifier(model, tokenizer, ONNX_CACHE_DIR, fingerprint)
+            logger.info("Serving predictions with ONNX Runtime")
+            return classifier, 'onnx'
+        except Exception as e:
+            logger.error(f"ONNX backend unavailable, falling back to PyTorch: {e}")
+
+    from transformers import pipeline
+
+    classifier = pipeline(
+        "sentiment-analysis",
+        model=model,
+        tokenizer=tokenizer
+    )
+    return classifier, 'torch'
+
+def _load_candidate(version):
+    """
+    Load a registry version (None: the base model) without touching the model
+    in use. If nothing is being served yet, a broken version falls back to the
+    base model; otherwise the error is raised and the current model stays.
+    Returns: LoadedModel
+    """
+    start = time.perf_counter()
+    try:
+        if version is not None:
+            target_model = model_registry.version_path(version)
+            fingerprint = model_registry.read_manifest(version).get('fingerprint')
+            logger.info(f"Loading model version {version} from {target_model}...")
         else:
+            target_model, fingerprint = MODEL_NAME, None
             logger.info(f"Loading base IndoBERT model: {MODEL_NAME}...")
 
-        # Load tokenizer and model explicitly
-        tokenizer = AutoTokenizer.from_pretrained(target_model)
-        model = AutoModelForSequenceClassification.from_pretrained(target_model)
-        
-        _sentiment_pipeline = pipeline(
-            "sentiment-analysis", 
-            model=model, 
-            tokenizer=tokenizer
-        )
+        model, tokenizer, fingerprint = _load_weights(target_model, fingerprint)
         logger.info(f"✅ Model loaded successfully from {target_model}!")
     except Exception as e:
         logger.error(f"Failed to load model: {e}")
-        # Fallback to base model if fine-tuned fails
-        if target_model == FINE_TUNED_DIR:
-            logger.warning("Falling back to base model...")
-            try:
-                tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-                model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
-                _sentiment_pipeline = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
-                logger.info("✅ Base model loaded successfully!")
-            except Exception as ex:
-                logger.error(f"Failed to load base model: {ex}")
-                raise
-        else:
+        # Fallback to base model if the fine-tuned one fails and nothing is serving
+        if version is None or _current is not None:
             raise
 
-def predict_sentiment_bert(text):
+        logger.warning("Falling back to base model...")
+        try:
+            version = None
+            model, tokenizer, fingerprint = _load_weights(MODEL_NAME)
+            logger.info("✅ Base model loaded successfully!")
+        except Exception as ex:
+            logger.error(f"Failed to load base model: {ex}")
+            raise
+
+    classifier, backend = _build_classifier(model, tokenizer, fingerprint)
+    MODEL_LOAD_SECONDS.observe(time.perf_counter() - start, phase='load')
+    return LoadedModel(classifier, tokenizer, fingerprint, backend, version)
+
+def _warmup_text(words):
+    return ' '.join(islice(cycle(WARMUP_SENTENCE.split()), words))
+
+def _measure_latency(model):
     """
-    Predict sentiment using IndoBERT
-    Returns: (sentiment_label, confidence_score)
+    Median latency (ms) of a single typical prediction on a warm model
+    """
+    text = [_warmup_text(WARMUP_LATENCY_LENGTH)]
+    timings = []
+    for _ in range(WARMUP_LATENCY_ROUNDS):
+        # Measured on a serving model too (readiness checks)
+        with model.run_lock:
+            start = time.perf_counter()
+            model.classifier(text, truncation=True, max_length=512, batch_size=1)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    model.warm_latency_ms = round(statistics.median(timings), 1)
+    model.latency_measured_at = time.monotonic()
+    return model.warm_latency_ms
+
+def _warm_up(model):
+    """
+    Run synthetic batches of every warm-up sequence length through a model
+    that is not serving yet, then measure its warm latency
+    """
+    start = time.perf_counter()
+    try:
+        for length in WARMUP_SEQUENCE_LENGTHS:
+            batch = [_warmup_text(length)] * WARMUP_BATCH_SIZE
+            model.classifier(batch, truncation=True, max_length=512, batch_size=len(batch))
+        model.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+        MODEL_LOAD_SECONDS.observe(model.warmup_ms / 1000, phase='warmup')
+        _measure_latency(model)
+    except Exception as e:
+        logger.warning(f"Model warm-up failed: {e}")
+        return
+    logger.info(
+        f"Model {model.fingerprint} warmed up in {model.warmup_ms} ms, "
+        f"warm latency {model.warm_latency_ms} ms"
+    )
+
+def _retire(model):
+    """
+    Wait for requests still using a replaced model, then free it
+    """
+    if not model.drain(DRAIN_TIMEOUT):
+        logger.warning(f"Model {model.fingerprint} still busy after {DRAIN_TIMEOUT}s, freeing anyway")
+    model.unload()
+    gc.collect()
+    logger.info(f"Model {model.fingerprint} (version {model.version}) unloaded")
+
+def _swap(candidate):
     """
-    global _sentiment_pipeline
-    if _sentiment_pipeline is None:
+    Put a loaded and warmed model in service; the previous one is drained and
+    freed in the background, or kept as standby for instant rollback.
+    """
+    global _current, _standby
+    old = _current
+    _current = candidate
+
+    # New weights: cached predictions of the previous model are unreachable anyway
+    if _cache is not None and (old is None or old.fingerprint != candidate.fingerprint):
+        _cache.clear()
+    logger.info(f"Serving model {candidate.fingerprint} (version {candidate.version})")
+    _check_student(candidate.fingerprint)
+
+    if old is None:
+        return
+    if KEEP_PREVIOUS_MODEL and old.backend != 'remote':
+        old, _standby = _standby, old
+        if old is None:
+            return
+    threading.Thread(target=_retire, args=(old,), name='model-retire', daemon=True).start()
+
+def _connect_inference_server():
+    from inference_server import InferenceClient
+
+    client = InferenceClient(INFERENCE_SERVER, pool_size=INFERENCE_SERVER_CONNECTIONS)
+    model = LoadedModel(client, None, client.fingerprint, 'remote', client.version)
+    _warm_up(model)
+    _swap(model)
+    logger.info(f"✅ Connected to inference server at {INFERENCE_SERVER} (model {client.fingerprint})")
+
+def _reload_remote(version):
+    """
+    Have the inference server load a version and check that it now serves the
+    weights registered for it
+    """
+    model = _current
+    result = model.classifier.reload(version)
+    if result['version'] != version:
+        raise RuntimeError(f"Inference server serves version {result['version']} instead of {version}")
+    expected = model_registry.read_manifest(version).get('fingerprint') if version is not None else None
+    if expected and result['fingerprint'] != expected:
+        raise RuntimeError(
+            f"Inference server serves model {result['fingerprint']}, version {version} is {expected}"
+        )
+    if result['fingerprint'] != model.fingerprint:
+        _on_remote_model_changed(model, result['fingerprint'])
+    return model
+
+def reload_model(version=None):
+    """
+    Load the active registry version (or ``version``), warm it up and swap it in.
+    Requests keep using the current model until the new one is ready; the old
+    one is then drained and freed.
+    With an inference server, a given version is loaded by the server instead.
+    Returns: LoadedModel now serving
+    """
+    global _standby, _registry_signature
+    with _reload_lock:
+        if INFERENCE_SERVER:
+            if _current is None:
+                _connect_inference_server()
+                if version is None:
+                    return _current
+            return _reload_remote(version)
+
+        _registry_signature = model_registry.state_signature()
+        if version is None:
+            active = _resolve_active_version()
+            version = active[0] if active else None
+
+        start = time.perf_counter()
+        standby = _standby
+        if standby is not None and standby.version == version:
+            # Rolling back to the model kept in memory: no load, no warm-up
+            _standby = None
+            candidate = standby
+            logger.info(f"Switching back to standby model version {version}")
+        else:
+            candidate = _load_candidate(version)
+            _warm_up(candidate)
+
+        _swap(candidate)
+        MODEL_LOAD_SECONDS.observe(time.perf_counter() - start, phase='reload')
+        return candidate
+
+def activate_model(version):
+    """
+    Promote a registered version: it is loaded and warmed (by the inference
+    server, if one is used) before the registry pointer moves, so a broken
+    version never becomes active.
+    """
+    if version not in {m['version'] for m in model_registry.list_versions()}:
+        raise ValueError(f"Unknown model version: {version}")
+    model = reload_model(version)
+    model_registry.activate_version(version)
+    return model
+
+def rollback_model():
+    """
+    Switch back to the previous registry version
+    """
+    previous = model_registry.read_state().get('previous')
+    if not previous:
+        raise ValueError('No previous model version to roll back to')
+    model = reload_model(previous)
+    model_registry.rollback()
+    return model
+
+def publish_model(source_dir, metadata=None):
+    """
+    Register a freshly trained model directory and put it in service
+    Returns: version id
+    """
+    version = model_registry.register(source_dir, metadata=metadata, move=True)
+    activate_model(version)
+    return version
+
+def _reload_in_background():
+    try:
+        with _reload_lock:
+            model = _current
+            if model is not None and model.version == model_registry.read_state().get('active'):
+                return
+            reload_model()
+    except Exception as e:
+        logger.error(f"Could not switch to the new active model version: {e}")
+
+def _follow_registry():
+    """
+    Pick up a version promoted elsewhere (another worker, the CLI, a training run).
+    Called on the request path: costs one stat() per REGISTRY_POLL_INTERVAL,
+    and the reload itself runs in a background thread.
+    """
+    global _registry_checked_at, _registry_signature
+    if not REGISTRY_POLL_INTERVAL or INFERENCE_SERVER:
+        return
+
+    now = time.monotonic()
+    if now - _registry_checked_at < REGISTRY_POLL_INTERVAL:
+        return
+    _registry_checked_at = now
+
+    signature = model_registry.state_signature()
+    if signature == _registry_signature:
+        return
+    _registry_signature = signature
+
+    model = _current
+    active = model_registry.read_state().get('active')
+    if model is not None and active and model.version != active:
+        logger.info(f"Model registry switched to version {active}, reloading in the background")
+        threading.Thread(target=_reload_in_background, name='model-reload', daemon=True).start()
+
+@contextmanager
+def _serving_model():
+    """
+    The current model, held for the duration of the block
+    """
+    while True:
+        model = _current
+        if model is None:
+            load_model()
+            continue
+        # A model retired between the read and acquire(): take the new one
+        if model.acquire():
+            break
+    try:
+        yield model
+    finally:
+        model.release()
+
+def _preload():
+    global _preload_error
+    try:
         load_model()
-        
+        _preload_error = None
+    except Exception as e:
+        _preload_error = str(e)
+        logger.error(f"Model preload failed: {e}")
+
+def preload_model():
+    """
+    Load and warm up the model in a background thread (once per process), so
+    the first request does not wait for it. Progress is reported by get_readiness().
+    """
+    global _preload_thread
+    with _preload_lock:
+        if _preload_thread is None:
+            _preload_thread = threading.Thread(target=_preload, name='model-preload', daemon=True)
+            _preload_thread.start()
+    return _preload_thread
+
+def get_readiness():
+    """
+    Whether this process should receive traffic: a model is loaded, warmed up,
+    and its warm latency is under READY_MAX_LATENCY_MS. A model that measured
+    too slow is re-measured at most every READY_RECHECK_INTERVAL seconds.
+    Returns: dict with 'ready' and 'reason'
+    """
+    model = _current
+    readiness = {
+        'ready': False,
+        'reason': None,
+        'threshold_ms': READY_MAX_LATENCY_MS,
+        'model': model.to_dict() if model is not None else None
+    }
+
+    if model is None:
+        if _preload_error:
+            readiness['reason'] = f'Model failed to load: {_preload_error}'
+        elif _preload_thread is not None and _preload_thread.is_alive():
+            readiness['reason'] = 'Model is loading'
+        else:
+            readiness['reason'] = 'Model not loaded'
+        return readiness
+
+    latency = model.warm_latency_ms
+    stale = model.latency_measured_at is None or \
+        time.monotonic() - model.latency_measured_at > READY_RECHECK_INTERVAL
+    if (latency is None or latency > READY_MAX_LATENCY_MS) and stale and model.acquire():
+        try:
+            latency = _measure_latency(model)
+        except Exception as e:
+            logger.warning(f"Warm latency check failed: {e}")
+        finally:
+            model.release()
+        readiness['model'] = model.to_dict()
+
+    if latency is None:
+        readiness['reason'] = 'Model warm-up did not complete'
+    elif latency > READY_MAX_LATENCY_MS:
+        readiness['reason'] = f'Warm latency {latency} ms is over {READY_MAX_LATENCY_MS} ms'
+    else:
+        readiness['ready'] = True
+    return readiness
+
+def get_model_fingerprint():
+    model = _current
+    return model.fingerprint if model is not None else None
+
+def _map_label(label):
+    return SENTIMENT_MAP.get(label.lower(), label)
+
+def predict_sentiment_batch(texts):
+    """
+    Predict sentiment for a list of texts in a single padded forward pass
+    Returns: List of (sentiment_label, confidence_score), in input order
+    """
+    if not texts:
+        return []
+    return _predict_batch(texts)[0]
+
+def _predict_batch(texts):
+    """
+    Single padded forward pass, reporting which model answered: a swap or a
+    server-side reload can happen between a cache lookup and this call.
+    Returns: (predictions, fingerprint of the model that computed them)
+    """
+    BATCH_SIZE.observe(len(texts))
     try:
-        # Truncate text to avoid token limit issues (BERT limit is usually 512 tokens)
-        # We limit characters roughly to ensure we don't crash, pipeline handles truncation too
-        result = _sentiment_pipeline(text[:1500], truncation=True, max_length=512)[0]
-        
-        label = result['label']
-        score = result['score']
-        
-        # Map labels to Indonesian
-        # Common labels for this model: 'positive', 'neutral', 'negative'
-        sentiment_map = {
-            'positive': 'Positif',
-            'neutral': 'Netral',
-            'negative': 'Negatif',
-            'LABEL_0': 'Negatif',
-            'LABEL_1': 'Netral',
-            'LABEL_2': 'Positif'
-        }
-        
-        sentiment = sentiment_map.get(label.lower(), label)
-        
-        return sentiment, float(score)
+        with _serving_model() as model:
+            # Truncate text to avoid token limit issues (BERT limit is usually 512 tokens)
+            # We limit characters roughly to ensure we don't crash, the tokenizer truncates too
+            texts = [t[:1500] for t in texts]
+            if model.backend == 'remote':
+                # Tokenized by the server, the stage is the whole round trip
+                with timed('forward'):
+                    outputs, fingerprint = model.classifier.predict(texts, max_length=512)
+                if fingerprint != model.fingerprint:
+                    _on_remote_model_changed(model, fingerprint)
+            else:
+                with model.run_lock:
+                    if model.backend == 'torch':
+                        outputs = _classify_torch(model, texts, max_length=512)
+                    else:
+                        # The ONNX classifier times its tokenize and forward stages itself
+                        outputs = model.classifier(
+                            texts,
+                            truncation=True,
+                            max_length=512,
+                            batch_size=len(texts)
+                        )
+                fingerprint = model.fingerprint
+        return [(_map_label(r['label']), float(r['score'])) for r in outputs], fingerprint
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         raise
 
-def predict_aspect_sentiment(text):
+def _classify_torch(model, texts, max_length):
+    """
+    One padded forward pass through the pipeline's model, with tokenization
+    done (and timed) separately from the forward pass.
+    Returns: [{'label', 'score'}, ...] as the pipeline returns them
+    """
+    import torch
+
+    pipe = model.classifier
+    with timed('tokenize'):
+        encoded = model.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=max_length,
+            return_tensors='pt'
+        ).to(pipe.device)
+    with timed('forward'), torch.inference_mode():
+        logits = pipe.model(**encoded).logits
+
+    # Softmax, as the pipeline does for multi-class models
+    scores, best = torch.softmax(logits.float(), dim=-1).max(dim=-1)
+    id2label = pipe.model.config.id2label
+    return [
+        {'label': id2label[int(i)], 'score': float(score)}
+        for i, score in zip(best, scores)
+    ]
+
+def _predict_tagged(texts):
+    """Batcher callback: one (prediction, fingerprint) per text."""
+    predictions, fingerprint = _predict_batch(texts)
+    return [(prediction, fingerprint) for prediction in predictions]
+
+def _untag(tagged):
+    """[(prediction, fingerprint)] -> (predictions, the common fingerprint or None if they differ)"""
+    fingerprints = {fingerprint for _, fingerprint in tagged}
+    return [prediction for prediction, _ in tagged], fingerprints.pop() if len(fingerprints) == 1 else None
+
+def _on_remote_model_changed(model, fingerprint):
+    logger.info(f"Inference server switched model: {model.fingerprint} -> {fingerprint}")
+    model.fingerprint = fingerprint
+    model.version = model.classifier.version
+    if _cache is not None:
+        _cache.clear()
+    _check_student(fingerprint)
+
+def _get_batcher():
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                _predict_tagged,
+                max_batch_size=BATCH_MAX_SIZE,
+                max_wait_ms=BATCH_MAX_WAIT_MS,
+                name='sentiment-batcher'
+            )
+            _batcher.start()
+    return _batcher
+
+def _predict_uncached(texts):
+    """
+    Run the model on a small group of texts belonging to one request.
+    With micro-batching enabled the texts are queued together, so they share a
+    forward pass (possibly with other requests' texts).
+    Returns: (predictions, fingerprint of the model that computed them, None
+    if the texts straddled a model swap)
+    """
+    if not BATCHING_ENABLED:
+        return _predict_batch(texts)
+
+    batcher = _get_batcher()
+    futures = [batcher.submit(t) for t in texts]
+    return _untag([f.result() for f in futures])
+
+def _get_result_store():
+    global _result_store
+    if _result_store is None and RESULT_STORE_ENABLED:
+        with _result_store_lock:
+            if _result_store is None:
+                _result_store = ResultStore()
+    return _result_store
+
+def _predict_bucketed(texts, batch_size=None):
+    """
+    Run the model on many texts: sort by token length, cut the sorted list into
+    batches so each batch is padded only to its own longest text, then restore
+    the input order.
+    Returns: (predictions, fingerprint of the model that computed them, None
+    if the batches straddled a model swap)
+    """
+    batch_size = batch_size or BULK_BATCH_SIZE
+    if len(texts) <= 1:
+        return _predict_batch(texts)
+
+    with _serving_model() as model:
+        if model.tokenizer is not None:
+            with model.run_lock, timed('tokenize'):
+                lengths = [
+                    len(ids) for ids in model.tokenizer(
+                        [t[:1500] for t in texts],
+                        truncation=True,
+                        max_length=512
+                    )['input_ids']
+                ]
+        else:
+            # Remote backend: no local tokenizer, character length is a close proxy
+            lengths = [len(t) for t in texts]
+    order = sorted(range(len(texts)), key=lengths.__getitem__)
+
+    results = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        predictions, fingerprint = _predict_batch([texts[i] for i in bucket])
+        for i, prediction in zip(bucket, predictions):
+            results[i] = (prediction, fingerprint)
+    return _untag(results)
+
+def _student_mismatch(student, fingerprint):
+    """
+    Why the student cannot stand in for the model with this fingerprint
+    (None if it can): it must have been distilled from that very model
+    """
+    teacher = student.metadata.get('teacher_fingerprint')
+    if teacher != fingerprint:
+        return f"student distilled from model {teacher}, serving model {fingerprint}"
+    return None
+
+def _check_student(fingerprint):
+    """
+    Warn when a model swap leaves the cascade without a matching student.
+    The cascade escalates everything until one is trained for the new model
+    (python student_model.py train); the file is reloaded when it changes.
+    """
+    if not CASCADE_ENABLED:
+        return
+    student = get_student()
+    reason = _student_mismatch(student, fingerprint) if student is not None else None
+    if reason:
+        logger.warning(f"Cascade disabled until the student model is retrained: {reason}")
+
+def _answer_with_student(texts, missing, results, threshold):
+    """
+    Cascade: the student model answers the missing texts it is confident about
+    (confidence >= threshold); the others stay in ``missing`` for the transformer.
+    Student answers are not cached, the caches hold transformer results only.
+    Returns: The student's fingerprint, or None if it did not run.
+    """
+    student = get_student()
+    if student is None or _student_mismatch(student, get_model_fingerprint()):
+        return None
+
+    hashes = list(missing)
+    try:
+        predictions = student.predict([texts[missing[h][0]] for h in hashes])
+    except Exception as e:
+        logger.warning(f"Student model failed, escalating everything: {e}")
+        return None
+
+    answered = 0
+    for h, (sentiment, confidence) in zip(hashes, predictions):
+        if confidence >= threshold:
+            for i in missing.pop(h):
+                results[i] = (sentiment, confidence)
+            answered += 1
+
+    with _cascade_lock:
+        _cascade_stats['student'] += answered
+        _cascade_stats['escalated'] += len(hashes) - answered
+    CACHE_LOOKUPS.inc(answered, cache='student', result='hit')
+    CACHE_LOOKUPS.inc(len(hashes) - answered, cache='student', result='miss')
+    return student.fingerprint
+
+def _predict_many(texts, predict_fn=None, student_threshold=None, answered_by=None):
+    """
+    Predict texts through the in-memory cache and the persistent result store;
+    only texts found in neither reach the model (through predict_fn, default:
+    the micro-batcher), and repeated texts within the group are predicted once.
+    predict_fn returns (predictions, fingerprint of the model that ran); results
+    are cached only if that is still the model the lookup was keyed on.
+    With a student_threshold, the student model answers confident texts first
+    and only the rest reach the transformer (cascade mode).
+    answered_by (list, optional) is filled with the fingerprint of the model
+    behind each result ('student:...' for student answers), in input order.
+    Returns: List of (sentiment_label, confidence_score), in input order
+    """
+    if _current is None:
+        load_model()
+    _follow_registry()
+
+    predict_fn = predict_fn or _predict_uncached
+    if _cache is None and not RESULT_STORE_ENABLED and student_threshold is None:
+        predictions, used = predict_fn(texts)
+        if answered_by is not None:
+            answered_by[:] = [used] * len(texts)
+        return predictions
+
+    fingerprint = get_model_fingerprint()
+    hashes = [text_hash(t) for t in texts]
+    results = [None] * len(texts)
+    # Cache and store hits are results of the model the lookup is keyed on
+    sources = [fingerprint] * len(texts)
+
+    # text hash -> indices of the texts still needing a prediction
+    missing = {}
+    for i, h in enumerate(hashes):
+        if h in missing:
+            missing[h].append(i)
+            continue
+        cached = _cache.get((fingerprint, h)) if _cache is not None else None
+        if cached is None:
+            missing[h] = [i]
+        else:
+            results[i] = cached
+    if _cache is not None:
+        CACHE_LOOKUPS.inc(sum(r is not None for r in results), cache='memory', result='hit')
+        CACHE_LOOKUPS.inc(len(missing), cache='memory', result='miss')
+
+    store = _get_result_store()
+    if missing and store is not None:
+        try:
+            found = store.get_many(fingerprint, list(missing))
+        except Exception as e:
+            logger.warning(f"Result store lookup failed: {e}")
+            found = {}
+        CACHE_LOOKUPS.inc(len(found), cache='store', result='hit')
+        CACHE_LOOKUPS.inc(len(missing) - len(found), cache='store', result='miss')
+        for h, prediction in found.items():
+            if _cache is not None:
+                _cache.put((fingerprint, h), prediction)
+            for i in missing.pop(h):
+                results[i] = prediction
+
+    if missing and student_threshold is not None:
+        pending = [i for indices in missing.values() for i in indices]
+        student = _answer_with_student(texts, missing, results, student_threshold)
+        for i in pending:
+            if results[i] is not None:
+                sources[i] = student
+
+    if missing:
+        predictions, used = predict_fn([texts[indices[0]] for indices in missing.values()])
+        # Results of another model (swapped in since the lookup) are not
+        # cached under this fingerprint
+        cacheable = used == fingerprint
+        if not cacheable:
+            logger.info(f"Model changed during prediction ({fingerprint} -> {used}), results not cached")
+        for (h, indices), prediction in zip(missing.items(), predictions):
+            if _cache is not None and cacheable:
+                _cache.put((fingerprint, h), prediction)
+            for i in indices:
+                results[i] = prediction
+                sources[i] = used
+
+        if store is not None and cacheable:
+            try:
+                store.put_many(fingerprint, [
+                    (h, sentiment, confidence)
+                    for h, (sentiment, confidence) in zip(missing, predictions)
+                ])
+            except Exception as e:
+                logger.warning(f"Result store write failed: {e}")
+
+    if answered_by is not None:
+        answered_by[:] = sources
+    return results
+
+def predict_sentiment_bert(text, student_threshold=None):
+    """
+    Predict sentiment using IndoBERT
+    Results are cached, and concurrent calls are grouped into batches by the micro-batcher
+    Returns: (sentiment_label, confidence_score)
+    """
+    return _predict_many([text], student_threshold=student_threshold)[0]
+
+def predict_sentiment_bulk(texts, batch_size=None, student_threshold=None, answered_by=None):
+    """
+    Predict sentiment for many texts (batch files, scraped comments).
+    Cached and stored results are reused; the rest run as length-bucketed batches.
+    answered_by: see _predict_many
+    Returns: List of (sentiment_label, confidence_score), in input order
+    """
+    if not texts:
+        return []
+    return _predict_many(
+        texts,
+        lambda missing: _predict_bucketed(missing, batch_size),
+        student_threshold=student_threshold,
+        answered_by=answered_by
+    )
+
+def _extract_aspect_segments(text, domain=None):
+    """
+    Split text into segments and tag the ones that mention a known aspect,
+    using the compiled lexicon of the given domain
+    Returns: List of (aspect, segment)
+    """
+    with timed('aspect_segmentation'):
+        return get_lexicon(domain).extract_segments(text)
+
+def _build_aspect_results(matches, predictions):
+    return [
+        {
+            'aspect': aspect,
+            'sentiment': sentiment,
+            'text': segment
+        }
+        for (aspect, segment), (sentiment, _) in zip(matches, predictions)
+    ]
+
+def predict_aspect_sentiment(text, domain=None, student_threshold=None):
     """
     Analyze sentiment per aspect using rule-based segmentation + BERT
+    All matched segments are scored in one batched forward pass
     Returns: List of dicts {aspect, sentiment, text}
     """
-    # 1. Define Aspect Keywords
-    aspect_keywords = {
-        'Makanan': ['makan', 'rasa', 'menu', 'porsi', 'bumbu', 'enak', 'lezat', 'asin', 'manis', 'pedas', 'minum'],
-        'Pelayanan': ['pelayan', 'staff', 'ramah', 'lambat', 'cepat', 'antri', 'service', 'sopan', 'jutek'],
-        'Harga': ['harga', 'mahal', 'murah', 'biaya', 'bayar', 'worth', 'kantong'],
-        'Suasana': ['suasana', 'tempat', 'bersih', 'kotor', 'nyaman', 'musik', 'ac', 'view', 'luas', 'sempit']
-    }
+    matches = _extract_aspect_segments(text, domain)
+    if not matches:
+        return []
 
-    # 2. Split text into segments
-    # Split by common conjunctions and punctuation
-    segments = re.split(r'[,.]|tapi|namun|sedangkan|dan|serta|walaupun|meskipun', text.lower())
-    
-    results = []
-    
-    for segment in segments:
-        segment = segment.strip()
-        if len(segment) < 3: continue
-        
-        # Check which aspect this segment belongs to
-        found_aspect = None
-        for aspect, keywords in aspect_keywords.items():
-            if any(k in segment for k in keywords):
-                found_aspect = aspect
-                break
-        
-        if found_aspect:
-            # Predict sentiment for this segment
-            sentiment, score = predict_sentiment_bert(segment)
-            results.append({
-                'aspect': found_aspect,
-                'sentiment': sentiment,
-                'text': segment
-            })
-            
-    return results
+    predictions = _predict_many([segment for _, segment in matches], student_threshold=student_threshold)
+    return _build_aspect_results(matches, predictions)
+
+def analyze_text(text, domain=None, student_threshold=None, answered_by=None):
+    """
+    Overall sentiment plus per-aspect sentiment for one text.
+    The full text and all aspect segments go through a single batched
+    forward pass instead of one model call per segment.
+    answered_by: see _predict_many (the full text first, then the segments)
+    Returns: (sentiment_label, confidence_score, aspects)
+    """
+    matches = _extract_aspect_segments(text, domain)
+    predictions = _predict_many(
+        [text] + [segment for _, segment in matches],
+        student_threshold=student_threshold,
+        answered_by=answered_by
+    )
+
+    sentiment, confidence = predictions[0]
+    aspects = _build_aspect_results(matches, predictions[1:])
+    return sentiment, confidence, aspects
 
 def is_model_loaded():
-    return _sentiment_pipeline is not None
+    return _current is not None
+
+def get_inference_stats():
+    """
+    Inference engine statistics (queue depth, batch-size histogram, cache and store counters)
+    """
+    model = _current
+    fingerprint = model.fingerprint if model is not None else None
+    return {
+        'model_loaded': model is not None,
+        'model_fingerprint': fingerprint,
+        'model_version': model.version if model is not None else None,
+        'backend': model.backend if model is not None else None,
+        'quantized': bool(fingerprint and fingerprint.endswith('-int8')),
+        'model': model.to_dict() if model is not None else None,
+        'standby_model': _standby.to_dict() if _standby is not None else None,
+        'batching_enabled': BATCHING_ENABLED,
+        'batcher': _batcher.stats() if _batcher is not None else None,
+        'cache': _cache.stats() if _cache is not None else None,
+        'result_store': _result_store.stats() if _result_store is not None else None,
+        'cascade': _cascade_summary()
+    }
+
+def _cascade_summary():
+    with _cascade_lock:
+        counts = dict(_cascade_stats)
+    total = counts['student'] + counts['escalated']
+    student = get_student() if CASCADE_ENABLED else None
+    return {
+        'enabled': CASCADE_ENABLED,
+        # Set when the student was distilled from another model than the one serving
+        'student_disabled': _student_mismatch(student, get_model_fingerprint()) if student is not None else None,
+        'student_answered': counts['student'],
+        'escalated': counts['escalated'],
+        'escalation_rate': counts['escalated'] / total if total else None,
+        'student_threshold': student.threshold if student is not None else None,
+        'student_teacher': student.metadata.get('teacher_fingerprint') if student is not None else None
+    }
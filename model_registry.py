@@ -0,0 +1,368 @@
+"""
+Versioned model registry.
+
+Every trained model is kept as its own immutable version directory, named
+after its creation time and content fingerprint:
+
+    model_registry/
+        registry.json              {"active": ..., "previous": ...}
+        versions/<version>/        save_pretrained() output + manifest.json
+
+Promotion and rollback only move the active/previous pointers in
+registry.json. model_loader loads and warms the new active version before it
+serves any request with it, and app workers that did not trigger the change
+notice the new pointer on their own.
+
+Usage:
+    python model_registry.py list
+    python model_registry.py register ./fine_tuned_model [--activate]
+    python model_registry.py activate VERSION
+    python model_registry.py rollback
+    python model_registry.py prune [--keep 5]
+"""
+
+import argparse
+import filecmp
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_DIR = os.environ.get('SENTIMENT_MODEL_REGISTRY', './model_registry')
+# Versions kept on disk by prune() (the active and previous ones are always kept)
+KEEP_VERSIONS = int(os.environ.get('SENTIMENT_MODEL_REGISTRY_KEEP', '5'))
+
+MANIFEST_FILE = 'manifest.json'
+STATE_FILE = 'registry.json'
+
+# Bytes sampled from the head and tail of large weight files for the fingerprint
+FINGERPRINT_SAMPLE_BYTES = 4 * 1024 * 1024
+
+_state_lock = threading.Lock()
+
+
+def compute_model_fingerprint(target_model, config=None, full=False):
+    """
+    Content fingerprint of a model.
+    For a local directory: hashes every file name and size, the full content of
+    small files (config, tokenizer) and the head/tail of large weight files, or
+    the full content of every file with full=True (used by register(), where a
+    match means the model is not stored again).
+    The registry manifest is not part of the model and is skipped.
+    For a hub model: hashes the model name and resolved revision.
+    """
+    digest = hashlib.sha256()
+
+    if os.path.isdir(target_model):
+        for root, dirs, files in os.walk(target_model):
+            dirs.sort()
+            for name in sorted(files):
+                if name == MANIFEST_FILE and root == target_model:
+                    continue
+                path = os.path.join(root, name)
+                size = os.path.getsize(path)
+                digest.update(f"{os.path.relpath(path, target_model)}:{size}\n".encode('utf-8'))
+                with open(path, 'rb') as f:
+                    if full or size <= 2 * FINGERPRINT_SAMPLE_BYTES:
+                        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                            digest.update(chunk)
+                    else:
+                        digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+                        f.seek(-FINGERPRINT_SAMPLE_BYTES, os.SEEK_END)
+                        digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+    else:
+        revision = getattr(config, '_commit_hash', None)
+        digest.update(f"{target_model}@{revision}".encode('utf-8'))
+
+    return digest.hexdigest()[:16]
+
+
+def _model_files(directory):
+    """Relative paths of the model files in a directory (without the manifest)."""
+    paths = set()
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name == MANIFEST_FILE and root == directory:
+                continue
+            paths.add(os.path.relpath(os.path.join(root, name), directory))
+    return paths
+
+
+def same_model_files(first, second):
+    """True if two model directories hold the same files, compared byte by byte."""
+    paths = _model_files(first)
+    if paths != _model_files(second):
+        return False
+    return all(
+        filecmp.cmp(os.path.join(first, path), os.path.join(second, path), shallow=False)
+        for path in paths
+    )
+
+
+def _versions_dir(registry_dir=None):
+    return os.path.join(registry_dir or REGISTRY_DIR, 'versions')
+
+
+def version_path(version, registry_dir=None):
+    return os.path.join(_versions_dir(registry_dir), version)
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_state(registry_dir=None):
+    """
+    Returns: {'active': version or None, 'previous': version or None, 'updated_at': ...}
+    """
+    path = os.path.join(registry_dir or REGISTRY_DIR, STATE_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'active': None, 'previous': None, 'updated_at': None}
+
+
+def _write_state(state, registry_dir=None):
+    registry_dir = registry_dir or REGISTRY_DIR
+    os.makedirs(registry_dir, exist_ok=True)
+    state['updated_at'] = time.time()
+    _write_json(os.path.join(registry_dir, STATE_FILE), state)
+
+
+def read_manifest(version, registry_dir=None):
+    with open(os.path.join(version_path(version, registry_dir), MANIFEST_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_versions(registry_dir=None):
+    """
+    Manifests of all registered versions, newest first, flagged active/previous.
+    """
+    directory = _versions_dir(registry_dir)
+    if not os.path.isdir(directory):
+        return []
+
+    state = read_state(registry_dir)
+    versions = []
+    for name in os.listdir(directory):
+        if name.startswith('.'):
+            continue
+        try:
+            manifest = read_manifest(name, registry_dir)
+        except (OSError, ValueError):
+            logger.warning(f"Skipping model version without a valid manifest: {name}")
+            continue
+        manifest['active'] = name == state.get('active')
+        manifest['previous'] = name == state.get('previous')
+        versions.append(manifest)
+
+    versions.sort(key=lambda m: m.get('created_at', 0), reverse=True)
+    return versions
+
+
+def find_version(fingerprint, registry_dir=None):
+    for manifest in list_versions(registry_dir):
+        if manifest.get('fingerprint') == fingerprint:
+            return manifest['version']
+    return None
+
+
+def register(source_dir, metadata=None, activate=False, move=False, registry_dir=None):
+    """
+    Add a saved model directory to the registry as a new immutable version.
+    A model whose content is already registered is not stored twice.
+
+    Args:
+        source_dir (str): Directory written by save_pretrained().
+        metadata (dict, optional): Extra manifest fields (training samples, metrics, ...).
+        activate (bool): Point the registry at the new version.
+        move (bool): Move source_dir into the registry instead of copying it.
+
+    Returns:
+        str: The version id.
+    """
+    if not os.path.isdir(source_dir) or not os.listdir(source_dir):
+        raise ValueError(f"Not a model directory: {source_dir}")
+
+    fingerprint = compute_model_fingerprint(source_dir, full=True)
+    version = find_version(fingerprint, registry_dir)
+    if version is not None and not same_model_files(source_dir, version_path(version, registry_dir)):
+        # Never treat (and, with move=True, delete) the source as a duplicate
+        # unless its content really is identical
+        raise ValueError(
+            f"Model in {source_dir} has the fingerprint of version {version} but different content"
+        )
+
+    if version is None:
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{fingerprint[:8]}"
+        directory = _versions_dir(registry_dir)
+        os.makedirs(directory, exist_ok=True)
+
+        # Build the version under a hidden name, then rename it into place:
+        # a half-copied version is never visible to readers
+        tmp_path = os.path.join(directory, f".tmp-{version}-{os.getpid()}")
+        if move:
+            shutil.move(source_dir, tmp_path)
+        else:
+            shutil.copytree(source_dir, tmp_path)
+
+        _write_json(os.path.join(tmp_path, MANIFEST_FILE), {
+            'version': version,
+            'fingerprint': fingerprint,
+            'created_at': time.time(),
+            'source': os.path.abspath(source_dir),
+            **(metadata or {})
+        })
+        os.rename(tmp_path, version_path(version, registry_dir))
+        logger.info(f"Registered model version {version} from {source_dir}")
+    else:
+        logger.info(f"Model in {source_dir} is already registered as {version}")
+        if move:
+            shutil.rmtree(source_dir, ignore_errors=True)
+
+    if activate:
+        activate_version(version, registry_dir)
+    return version
+
+
+def activate_version(version, registry_dir=None):
+    """
+    Make ``version`` the active one; the current active version becomes previous.
+    """
+    if not os.path.isdir(version_path(version, registry_dir)):
+        raise ValueError(f"Unknown model version: {version}")
+
+    with _state_lock:
+        state = read_state(registry_dir)
+        if state.get('active') != version:
+            state['previous'] = state.get('active')
+            state['active'] = version
+            _write_state(state, registry_dir)
+    logger.info(f"Model version {version} is now active")
+    return version
+
+
+def rollback(registry_dir=None):
+    """
+    Swap the active and previous versions.
+    Returns: The version that is now active.
+    """
+    with _state_lock:
+        state = read_state(registry_dir)
+        previous = state.get('previous')
+        if not previous or not os.path.isdir(version_path(previous, registry_dir)):
+            raise ValueError('No previous model version to roll back to')
+
+        state['active'], state['previous'] = previous, state.get('active')
+        _write_state(state, registry_dir)
+    logger.info(f"Rolled back to model version {previous}")
+    return previous
+
+
+def get_active(registry_dir=None):
+    """
+    Returns: (version, path) of the active version, or None if the registry is empty.
+    """
+    version = read_state(registry_dir).get('active')
+    if not version:
+        return None
+    path = version_path(version, registry_dir)
+    if not os.path.isdir(path):
+        logger.error(f"Active model version {version} is missing from {_versions_dir(registry_dir)}")
+        return None
+    return version, path
+
+
+def state_signature(registry_dir=None):
+    """Cheap change marker for registry.json (mtime), None if it does not exist."""
+    try:
+        return os.stat(os.path.join(registry_dir or REGISTRY_DIR, STATE_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def import_directory(path, registry_dir=None):
+    """
+    Register and activate a pre-registry model directory (e.g. ./fine_tuned_model)
+    if the registry has no active version yet.
+    Returns: The active version, or None.
+    """
+    active = get_active(registry_dir)
+    if active is not None:
+        return active[0]
+    if not os.path.isdir(path) or not os.listdir(path):
+        return None
+
+    logger.info(f"Importing existing model {path} into the registry...")
+    return register(path, metadata={'imported': True}, activate=True, registry_dir=registry_dir)
+
+
+def prune(keep=KEEP_VERSIONS, registry_dir=None):
+    """
+    Delete the oldest versions beyond ``keep``; active and previous are never deleted.
+    Returns: List of deleted versions.
+    """
+    state = read_state(registry_dir)
+    protected = {state.get('active'), state.get('previous')}
+
+    deleted = []
+    for manifest in list_versions(registry_dir)[keep:]:
+        version = manifest['version']
+        if version in protected:
+            continue
+        shutil.rmtree(version_path(version, registry_dir), ignore_errors=True)
+        deleted.append(version)
+        logger.info(f"Deleted model version {version}")
+    return deleted
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry")
+    parser.add_argument('--registry', default=REGISTRY_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('list', help='List registered versions')
+
+    reg = sub.add_parser('register', help='Register a saved model directory')
+    reg.add_argument('path')
+    reg.add_argument('--activate', action='store_true')
+
+    act = sub.add_parser('activate', help='Promote a version')
+    act.add_argument('version')
+
+    sub.add_parser('rollback', help='Switch back to the previous version')
+
+    prn = sub.add_parser('prune', help='Delete old versions')
+    prn.add_argument('--keep', type=int, default=KEEP_VERSIONS)
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for manifest in list_versions(args.registry):
+            flag = 'active' if manifest['active'] else 'previous' if manifest['previous'] else ''
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest.get('created_at', 0)))
+            print(f"{manifest['version']:<32} {manifest['fingerprint']}  {created}  {flag}")
+    elif args.command == 'register':
+        print(register(args.path, activate=args.activate, registry_dir=args.registry))
+    elif args.command == 'activate':
+        print(activate_version(args.version, args.registry))
+    elif args.command == 'rollback':
+        print(rollback(args.registry))
+    elif args.command == 'prune':
+        deleted = prune(args.keep, args.registry)
+        print(f"Deleted {len(deleted)} versions")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from extensions import db
+import json
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -36,8 +37,21 @@ class Analysis(db.Model):
     sentiment = db.Column(db.String(20), nullable=False)
     confidence = db.Column(db.Float, nullable=True) # Will be used with IndoBERT
     correction = db.Column(db.String(20), nullable=True) # User feedback
+    corrected_at = db.Column(db.DateTime, nullable=True, index=True) # Watermark for incremental training
+    source = db.Column(db.String(255), nullable=True) # 'file:<name>' / 'url:<url>' for saved batch and scrape runs
+    text_hash = db.Column(db.String(64), nullable=True) # prediction_cache.text_hash of the text
+    model_fingerprint = db.Column(db.String(64), nullable=True) # Model that scored it
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest first
+        db.Index('ix_analyses_user_created', 'user_id', 'created_at', 'id'),
+        # Re-opening a saved run
+        db.Index('ix_analyses_user_source', 'user_id', 'source', 'created_at', 'id'),
+        # Reusing stored results for identical texts
+        db.Index('ix_analyses_user_text_hash', 'user_id', 'text_hash'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -45,5 +59,151 @@ class Analysis(db.Model):
             'sentiment': self.sentiment,
             'confidence': self.confidence,
             'correction': self.correction,
+            'source': self.source,
             'created_at': self.created_at.isoformat()
         }
+
+class TermCount(db.Model):
+    """Word cloud term frequencies, maintained by term_index on every analysis write"""
+    __tablename__ = 'term_counts'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True) # 'YYYY-MM-DD' or '*' (all time)
+    sentiment = db.Column(db.String(20), primary_key=True) # or '*' (all sentiments)
+    term = db.Column(db.String(64), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Top-N terms of a user, period and sentiment straight from the index
+        db.Index('ix_term_counts_top', 'user_id', 'period', 'sentiment', 'count'),
+    )
+
+class SentimentDailyCount(db.Model):
+    """Analyses per user, day and sentiment, maintained by rollups on every analysis write"""
+    __tablename__ = 'sentiment_daily_counts'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.String(10), primary_key=True) # 'YYYY-MM-DD' (UTC)
+    sentiment = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Trends over all users
+        db.Index('ix_sentiment_daily_counts_day', 'day', 'sentiment'),
+    )
+
+class SavedRunStatus(db.Model):
+    """How the latest saved run of a source ended, maintained by saved_runs.SavedRun"""
+    __tablename__ = 'saved_run_status'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    source = db.Column(db.String(255), primary_key=True) # Analysis.source of the run's rows
+    status = db.Column(db.String(20), nullable=False) # 'running', 'completed' or 'partial'
+    error = db.Column(db.Text, nullable=True) # Why a partial run stopped
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'error': self.error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class BatchJob(db.Model):
+    __tablename__ = 'batch_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    input_path = db.Column(db.String(512), nullable=False)
+    output_path = db.Column(db.String(512), nullable=True)
+    save_to_history = db.Column(db.Boolean, nullable=False, default=False)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    total_rows = db.Column(db.Integer, nullable=True) # Estimated for CSV files
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    scored_rows = db.Column(db.Integer, nullable=False, default=0)
+    stats = db.Column(db.Text, nullable=True) # JSON: counts per sentiment
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(120), nullable=True) # host:pid that queued / runs the job
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        progress = None
+        if self.status == 'completed':
+            progress = 1.0
+        elif self.total_rows:
+            progress = min(self.processed_rows / self.total_rows, 1.0)
+
+        return {
+            'id': self.id,
+            'status': self.status,
+            'filename': self.filename,
+            'save_to_history': self.save_to_history,
+            'cancel_requested': self.cancel_requested,
+            'total_rows': self.total_rows,
+            'processed_rows': self.processed_rows,
+            'scored_rows': self.scored_rows,
+            'progress': progress,
+            'stats': json.loads(self.stats) if self.stats else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class TrainingJob(db.Model):
+    __tablename__ = 'training_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    data_path = db.Column(db.String(512), nullable=True) # None = train on corrections
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    epoch = db.Column(db.Float, nullable=True)
+    num_epochs = db.Column(db.Float, nullable=True)
+    step = db.Column(db.Integer, nullable=False, default=0)
+    total_steps = db.Column(db.Integer, nullable=True)
+    loss = db.Column(db.Float, nullable=True)
+    eta_seconds = db.Column(db.Float, nullable=True)
+    message = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    version = db.Column(db.String(64), nullable=True) # Registered model version
+    pid = db.Column(db.Integer, nullable=True)
+    worker = db.Column(db.String(120), nullable=True) # host:pid of the supervising app worker
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        progress = None
+        if self.status == 'completed':
+            progress = 1.0
+        elif self.total_steps:
+            progress = min(self.step / self.total_steps, 1.0)
+
+        return {
+            'id': self.id,
+            'status': self.status,
+            'source': 'csv' if self.data_path else 'corrections',
+            'cancel_requested': self.cancel_requested,
+            'epoch': self.epoch,
+            'num_epochs': self.num_epochs,
+            'step': self.step,
+            'total_steps': self.total_steps,
+            'progress': progress,
+            'loss': self.loss,
+            'eta_seconds': self.eta_seconds,
+            'message': self.message,
+            'error': self.error,
+            'version': self.version,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,150 @@
+"""
+ONNX Runtime inference backend.
+
+Exports a loaded sequence classification model (fine-tuned or base) to ONNX
+once, caches the graph on disk keyed by the model fingerprint, and serves it
+through ONNX Runtime with all graph optimizations enabled.
+
+OnnxSentimentClassifier is called like the transformers "sentiment-analysis"
+pipeline (list of texts in, list of {'label', 'score'} out), so model_loader
+can use either backend interchangeably.
+
+Works with any local model directory; verify_onnx.py checks the export
+against PyTorch on a tiny randomly initialized one.
+"""
+
+import logging
+import os
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+ONNX_OPSET = 14
+INPUT_NAMES = ('input_ids', 'attention_mask', 'token_type_ids')
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Wraps a HF model so the exported graph has a single 'logits' output."""
+
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs)), return_dict=True).logits
+
+
+def export_to_onnx(model, tokenizer, output_path, opset=ONNX_OPSET):
+    """
+    Export a sequence classification model to ONNX with dynamic batch and sequence axes.
+    The file is written to a temporary path first and renamed into place.
+    """
+    model.eval()
+    sample = tokenizer(["contoh teks untuk ekspor"], return_tensors='pt')
+    input_names = [name for name in INPUT_NAMES if name in sample]
+
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['logits'] = {0: 'batch'}
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tmp_path = f"{output_path}.tmp-{os.getpid()}"
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _LogitsOnly(model, input_names),
+            tuple(sample[name] for name in input_names),
+            tmp_path,
+            input_names=input_names,
+            output_names=['logits'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    os.replace(tmp_path, output_path)
+    logger.info(f"Exported ONNX model to {output_path}")
+
+
+class OnnxSentimentClassifier:
+    """
+    Sentiment classifier served by ONNX Runtime.
+
+    Args:
+        onnx_path (str): Path to the exported graph.
+        tokenizer: The model's (HF) tokenizer.
+        id2label (dict): Class index -> label, from the model config.
+        num_threads (int, optional): intra-op threads for ONNX Runtime.
+    """
+
+    def __init__(self, onnx_path, tokenizer, id2label, num_threads=None):
+        self.onnx_path = onnx_path
+        self.tokenizer = tokenizer
+        self.id2label = {int(k): v for k, v in id2label.items()}
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self._input_names = [i.name for i in self.session.get_inputs()]
+
+    def _run(self, texts, truncation, max_length):
+        with timed('tokenize'):
+            encoded = self.tokenizer(
+                texts,
+                padding=True,
+                truncation=truncation,
+                max_length=max_length,
+                return_tensors='np'
+            )
+        feeds = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        with timed('forward'):
+            logits = self.session.run(['logits'], feeds)[0]
+
+        # Softmax, as the transformers pipeline does for multi-class models
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=-1, keepdims=True)
+
+        best = probs.argmax(axis=-1)
+        return [
+            {'label': self.id2label[int(i)], 'score': float(p[i])}
+            for i, p in zip(best, probs)
+        ]
+
+    def __call__(self, texts, truncation=True, max_length=512, batch_size=None):
+        if isinstance(texts, str):
+            texts = [texts]
+        batch_size = batch_size or len(texts) or 1
+
+        results = []
+        for start in range(0, len(texts), batch_size):
+            results.extend(self._run(texts[start:start + batch_size], truncation, max_length))
+        return results
+
+
+def load_onnx_classifier(model, tokenizer, cache_dir, fingerprint, num_threads=None):
+    """
+    Get an ONNX classifier for a loaded model, exporting it only if the graph for
+    this fingerprint is not cached yet. Graphs of older fingerprints are removed.
+    """
+    onnx_path = os.path.join(cache_dir, f"model-{fingerprint}.onnx")
+
+    if not os.path.exists(onnx_path):
+        logger.info(f"No cached ONNX graph for model {fingerprint}, exporting...")
+        export_to_onnx(model, tokenizer, onnx_path)
+
+        for name in os.listdir(cache_dir):
+            if name.endswith('.onnx') and name != os.path.basename(onnx_path):
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                except OSError as e:
+                    logger.warning(f"Could not remove stale ONNX graph {name}: {e}")
+
+    return OnnxSentimentClassifier(onnx_path, tokenizer, model.config.id2label, num_threads=num_threads)
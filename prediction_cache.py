@@ -0,0 +1,121 @@
+"""
+Bounded in-memory LRU cache for model predictions.
+
+Entries are keyed by a hash of the normalized text plus the fingerprint of the
+model that produced them, so a reloaded model never serves stale results.
+"""
+
+import hashlib
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """Normalize unicode form and whitespace so trivially different copies share a key."""
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+
+def text_hash(text):
+    """SHA-256 hex digest of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def _estimate_size(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(_estimate_size(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    return size
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with optional TTL, bounded by entry count and bytes.
+
+    Args:
+        max_entries (int): Maximum number of entries (0 = unbounded).
+        max_bytes (int): Approximate maximum memory for keys and values (0 = unbounded).
+        ttl (float): Seconds before an entry expires (0 = never).
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=0):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+
+        self._data = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached value, or None on a miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = _estimate_size(key) + _estimate_size(value)
+        if self.max_bytes and size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+
+            while self._data and (
+                (self.max_entries and len(self._data) > self.max_entries)
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            }
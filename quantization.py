@@ -0,0 +1,172 @@
+"""
+Dynamic INT8 quantization for CPU inference.
+
+Linear layers are quantized to INT8 after loading. The quantized state dict is
+persisted next to the model config, so later startups rebuild the (random)
+model skeleton from the config, quantize it and load the INT8 weights without
+ever reading the fp32 weights again.
+
+Agreement check against the fp32 model:
+    python quantization.py compare --csv dummy_train.csv
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import time
+
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_WEIGHTS = "quantized_int8.pt"
+
+
+def quantize_dynamic_int8(model):
+    """Return a copy of the model with nn.Linear layers dynamically quantized to INT8."""
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def save_quantized(qmodel, artifact_dir):
+    """Persist the quantized weights and config; written to a temp file and renamed into place."""
+    os.makedirs(artifact_dir, exist_ok=True)
+    qmodel.config.save_pretrained(artifact_dir)
+
+    path = os.path.join(artifact_dir, QUANTIZED_WEIGHTS)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    torch.save(qmodel.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"Saved INT8 model to {artifact_dir}")
+
+
+def load_quantized(artifact_dir, config=None):
+    """Rebuild a quantized model from a persisted artifact."""
+    if config is None:
+        config = AutoConfig.from_pretrained(artifact_dir)
+
+    skeleton = AutoModelForSequenceClassification.from_config(config)
+    qmodel = quantize_dynamic_int8(skeleton)
+    state_dict = torch.load(os.path.join(artifact_dir, QUANTIZED_WEIGHTS), map_location='cpu')
+    qmodel.load_state_dict(state_dict)
+    qmodel.eval()
+    return qmodel
+
+
+def load_or_quantize(target_model, artifact_dir, config=None):
+    """
+    Load the persisted INT8 model from artifact_dir, or quantize the fp32 model
+    at target_model and persist it there.
+    """
+    if os.path.exists(os.path.join(artifact_dir, QUANTIZED_WEIGHTS)):
+        try:
+            logger.info(f"Loading INT8 model from {artifact_dir}...")
+            return load_quantized(artifact_dir, config)
+        except Exception as e:
+            logger.warning(f"Failed to load INT8 artifact, re-quantizing: {e}")
+
+    logger.info(f"Quantizing {target_model} to INT8...")
+    model = AutoModelForSequenceClassification.from_pretrained(target_model)
+    qmodel = quantize_dynamic_int8(model)
+    del model
+
+    try:
+        save_quantized(qmodel, artifact_dir)
+    except Exception as e:
+        logger.warning(f"Could not persist INT8 model: {e}")
+    return qmodel
+
+
+def _state_dict_bytes(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def _predict_probs(model, tokenizer, texts, batch_size):
+    probs = []
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            encoded = tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=512,
+                return_tensors='pt'
+            )
+            probs.append(torch.softmax(model(**encoded).logits, dim=-1))
+    return torch.cat(probs)
+
+
+def compare(target_model, csv_path, text_column='text', limit=None, batch_size=32):
+    """
+    Compare the INT8 model against the fp32 model on a reference CSV.
+
+    Returns:
+        dict: Label agreement, confidence drift, model size and latency of both models.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    texts = df[text_column].astype(str).tolist()
+    if limit:
+        texts = texts[:limit]
+
+    tokenizer = AutoTokenizer.from_pretrained(target_model)
+    fp32 = AutoModelForSequenceClassification.from_pretrained(target_model)
+    fp32.eval()
+    int8 = quantize_dynamic_int8(fp32)
+
+    start = time.perf_counter()
+    fp32_probs = _predict_probs(fp32, tokenizer, texts, batch_size)
+    fp32_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    int8_probs = _predict_probs(int8, tokenizer, texts, batch_size)
+    int8_seconds = time.perf_counter() - start
+
+    fp32_conf, fp32_labels = fp32_probs.max(dim=-1)
+    int8_conf, int8_labels = int8_probs.max(dim=-1)
+    drift = (fp32_conf - int8_conf).abs()
+
+    return {
+        'model': target_model,
+        'samples': len(texts),
+        'label_agreement': float((fp32_labels == int8_labels).float().mean()),
+        'confidence_drift_mean': float(drift.mean()),
+        'confidence_drift_max': float(drift.max()),
+        'fp32_size_mb': _state_dict_bytes(fp32) / 1e6,
+        'int8_size_mb': _state_dict_bytes(int8) / 1e6,
+        'fp32_seconds': fp32_seconds,
+        'int8_seconds': int8_seconds,
+        'speedup': fp32_seconds / int8_seconds if int8_seconds else None,
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Dynamic INT8 quantization tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    cmp = sub.add_parser('compare', help='Report INT8 vs fp32 agreement on a reference CSV')
+    cmp.add_argument('--csv', default='dummy_train.csv')
+    cmp.add_argument('--text-column', default='text')
+    cmp.add_argument('--model', default=None, help='Model dir or name (default: the model the app loads)')
+    cmp.add_argument('--limit', type=int, default=None)
+    cmp.add_argument('--batch-size', type=int, default=32)
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        from model_loader import resolve_target_model
+        target_model = args.model or resolve_target_model()
+        report = compare(target_model, args.csv, args.text_column, args.limit, args.batch_size)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
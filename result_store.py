@@ -0,0 +1,256 @@
+"""
+Persistent on-disk prediction store shared by all workers and restarts.
+
+A small SQLite database in WAL mode, keyed by (model fingerprint, text hash).
+Workers look texts up here before running the model and write new predictions
+back afterwards, so a restarted or freshly forked worker starts warm.
+
+Usage:
+    python result_store.py stats
+    python result_store.py compact [--keep-model FINGERPRINT] [--max-age-days 30]
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = os.environ.get('SENTIMENT_RESULT_STORE', os.path.join('instance', 'prediction_store.db'))
+STORE_MAX_ENTRIES = int(os.environ.get('SENTIMENT_RESULT_STORE_MAX_ENTRIES', '1000000'))
+
+# Only refresh last_access on reads when it is older than this (seconds),
+# so hot entries do not turn every read into a write
+ACCESS_REFRESH_INTERVAL = 3600
+
+# Check the size bound every N written rows
+EVICTION_CHECK_EVERY = 1000
+
+# SQLite host parameter limit is 999 on older builds
+_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    sentiment TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    last_access INTEGER NOT NULL,
+    PRIMARY KEY (model, text_hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_predictions_last_access ON predictions (last_access);
+"""
+
+
+class ResultStore:
+    """
+    SQLite-backed prediction store.
+
+    Args:
+        path (str): Database file path.
+        max_entries (int): Size bound; least recently used rows are evicted beyond it.
+    """
+
+    def __init__(self, path=STORE_PATH, max_entries=STORE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = int(max_entries)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_since_check = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; never reuse a connection inherited across fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, model, text_hashes):
+        """
+        Look up predictions for a model.
+
+        Returns:
+            dict: text_hash -> (sentiment, confidence) for the hashes found.
+        """
+        if not text_hashes:
+            return {}
+
+        conn = self._connection()
+        found = {}
+        stale = []
+        now = int(time.time())
+
+        unique = list(dict.fromkeys(text_hashes))
+        for start in range(0, len(unique), _CHUNK):
+            chunk = unique[start:start + _CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f"SELECT text_hash, sentiment, confidence, last_access FROM predictions "
+                f"WHERE model = ? AND text_hash IN ({placeholders})",
+                [model] + chunk
+            ).fetchall()
+            for text_hash, sentiment, confidence, last_access in rows:
+                found[text_hash] = (sentiment, confidence)
+                if now - last_access > ACCESS_REFRESH_INTERVAL:
+                    stale.append(text_hash)
+
+        if stale:
+            for start in range(0, len(stale), _CHUNK):
+                chunk = stale[start:start + _CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                conn.execute(
+                    f"UPDATE predictions SET last_access = ? WHERE model = ? AND text_hash IN ({placeholders})",
+                    [now, model] + chunk
+                )
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, model, items):
+        """
+        Store predictions for a model.
+
+        Args:
+            items (list): (text_hash, sentiment, confidence) tuples.
+        """
+        if not items:
+            return
+
+        now = int(time.time())
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO predictions (model, text_hash, sentiment, confidence, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(model, h, sentiment, float(confidence), now) for h, sentiment, confidence in items]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self.writes += len(items)
+            self._writes_since_check += len(items)
+            check = self._writes_since_check >= EVICTION_CHECK_EVERY
+            if check:
+                self._writes_since_check = 0
+
+        if check:
+            self.evict()
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def evict(self):
+        """Delete least recently used rows beyond max_entries. Returns number of rows deleted."""
+        if not self.max_entries:
+            return 0
+
+        conn = self._connection()
+        excess = self.count() - self.max_entries
+        if excess <= 0:
+            return 0
+
+        conn.execute(
+            "DELETE FROM predictions WHERE (model, text_hash) IN ("
+            "SELECT model, text_hash FROM predictions ORDER BY last_access LIMIT ?)",
+            (excess,)
+        )
+        with self._lock:
+            self.evictions += excess
+        logger.info(f"Evicted {excess} rows from prediction store")
+        return excess
+
+    def compact(self, keep_models=None, max_age_days=None):
+        """
+        Drop rows of other models and/or rows not accessed recently, enforce the
+        size bound, then reclaim disk space.
+
+        Returns:
+            dict: Row counts before and after.
+        """
+        conn = self._connection()
+        before = self.count()
+
+        if keep_models:
+            placeholders = ','.join('?' * len(keep_models))
+            conn.execute(f"DELETE FROM predictions WHERE model NOT IN ({placeholders})", list(keep_models))
+
+        if max_age_days:
+            cutoff = int(time.time() - max_age_days * 86400)
+            conn.execute("DELETE FROM predictions WHERE last_access < ?", (cutoff,))
+
+        self.evict()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('VACUUM')
+
+        return {'before': before, 'after': self.count()}
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'path': self.path,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Manage the persistent prediction store")
+    parser.add_argument('--path', default=STORE_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('stats', help='Show row counts per model')
+
+    compact = sub.add_parser('compact', help='Evict old rows and reclaim disk space')
+    compact.add_argument('--keep-model', action='append', default=None,
+                         help='Model fingerprint to keep (repeatable); rows of other models are dropped')
+    compact.add_argument('--max-age-days', type=float, default=None,
+                         help='Drop rows not accessed in this many days')
+
+    args = parser.parse_args()
+    store = ResultStore(args.path)
+
+    if args.command == 'stats':
+        rows = store._connection().execute(
+            "SELECT model, COUNT(*) FROM predictions GROUP BY model ORDER BY COUNT(*) DESC"
+        ).fetchall()
+        print(f"{store.path}: {sum(c for _, c in rows)} rows")
+        for model, count in rows:
+            print(f"  {model}: {count}")
+    elif args.command == 'compact':
+        result = store.compact(keep_models=args.keep_model, max_age_days=args.max_age_days)
+        print(f"Compacted {store.path}: {result['before']} -> {result['after']} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Daily sentiment rollups behind /api/stats/trend.
+
+sentiment_daily_counts holds one row per (user, day, sentiment) with the
+number of analyses, updated in the same transaction as every analysis write.
+A trend over 90 days reads at most 270 rows per user, however many analyses
+there are.
+
+Rows written before the rollups existed are picked up with:
+    python rollups.py rebuild [--user USER_ID]
+"""
+
+import argparse
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models import Analysis, SentimentDailyCount
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_LABELS = ['Positif', 'Negatif', 'Netral']
+TREND_RANGES = (7, 30, 90)
+TREND_BUCKETS = ('day', 'week')
+
+
+def _deltas(rows, sign):
+    deltas = Counter()
+    for row in rows:
+        if row.get('user_id') is None:
+            continue
+        day = (row.get('created_at') or datetime.utcnow()).strftime('%Y-%m-%d')
+        deltas[(row['user_id'], day, row.get('sentiment'))] += sign
+    return deltas
+
+
+def apply(connection, rows, sign=1):
+    """
+    Count inserted (sign=1) or deleted (sign=-1) analysis rows.
+    Runs on the caller's connection, inside its transaction.
+
+    Args:
+        rows (iterable): Dicts with user_id, sentiment, created_at.
+    """
+    params = [
+        {'user_id': user_id, 'day': day, 'sentiment': sentiment, 'count': count}
+        for (user_id, day, sentiment), count in _deltas(rows, sign).items()
+        if count
+    ]
+    if not params:
+        return
+
+    table = SentimentDailyCount.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'day', 'sentiment'],
+        set_={'count': table.c.count + stmt.excluded['count']}
+    )
+    connection.execute(stmt, params)
+
+    if sign < 0:
+        users = {p['user_id'] for p in params}
+        connection.execute(table.delete().where(table.c.count <= 0, table.c.user_id.in_(users)))
+
+
+def _bucket_start(day, bucket):
+    return day - timedelta(days=day.weekday()) if bucket == 'week' else day
+
+
+def count_analyses(user_id=None):
+    """Number of analyses of a user (or of everyone), summed from the rollups."""
+    query = db.session.query(func.coalesce(func.sum(SentimentDailyCount.count), 0))
+    if user_id is not None:
+        query = query.filter(SentimentDailyCount.user_id == user_id)
+    return query.scalar()
+
+
+def trend(user_id=None, days=7, bucket='day'):
+    """
+    Sentiment counts of the last ``days`` days (today included).
+
+    Args:
+        user_id (int, optional): One user; None sums over all users.
+        bucket (str): 'day', or 'week' (buckets labelled with their Monday).
+
+    Returns:
+        dict: {'dates': [...], 'Positif': [...], 'Negatif': [...], 'Netral': [...]}
+    """
+    today = datetime.utcnow().date()
+    first = today - timedelta(days=days - 1)
+
+    query = db.session.query(
+        SentimentDailyCount.day,
+        SentimentDailyCount.sentiment,
+        func.sum(SentimentDailyCount.count)
+    ).filter(SentimentDailyCount.day >= first.strftime('%Y-%m-%d'))
+    if user_id is not None:
+        query = query.filter(SentimentDailyCount.user_id == user_id)
+    results = query.group_by(SentimentDailyCount.day, SentimentDailyCount.sentiment).all()
+
+    dates = []
+    for i in range(days):
+        label = _bucket_start(first + timedelta(days=i), bucket).strftime('%Y-%m-%d')
+        if not dates or dates[-1] != label:
+            dates.append(label)
+    data_map = {d: dict.fromkeys(SENTIMENT_LABELS, 0) for d in dates}
+
+    for day, sentiment, count in results:
+        label = _bucket_start(datetime.strptime(day, '%Y-%m-%d').date(), bucket).strftime('%Y-%m-%d')
+        if label in data_map and sentiment in data_map[label]:
+            data_map[label][sentiment] += count
+
+    return {
+        'dates': dates,
+        **{s: [data_map[d][s] for d in dates] for s in SENTIMENT_LABELS}
+    }
+
+
+def rebuild(user_id=None, connection=None):
+    """
+    Recompute the rollups from the analyses table (all users or one) with a
+    single INSERT ... SELECT. Commits unless it runs on the caller's ``connection``.
+    Returns: Number of rollup rows written.
+    """
+    commit = connection is None
+    connection = connection or db.session.connection()
+
+    table = SentimentDailyCount.__table__
+    delete = table.delete()
+    day = func.date(Analysis.created_at)
+    source = select(
+        Analysis.user_id, day, Analysis.sentiment, func.count(Analysis.id)
+    ).group_by(Analysis.user_id, day, Analysis.sentiment)
+    if user_id is not None:
+        delete = delete.where(table.c.user_id == user_id)
+        source = source.where(Analysis.user_id == user_id)
+
+    connection.execute(delete)
+    result = connection.execute(
+        table.insert().from_select(['user_id', 'day', 'sentiment', 'count'], source)
+    )
+    if commit:
+        db.session.commit()
+    logger.info(f"Sentiment rollups rebuilt: {result.rowcount} rows")
+    return result.rowcount
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Maintain the daily sentiment rollups")
+    sub = parser.add_subparsers(dest='command', required=True)
+    reb = sub.add_parser('rebuild', help='Recompute the rollups from the analyses table')
+    reb.add_argument('--user', type=int, default=None, help='Only this user id')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.command == 'rebuild':
+            print(f"Wrote {rebuild(args.user)} rollup rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Batch and scrape runs saved to the user's history.
+
+Authenticated /api/batch-classify, /api/scrape and batch jobs store their
+results as Analysis rows tagged with a source ("file:<name>", "url:<url>"),
+written with bulk inserts. Every row also keeps the hash of its text and the
+fingerprint of the model that scored it ('student:...' for texts the cascade's
+student model answered, which are never reused as transformer results), so:
+
+- texts the user already has a result for from the serving model are taken
+  from the database instead of being scored again;
+- uploading the same file again does not duplicate its rows;
+- a saved run is re-opened with GET /api/history?source=... (a database read).
+
+Rows are saved chunk by chunk as a run progresses, so the saved_run_status
+table records how the latest run of each source ended: 'running' while rows
+are being saved, then 'completed', or 'partial' (with the error) when it
+failed, was cancelled or the client went away midway. A run whose process
+died stays 'running', except batch jobs, which are marked partial when they
+are found stale.
+"""
+
+import logging
+import os
+from datetime import datetime
+
+from extensions import db
+from history import bulk_insert_analyses
+from metrics import timed
+from model_loader import predict_sentiment_bulk, get_model_fingerprint
+from models import Analysis, SavedRunStatus
+from prediction_cache import text_hash
+
+logger = logging.getLogger(__name__)
+
+SOURCE_MAX_LENGTH = 255
+# Text hashes per IN (...) lookup (SQLite host parameter limit)
+LOOKUP_CHUNK_SIZE = 500
+
+
+def file_source(filename):
+    return f"file:{os.path.basename(filename)}"[:SOURCE_MAX_LENGTH]
+
+
+def url_source(url):
+    return f"url:{url.strip()}"[:SOURCE_MAX_LENGTH]
+
+
+class SavedRun:
+    """
+    Scores the texts of one run for a user, reusing their stored results, and
+    saves the new ones under the run's source tag.
+
+    Args:
+        user_id (int): Owner of the saved rows.
+        source (str): Source tag, see file_source() / url_source().
+        student_threshold (float, optional): Cascade threshold for texts that are scored.
+    """
+
+    def __init__(self, user_id, source, student_threshold=None):
+        self.user_id = user_id
+        self.source = source
+        self.student_threshold = student_threshold
+        self.reused = 0
+        self.scored = 0
+        self.saved = 0
+        # Text hash -> fingerprint of the model behind the result, for save()
+        self._answered_by = {}
+        # None until rows are saved, then 'running', 'completed' or 'partial'
+        self.status = None
+        self._started_at = None
+        # Text hashes stored under this source before the run, and by the run itself
+        self._existing = set()
+        self._inserted = set()
+
+    def _lookup(self, hashes, fingerprint):
+        """Stored results of the serving model for these text hashes: {hash: (sentiment, confidence)}"""
+        stored = {}
+        hashes = list(hashes)
+        for start in range(0, len(hashes), LOOKUP_CHUNK_SIZE):
+            rows = db.session.query(
+                Analysis.text_hash, Analysis.sentiment, Analysis.confidence,
+                Analysis.source, Analysis.model_fingerprint
+            ).filter(
+                Analysis.user_id == self.user_id,
+                Analysis.text_hash.in_(hashes[start:start + LOOKUP_CHUNK_SIZE])
+            ).all()
+            for h, sentiment, confidence, source, model_fingerprint in rows:
+                if source == self.source and h not in self._inserted:
+                    self._existing.add(h)
+                if fingerprint is not None and model_fingerprint == fingerprint:
+                    stored[h] = (sentiment, confidence)
+        return stored
+
+    def predict(self, texts):
+        """
+        Same contract as predict_sentiment_bulk: [(sentiment, confidence), ...]
+        """
+        if not texts:
+            return []
+
+        hashes = [text_hash(text) for text in texts]
+        fingerprint = get_model_fingerprint()
+        stored = self._lookup(set(hashes), fingerprint)
+        missing = [text for text, h in zip(texts, hashes) if h not in stored]
+
+        answered_by = []
+        predictions = predict_sentiment_bulk(
+            missing, student_threshold=self.student_threshold, answered_by=answered_by
+        ) if missing else []
+        scored = iter(zip(predictions, answered_by))
+
+        # Only the results of the latest predict() call are saved next
+        self._answered_by = {}
+        results = []
+        for h in hashes:
+            if h in stored:
+                results.append(stored[h])
+                self._answered_by[h] = fingerprint
+            else:
+                prediction, self._answered_by[h] = next(scored)
+                results.append(prediction)
+        self.reused += len(texts) - len(missing)
+        self.scored += len(missing)
+        return results
+
+    def save(self, records):
+        """
+        Bulk insert scored records (dicts with text, sentiment, confidence) and
+        commit. Texts already saved under this source by an earlier run are skipped.
+        A failed write is logged and does not fail the run.
+        """
+        rows = []
+        for record in records:
+            h = text_hash(record['text'])
+            if h in self._existing:
+                continue
+            rows.append({
+                'user_id': self.user_id,
+                'text': record['text'],
+                'sentiment': record['sentiment'],
+                'confidence': record['confidence'],
+                'source': self.source,
+                'text_hash': h,
+                'model_fingerprint': self._answered_by.get(h)
+            })
+        if not rows:
+            return
+
+        try:
+            with timed('db_commit'):
+                if self.status is None:
+                    # Recorded with the first rows, until finish() says how the run ended
+                    self._started_at = datetime.utcnow()
+                    self._record_status('running')
+                bulk_insert_analyses(rows)
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Failed to save {len(rows)} results of {self.source} to history: {e}")
+            return
+        self.status = 'running'
+        self._inserted.update(row['text_hash'] for row in rows)
+        self.saved += len(rows)
+
+    def finish(self, error=None):
+        """
+        Record how the run ended: 'completed', or 'partial' with the error when
+        it failed or was cancelled midway (the rows saved so far stay in
+        history). Only the first call counts; no-op if no rows were saved.
+        """
+        if self.status != 'running':
+            return
+        status = 'partial' if error else 'completed'
+        try:
+            self._record_status(status, error, finished_at=datetime.utcnow())
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Failed to record the end of saved run {self.source}: {e}")
+            return
+        self.status = status
+
+    def _record_status(self, status, error=None, finished_at=None):
+        db.session.merge(SavedRunStatus(
+            user_id=self.user_id,
+            source=self.source,
+            status=status,
+            error=error,
+            started_at=self._started_at,
+            finished_at=finished_at
+        ))
+
+    def summary(self):
+        return {
+            'source': self.source, 'reused': self.reused, 'scored': self.scored, 'saved': self.saved,
+            'status': self.status
+        }
+
+
+def mark_partial(user_id, source, error):
+    """
+    Mark a run still recorded as running as partial, when its process is
+    found dead. The caller commits.
+    """
+    SavedRunStatus.query.filter_by(user_id=user_id, source=source, status='running').update({
+        'status': 'partial',
+        'error': error,
+        'finished_at': datetime.utcnow()
+    })
@@ -1,27 +1,290 @@
-from youtube_comment_downloader import YoutubeCommentDownloader
-from itertools import islice
+"""
+YouTube comment ingestion.
 
-def get_youtube_comments(url, limit=20):
+Comments are fetched newest first (sort_by=1) and cached per video id. Within
+SCRAPE_CACHE_TTL seconds a repeated request is answered from the cache; after
+that, a refresh only downloads the comments newer than the newest cached one
+(and older ones if more are asked for than the cache holds).
+
+Several videos are fetched concurrently by a bounded thread pool, and their
+comments are handed over in small batches as they arrive, so scoring starts
+while later pages are still downloading.
+
+The downloader is injectable: Scraper(downloader_factory=...) accepts any
+callable returning an object with get_comments_from_url(url, sort_by=...),
+such as the fake in verify_scraper.py; set_scraper() installs it for the app.
+"""
+
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Videos fetched at the same time, across all requests of this worker
+SCRAPE_WORKERS = int(os.environ.get('SCRAPE_WORKERS', '4'))
+SCRAPE_CACHE_TTL = float(os.environ.get('SCRAPE_CACHE_TTL', '300'))
+SCRAPE_CACHE_MAX_VIDEOS = int(os.environ.get('SCRAPE_CACHE_MAX_VIDEOS', '256'))
+# Comments kept per cached video
+MAX_CACHED_COMMENTS = int(os.environ.get('SCRAPE_MAX_CACHED_COMMENTS', '2000'))
+
+# sort_by=0 (popular), sort_by=1 (newest)
+SORT_NEWEST = 1
+
+# Batches waiting for the consumer before fetchers pause
+PIPELINE_QUEUE_SIZE = 64
+
+_VIDEO_ID_PATTERN = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})')
+
+
+def video_id(url):
+    """YouTube video id of a URL (the URL itself if it has none)."""
+    match = _VIDEO_ID_PATTERN.search(url)
+    return match.group(1) if match else url.strip()
+
+
+def _youtube_downloader():
+    # Imported on first use to keep app start-up fast
+    from youtube_comment_downloader import YoutubeCommentDownloader
+    return YoutubeCommentDownloader()
+
+
+class _CachedVideo:
+    __slots__ = ('comments', 'fetched_at', 'exhausted')
+
+    def __init__(self, comments, fetched_at, exhausted):
+        self.comments = comments # [(cid, text), ...], newest first
+        self.fetched_at = fetched_at
+        self.exhausted = exhausted # True if the video has no comments beyond these
+
+
+class CommentCache:
+    """
+    Per-video comment cache, LRU-bounded by number of videos.
+    Expired entries are kept: they are the starting point of incremental refreshes.
+    """
+
+    def __init__(self, ttl=SCRAPE_CACHE_TTL, max_videos=SCRAPE_CACHE_MAX_VIDEOS):
+        self.ttl = ttl
+        self.max_videos = max_videos
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_videos:
+                self._entries.popitem(last=False)
+
+    def is_fresh(self, entry):
+        return time.monotonic() - entry.fetched_at < self.ttl
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'videos': len(self._entries),
+            'hits': self.hits,
+            'refreshes': self.refreshes,
+            'misses': self.misses
+        }
+
+
+class Scraper:
     """
-    Fetches comments from a YouTube video URL.
-    
+    Cached, concurrent comment fetcher.
+
     Args:
-        url (str): The YouTube video URL.
-        limit (int): Maximum number of comments to fetch.
-        
-    Returns:
-        list: A list of comment texts.
+        downloader_factory (callable, optional): Returns a downloader with
+            get_comments_from_url(url, sort_by=...). Default: youtube_comment_downloader.
+            One downloader is created per fetching thread and reused.
+        cache (CommentCache, optional): Comment cache (a new one by default).
+        max_workers (int): Videos fetched concurrently.
     """
-    try:
-        downloader = YoutubeCommentDownloader()
-        # sort_by=0 (popular), sort_by=1 (newest)
-        comments = downloader.get_comments_from_url(url, sort_by=1)
-        
-        results = []
-        for comment in islice(comments, limit):
-            results.append(comment['text'])
-            
-        return results
-    except Exception as e:
-        print(f"Error scraping YouTube: {e}")
-        return []
+
+    def __init__(self, downloader_factory=None, cache=None, max_workers=SCRAPE_WORKERS):
+        self.downloader_factory = downloader_factory or _youtube_downloader
+        self.cache = cache if cache is not None else CommentCache()
+        self.max_workers = max_workers
+        self._local = threading.local()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _downloader(self):
+        downloader = getattr(self._local, 'downloader', None)
+        if downloader is None:
+            downloader = self._local.downloader = self.downloader_factory()
+        return downloader
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='scraper')
+        return self._executor
+
+    def iter_comments(self, url, limit, info=None):
+        """
+        Yields up to ``limit`` comment texts of a video, newest first, as they
+        are downloaded. ``info`` (dict) is filled with what happened: video_id,
+        from_cache, new (comments not seen before), error.
+        """
+        info = info if info is not None else {}
+        key = video_id(url)
+        info.update({'url': url, 'video_id': key, 'from_cache': False, 'new': 0, 'error': None})
+
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.is_fresh(entry) and (len(entry.comments) >= limit or entry.exhausted):
+            self.cache.hits += 1
+            info['from_cache'] = True
+            for _, text in entry.comments[:limit]:
+                yield text
+            return
+
+        if entry is not None:
+            self.cache.refreshes += 1
+        else:
+            self.cache.misses += 1
+        cached = entry.comments if entry is not None else []
+        known = {cid for cid, _ in cached}
+
+        fresh = []   # newer than anything cached
+        older = []   # beyond the cached ones, when more are asked for
+        yielded = 0
+        caught_up = False
+        exhausted = False
+        try:
+            comments = self._downloader().get_comments_from_url(url, sort_by=SORT_NEWEST)
+            for comment in comments:
+                cid = comment.get('cid') or comment['text']
+                if not caught_up:
+                    if cid in known:
+                        # Everything from here on is cached: serve it instead of downloading it
+                        caught_up = True
+                        for _, text in cached[:limit - yielded]:
+                            yield text
+                            yielded += 1
+                        if yielded >= limit:
+                            break
+                        continue
+                    fresh.append((cid, comment['text']))
+                elif cid in known:
+                    continue
+                else:
+                    older.append((cid, comment['text']))
+
+                yield comment['text']
+                yielded += 1
+                if yielded >= limit:
+                    break
+            else:
+                exhausted = True
+        except Exception as e:
+            logger.error(f"Error scraping YouTube ({url}): {e}")
+            info['error'] = str(e)
+            return
+
+        info['new'] = len(fresh) + len(older)
+        if caught_up:
+            if not older and not exhausted:
+                # Stopped inside the cached comments: what lies beyond them is unchanged
+                exhausted = entry.exhausted
+            comments = fresh + cached + older
+        else:
+            # The cached comments were not reached (limit hit first, or they are
+            # gone): keep only the contiguous newest ones
+            comments = fresh
+        self.cache.put(key, _CachedVideo(comments[:MAX_CACHED_COMMENTS], time.monotonic(), exhausted))
+
+    def iter_batches(self, urls, limit, batch_size):
+        """
+        Fetch several videos concurrently and yield their comments as they arrive:
+            ('comments', url, [text, ...])   up to batch_size texts
+            ('done', url, info)              once per url, see iter_comments()
+        Stopping the iteration stops the fetchers.
+        """
+        # One fetch per video, even if it is given under several URL forms
+        unique = {}
+        for url in urls:
+            unique.setdefault(video_id(url), url)
+        urls = list(unique.values())
+        events = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def put(event):
+            while not stop.is_set():
+                try:
+                    events.put(event, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def fetch(url):
+            info = {}
+            batch = []
+            try:
+                for text in self.iter_comments(url, limit, info):
+                    batch.append(text)
+                    if len(batch) >= batch_size:
+                        if not put(('comments', url, batch)):
+                            return
+                        batch = []
+                if batch:
+                    put(('comments', url, batch))
+            except Exception as e:
+                info['error'] = str(e)
+            finally:
+                put(('done', url, info))
+
+        executor = self._get_executor()
+        for url in urls:
+            executor.submit(fetch, url)
+
+        pending = len(urls)
+        try:
+            while pending:
+                event = events.get()
+                if event[0] == 'done':
+                    pending -= 1
+                yield event
+        finally:
+            stop.set()
+
+
+_scraper = None
+_scraper_lock = threading.Lock()
+
+
+def get_scraper():
+    """The worker-wide scraper, created on first use."""
+    global _scraper
+    with _scraper_lock:
+        if _scraper is None:
+            _scraper = Scraper()
+    return _scraper
+
+
+def set_scraper(scraper):
+    """Install a scraper (e.g. with a fake downloader); returns the previous one."""
+    global _scraper
+    with _scraper_lock:
+        previous, _scraper = _scraper, scraper
+    return previous
@@ -0,0 +1,64 @@
+"""
+Streaming responses: newline-delimited JSON or Server-Sent Events.
+
+Endpoints yield (event_type, payload) pairs; each pair is written to the
+client as soon as it is produced, so the first result does not wait for the
+last one and nothing accumulates in memory.
+"""
+
+import json
+
+from flask import Response, stream_with_context
+
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+
+def requested_stream_format(req):
+    """
+    Streaming format asked for by the client, or None for a regular JSON body.
+    Uses the ?stream=ndjson|sse query parameter, then the Accept header.
+    """
+    fmt = (req.args.get('stream') or '').lower()
+    if fmt in STREAM_FORMATS:
+        return fmt
+
+    accept = req.headers.get('Accept', '')
+    for name, mimetype in STREAM_FORMATS.items():
+        if mimetype in accept:
+            return name
+    return None
+
+
+def encode_event(event_type, payload, fmt):
+    if fmt == 'sse':
+        return f"event: {event_type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    return json.dumps({'type': event_type, **payload}, ensure_ascii=False) + "\n"
+
+
+def stream_events(events, fmt):
+    """
+    Build a streaming Response from an iterable of (event_type, payload).
+    The request context stays available to the generator (e.g. uploaded files),
+    including when the client disconnects: ``events`` is then closed in it, so
+    its finally blocks can still record an interrupted run.
+    """
+    def generate():
+        try:
+            for event_type, payload in events:
+                yield encode_event(event_type, payload, fmt)
+        finally:
+            if hasattr(events, 'close'):
+                events.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=STREAM_FORMATS[fmt],
+        headers={
+            'Cache-Control': 'no-cache',
+            # Ask reverse proxies (nginx) not to buffer the stream
+            'X-Accel-Buffering': 'no',
+        }
+    )
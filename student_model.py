@@ -0,0 +1,349 @@
+"""
+Fast student model for cascade inference.
+
+A TF-IDF + logistic regression classifier distilled from the transformer. It
+is trained on the transformer's own labels for the analysis history and
+dummy_train.csv. In cascade mode the student answers the texts it is
+confident about, and only ambiguous texts are escalated to the transformer.
+
+The confidence threshold is calibrated on a held-out split. It is the lowest
+threshold at which the texts the student keeps agree with the transformer at
+least TARGET_AGREEMENT of the time. Each endpoint can override it
+(SENTIMENT_CASCADE_THRESHOLDS="classify=0.95,batch=0.85").
+
+The student records the fingerprint of its teacher, and the cascade only uses
+it while that model is serving. After a model version is activated or rolled
+back, every text goes to the transformer until the student is retrained.
+
+Usage:
+    python student_model.py train [--csv dummy_train.csv] [--no-history] [--target-agreement 0.97]
+    python student_model.py report [--csv dummy_train.csv] [--threshold 0.9]
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STUDENT_PATH = os.environ.get('SENTIMENT_STUDENT_MODEL', './student_model.joblib')
+
+# Cascade mode: the student answers confident texts before the transformer
+CASCADE_ENABLED = os.environ.get('SENTIMENT_CASCADE', '0') == '1'
+# Per-endpoint thresholds, e.g. "classify=0.95,batch=0.85,scrape=0.9,jobs=0.85".
+# Endpoints without one use the calibrated threshold saved with the student.
+CASCADE_THRESHOLDS = {
+    name.strip(): float(value)
+    for name, _, value in (
+        item.partition('=') for item in os.environ.get('SENTIMENT_CASCADE_THRESHOLDS', '').split(',')
+    )
+    if name.strip() and value
+}
+
+TARGET_AGREEMENT = 0.97
+CALIBRATION_SPLIT = 0.2
+# Fewest calibration texts a threshold must keep to be trusted
+MIN_CALIBRATION_KEPT = 20
+# How often (seconds) to check STUDENT_PATH for a retrained student
+RELOAD_INTERVAL = 10.0
+
+REPORT_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99]
+
+_student = None
+_student_mtime = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+class StudentModel:
+    """
+    Args:
+        pipeline: Fitted scikit-learn pipeline (TF-IDF features + linear classifier).
+        threshold (float): Calibrated confidence above which the student answers.
+        metadata (dict): Teacher fingerprint, sample counts, calibration report.
+    """
+
+    def __init__(self, pipeline, threshold, metadata=None):
+        self.pipeline = pipeline
+        self.threshold = threshold
+        self.metadata = metadata or {}
+
+    @property
+    def fingerprint(self):
+        """Recorded as the model of the results it answers: 'student:<teacher>-<trained at>'"""
+        return f"student:{self.metadata.get('teacher_fingerprint')}-{int(self.metadata.get('created_at', 0))}"
+
+    def predict(self, texts):
+        """
+        Returns: List of (sentiment_label, confidence), in input order
+        """
+        if not texts:
+            return []
+        probabilities = self.pipeline.predict_proba(texts)
+        classes = self.pipeline.classes_
+        best = probabilities.argmax(axis=1)
+        return [(str(classes[i]), float(probabilities[row, i])) for row, i in enumerate(best)]
+
+    def save(self, path=STUDENT_PATH):
+        import joblib
+
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        joblib.dump({'pipeline': self.pipeline, 'threshold': self.threshold, 'metadata': self.metadata}, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=STUDENT_PATH):
+        import joblib
+
+        data = joblib.load(path)
+        return cls(data['pipeline'], data['threshold'], data.get('metadata'))
+
+
+def get_student():
+    """
+    The student model from STUDENT_PATH, or None if it has not been trained.
+    A retrained student file is picked up within RELOAD_INTERVAL seconds.
+    """
+    global _student, _student_mtime, _checked_at
+
+    now = time.monotonic()
+    if now - _checked_at < RELOAD_INTERVAL:
+        return _student
+
+    with _lock:
+        if now - _checked_at < RELOAD_INTERVAL:
+            return _student
+        _checked_at = now
+        try:
+            mtime = os.stat(STUDENT_PATH).st_mtime_ns
+        except FileNotFoundError:
+            if _student is not None or _student_mtime is None:
+                logger.warning(f"Cascade enabled but no student model at {STUDENT_PATH}")
+            _student, _student_mtime = None, 0
+            return None
+
+        if mtime != _student_mtime:
+            try:
+                _student = StudentModel.load(STUDENT_PATH)
+                logger.info(f"Loaded student model (threshold {_student.threshold:.3f})")
+            except Exception as e:
+                logger.error(f"Failed to load student model: {e}")
+                _student = None
+            _student_mtime = mtime
+    return _student
+
+
+def cascade_threshold(endpoint):
+    """
+    Student confidence threshold for an endpoint, or None to skip the student.
+    """
+    if not CASCADE_ENABLED:
+        return None
+    if endpoint in CASCADE_THRESHOLDS:
+        return CASCADE_THRESHOLDS[endpoint]
+    student = get_student()
+    return student.threshold if student is not None else None
+
+
+def build_pipeline():
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import FeatureUnion, Pipeline
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    # Word n-grams for vocabulary, character n-grams for slang and typos ("bgt", "mantapp")
+    features = FeatureUnion([
+        ('words', TfidfVectorizer(lowercase=True, ngram_range=(1, 2), min_df=1, sublinear_tf=True)),
+        ('chars', TfidfVectorizer(lowercase=True, analyzer='char_wb', ngram_range=(2, 5),
+                                  min_df=2, sublinear_tf=True)),
+    ])
+    return Pipeline([
+        ('features', features),
+        ('classifier', LogisticRegression(max_iter=1000, C=4.0)),
+    ])
+
+
+def calibrate_threshold(confidences, agreements, target_agreement=TARGET_AGREEMENT,
+                        min_kept=MIN_CALIBRATION_KEPT):
+    """
+    Lowest confidence threshold whose kept texts (confidence >= threshold) agree
+    with the teacher at least ``target_agreement`` of the time. Returns a value
+    above 1.0 (the student never answers) if no threshold qualifies.
+    """
+    ranked = sorted(zip(confidences, agreements), key=lambda pair: -pair[0])
+    best = 1.01
+    agreed = 0
+    for kept, (confidence, agrees) in enumerate(ranked, start=1):
+        agreed += bool(agrees)
+        # Only cut between distinct confidences
+        if kept < len(ranked) and ranked[kept][0] == confidence:
+            continue
+        if kept >= min_kept and agreed / kept >= target_agreement:
+            best = confidence
+    return best
+
+
+def cascade_metrics(student_predictions, teacher_labels, threshold):
+    """
+    Escalation rate and end-to-end agreement with the teacher at a threshold.
+    Escalated texts get the teacher's answer, so they always agree.
+    """
+    total = len(teacher_labels)
+    kept = [(label, teacher) for (label, confidence), teacher in zip(student_predictions, teacher_labels)
+            if confidence >= threshold]
+    kept_agree = sum(1 for label, teacher in kept if label == teacher)
+    escalated = total - len(kept)
+    return {
+        'threshold': threshold,
+        'escalation_rate': escalated / total if total else None,
+        'student_agreement': kept_agree / len(kept) if kept else None,
+        'end_to_end_agreement': (kept_agree + escalated) / total if total else None,
+    }
+
+
+def _teacher_predict(texts):
+    """Transformer labels, bypassing caches so the timing is real."""
+    from model_loader import load_model, _predict_bucketed
+
+    load_model()
+    start = time.perf_counter()
+    predictions, _ = _predict_bucketed(texts)
+    return [label for label, _ in predictions], time.perf_counter() - start
+
+
+def _collect_texts(csv_path, use_history, limit):
+    import pandas as pd
+
+    texts = []
+    if csv_path:
+        texts.extend(pd.read_csv(csv_path)['text'].dropna().astype(str).tolist())
+
+    if use_history:
+        os.environ.setdefault('SENTIMENT_PRELOAD_MODEL', '0')
+        from app import app
+        from models import Analysis
+        with app.app_context():
+            rows = Analysis.query.with_entities(Analysis.text).distinct()
+            if limit:
+                rows = rows.limit(limit)
+            texts.extend(text for (text,) in rows)
+
+    # Distinct, non-trivial texts
+    texts = list(dict.fromkeys(t.strip() for t in texts if t and len(t.strip()) >= 3))
+    return texts[:limit] if limit else texts
+
+
+def _timed_report(student, texts, teacher_labels, teacher_seconds, threshold):
+    start = time.perf_counter()
+    predictions = student.predict(texts)
+    student_seconds = time.perf_counter() - start
+
+    report = cascade_metrics(predictions, teacher_labels, threshold)
+    escalated = [t for t, (_, confidence) in zip(texts, predictions) if confidence < threshold]
+    _, escalated_seconds = _teacher_predict(escalated) if escalated else (None, 0.0)
+    cascade_seconds = student_seconds + escalated_seconds
+
+    report.update({
+        'samples': len(texts),
+        'teacher_texts_per_second': len(texts) / teacher_seconds if teacher_seconds else None,
+        'cascade_texts_per_second': len(texts) / cascade_seconds if cascade_seconds else None,
+        'throughput_gain': teacher_seconds / cascade_seconds if cascade_seconds else None,
+    })
+    return report, predictions
+
+
+def train_student(csv_path='dummy_train.csv', use_history=True, limit=None,
+                  target_agreement=TARGET_AGREEMENT, path=STUDENT_PATH):
+    """
+    Distill the current transformer into a student model and save it.
+    Returns: The calibration report (dict).
+    """
+    from sklearn.model_selection import train_test_split
+    from model_loader import get_model_fingerprint
+
+    texts = _collect_texts(csv_path, use_history, limit)
+    if len(texts) < 5 * MIN_CALIBRATION_KEPT:
+        raise ValueError(f"Need at least {5 * MIN_CALIBRATION_KEPT} distinct texts to train a student, got {len(texts)}")
+
+    logger.info(f"Labelling {len(texts)} texts with the transformer...")
+    labels, _ = _teacher_predict(texts)
+
+    counts = {label: labels.count(label) for label in set(labels)}
+    stratify = labels if min(counts.values()) >= 2 else None
+    train_texts, cal_texts, train_labels, cal_labels = train_test_split(
+        texts, labels, test_size=CALIBRATION_SPLIT, random_state=42, stratify=stratify
+    )
+
+    pipeline = build_pipeline()
+    pipeline.fit(train_texts, train_labels)
+    student = StudentModel(pipeline, 1.01)
+
+    cal_predictions = student.predict(cal_texts)
+    student.threshold = calibrate_threshold(
+        [confidence for _, confidence in cal_predictions],
+        [label == teacher for (label, _), teacher in zip(cal_predictions, cal_labels)],
+        target_agreement
+    )
+
+    # Throughput is measured on the calibration split, with a fresh teacher pass
+    _, teacher_seconds = _teacher_predict(cal_texts)
+    report, _ = _timed_report(student, cal_texts, cal_labels, teacher_seconds, student.threshold)
+    report.update({'train_samples': len(train_texts), 'label_counts': counts, 'target_agreement': target_agreement})
+
+    student.metadata = {
+        'teacher_fingerprint': get_model_fingerprint(),
+        'created_at': time.time(),
+        'calibration': report,
+    }
+    student.save(path)
+    logger.info(f"Student model saved to {path} (threshold {student.threshold:.3f})")
+    return report
+
+
+def report_student(csv_path='dummy_train.csv', threshold=None, limit=None, path=STUDENT_PATH):
+    """
+    Escalation rate, agreement and throughput of the cascade on a reference CSV,
+    at the given (or calibrated) threshold and over a range of thresholds.
+    """
+    student = StudentModel.load(path)
+    texts = _collect_texts(csv_path, False, limit)
+    teacher_labels, teacher_seconds = _teacher_predict(texts)
+
+    threshold = student.threshold if threshold is None else threshold
+    report, predictions = _timed_report(student, texts, teacher_labels, teacher_seconds, threshold)
+    report['calibrated_threshold'] = student.threshold
+    report['teacher_fingerprint'] = student.metadata.get('teacher_fingerprint')
+    report['thresholds'] = [cascade_metrics(predictions, teacher_labels, t) for t in REPORT_THRESHOLDS]
+    return report
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Student model for cascade inference")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    trn = sub.add_parser('train', help='Distill the transformer into a TF-IDF + linear student')
+    trn.add_argument('--csv', default='dummy_train.csv')
+    trn.add_argument('--no-history', action='store_true', help='Do not use texts from the analysis history')
+    trn.add_argument('--limit', type=int, default=None)
+    trn.add_argument('--target-agreement', type=float, default=TARGET_AGREEMENT)
+
+    rep = sub.add_parser('report', help='Escalation rate, agreement and throughput gain on a CSV')
+    rep.add_argument('--csv', default='dummy_train.csv')
+    rep.add_argument('--threshold', type=float, default=None)
+    rep.add_argument('--limit', type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        report = train_student(args.csv, not args.no_history, args.limit, args.target_agreement)
+    else:
+        report = report_student(args.csv, args.threshold, args.limit)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
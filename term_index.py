@@ -0,0 +1,181 @@
+"""
+Per-user term-frequency index behind /api/stats/wordcloud.
+
+Each analysis is tokenized once, when it is written, and its term counts are
+added to the term_counts table (subtracted again when it is deleted). Counts
+are kept per day and for all time, per sentiment and for all sentiments, so
+the all-time word cloud is a single index range scan and a time-windowed one
+only sums the days in its window.
+
+Rows written before the index existed are picked up with:
+    python term_index.py rebuild [--user USER_ID]
+"""
+
+import argparse
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models import Analysis, TermCount
+
+logger = logging.getLogger(__name__)
+
+# Marks the all-time / all-sentiment aggregates. Sorts before any 'YYYY-MM-DD',
+# so a "period >= since" window never includes the all-time rows.
+ALL = '*'
+
+MIN_TERM_LENGTH = 4
+MAX_TERM_LENGTH = 64
+UPSERT_CHUNK_SIZE = 500
+REBUILD_BATCH_SIZE = 1000
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Indonesian stopwords (basic list)
+STOPWORDS = frozenset([
+    'yang', 'di', 'dan', 'itu', 'dengan', 'untuk', 'tidak', 'ini', 'dari',
+    'dalam', 'akan', 'pada', 'juga', 'saya', 'ke', 'karena', 'tersebut',
+    'bisa', 'ada', 'mereka', 'lebih', 'sudah', 'atau', 'saat', 'oleh',
+    'sebagai', 'adalah', 'apa', 'kita', 'kamu', 'dia', 'anda', 'aku',
+    'sangat', 'tapi', 'namun', 'jika', 'kalau', 'maka', 'sehingga',
+    'banyak', 'sedikit', 'kurang', 'cukup', 'paling', 'seperti', 'hanya'
+])
+
+
+def tokenize(text):
+    """Term counts of one text, stopwords and short words removed."""
+    return Counter(
+        word for word in WORD_PATTERN.findall((text or '').lower())
+        if MIN_TERM_LENGTH <= len(word) <= MAX_TERM_LENGTH and word not in STOPWORDS
+    )
+
+
+def _deltas(rows, sign):
+    deltas = Counter()
+    for row in rows:
+        user_id = row.get('user_id')
+        if user_id is None:
+            continue
+        terms = tokenize(row.get('text'))
+        if not terms:
+            continue
+        day = (row.get('created_at') or datetime.utcnow()).strftime('%Y-%m-%d')
+        for period in (ALL, day):
+            for sentiment in (ALL, row.get('sentiment')):
+                for term, count in terms.items():
+                    deltas[(user_id, period, sentiment, term)] += sign * count
+    return deltas
+
+
+def apply(connection, rows, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) the terms of analysis rows.
+    Runs on the caller's connection, inside its transaction.
+
+    Args:
+        rows (iterable): Dicts with user_id, text, sentiment, created_at.
+    """
+    params = [
+        {'user_id': user_id, 'period': period, 'sentiment': sentiment, 'term': term, 'count': count}
+        for (user_id, period, sentiment, term), count in _deltas(rows, sign).items()
+        if count
+    ]
+    if not params:
+        return
+
+    table = TermCount.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'period', 'sentiment', 'term'],
+        set_={'count': table.c.count + stmt.excluded['count']}
+    )
+    for start in range(0, len(params), UPSERT_CHUNK_SIZE):
+        connection.execute(stmt, params[start:start + UPSERT_CHUNK_SIZE])
+
+    if sign < 0:
+        users = {p['user_id'] for p in params}
+        connection.execute(table.delete().where(table.c.count <= 0, table.c.user_id.in_(users)))
+
+
+def top_terms(user_id, limit=50, days=None, sentiment=None):
+    """
+    Most frequent terms of a user.
+
+    Args:
+        days (int, optional): Only analyses of the last ``days`` days (today included).
+        sentiment (str, optional): Only analyses with this sentiment.
+
+    Returns:
+        list: [(term, count), ...], most frequent first.
+    """
+    sentiment = sentiment or ALL
+    if not days:
+        return db.session.query(TermCount.term, TermCount.count).filter(
+            TermCount.user_id == user_id,
+            TermCount.period == ALL,
+            TermCount.sentiment == sentiment
+        ).order_by(TermCount.count.desc()).limit(limit).all()
+
+    since = (datetime.utcnow() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    total = func.sum(TermCount.count)
+    return db.session.query(TermCount.term, total).filter(
+        TermCount.user_id == user_id,
+        TermCount.period >= since,
+        TermCount.sentiment == sentiment
+    ).group_by(TermCount.term).order_by(total.desc()).limit(limit).all()
+
+
+def rebuild(user_id=None, connection=None):
+    """
+    Recompute the index from the analyses table (all users or one).
+    Commits unless it runs on the caller's ``connection``.
+    Returns: Number of analyses indexed.
+    """
+    commit = connection is None
+    connection = connection or db.session.connection()
+
+    table = TermCount.__table__
+    delete = table.delete()
+    query = select(
+        Analysis.user_id, Analysis.text, Analysis.sentiment, Analysis.created_at
+    ).order_by(Analysis.id)
+    if user_id is not None:
+        delete = delete.where(table.c.user_id == user_id)
+        query = query.where(Analysis.user_id == user_id)
+
+    connection.execute(delete)
+
+    indexed = 0
+    result = connection.execute(query, execution_options={'yield_per': REBUILD_BATCH_SIZE})
+    for batch in result.mappings().partitions():
+        apply(connection, batch)
+        indexed += len(batch)
+
+    if commit:
+        db.session.commit()
+    logger.info(f"Term index rebuilt from {indexed} analyses")
+    return indexed
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Maintain the word cloud term index")
+    sub = parser.add_subparsers(dest='command', required=True)
+    reb = sub.add_parser('rebuild', help='Recompute the index from the analyses table')
+    reb.add_argument('--user', type=int, default=None, help='Only this user id')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.command == 'rebuild':
+            print(f"Indexed {rebuild(args.user)} analyses")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,208 @@
 import os
+import math
+import time
+import argparse
 import logging
+from datetime import datetime
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, Trainer, TrainingArguments
+from transformers import (
+    AutoTokenizer, AutoModelForSequenceClassification, Trainer, TrainingArguments,
+    DataCollatorWithPadding, TrainerCallback
+)
 from datasets import Dataset
 
 from models import Analysis
+from model_registry import REGISTRY_DIR, register, activate_version, get_active, read_manifest
+from prediction_cache import text_hash
 import pandas as pd
 
 # Configuration
 MODEL_NAME = "w11wo/indonesian-roberta-base-sentiment-classifier"
-OUTPUT_DIR = "./fine_tuned_model"
+# Training runs write here, then the result is moved into the model registry
+STAGING_DIR = os.path.join(REGISTRY_DIR, 'staging')
+
+# Maximum training rows (0 = no limit)
+MAX_TRAIN_ROWS = int(os.environ.get('TRAIN_MAX_ROWS', '0'))
+# Sequence length: a fixed number, or 'auto' to cover TRAIN_LENGTH_PERCENTILE of the corpus
+MAX_LENGTH = os.environ.get('TRAIN_MAX_LENGTH', 'auto')
+LENGTH_PERCENTILE = float(os.environ.get('TRAIN_LENGTH_PERCENTILE', '95'))
+MIN_AUTO_LENGTH = 16
+MODEL_MAX_LENGTH = 512
+
+# Training from corrections: continue from the active model version with only the
+# corrections made since it was trained (its manifest holds the watermark)
+INCREMENTAL = os.environ.get('TRAIN_INCREMENTAL', '1') == '1'
+# Older corrections mixed into an incremental run, against forgetting
+REPLAY_SIZE = int(os.environ.get('TRAIN_REPLAY_SIZE', '0'))
+# Rows fetched per round trip when streaming corrections
+CORRECTIONS_BATCH_SIZE = 500
 
 # Configure logging
 # logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def train(data_path=None):
+
+def choose_max_length(token_lengths, percentile=LENGTH_PERCENTILE):
+    """
+    Smallest sequence length (multiple of 8) that covers ``percentile`` % of the
+    texts without truncation; longer texts are truncated to it.
+    """
+    if not token_lengths:
+        return MIN_AUTO_LENGTH
+    ordered = sorted(token_lengths)
+    index = min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))
+    length = int(math.ceil(ordered[index] / 8) * 8)
+    return max(MIN_AUTO_LENGTH, min(MODEL_MAX_LENGTH, length))
+
+
+class TokenCountingCollator:
+    """
+    Pads each batch only to its own longest example (dynamic padding) and
+    counts real vs. padded tokens for throughput reporting.
+    """
+
+    def __init__(self, tokenizer, pad_to_multiple_of=8):
+        self._collate = DataCollatorWithPadding(tokenizer, pad_to_multiple_of=pad_to_multiple_of)
+        self.counting = True
+        self.tokens = 0
+        self.padded_tokens = 0
+
+    def __call__(self, features):
+        batch = self._collate(features)
+        if self.counting:
+            self.tokens += int(batch['attention_mask'].sum())
+            self.padded_tokens += batch['attention_mask'].numel()
+        return batch
+
+
+class ThroughputCallback(TrainerCallback):
+    """
+    Logs training tokens per second and the share of padding in each log step.
+    Evaluation time and tokens are left out.
+    """
+
+    def __init__(self, collator):
+        self.collator = collator
+        self.elapsed = 0.0
+        self._epoch_start = None
+
+    def _training_seconds(self):
+        running = time.perf_counter() - self._epoch_start if self._epoch_start is not None else 0.0
+        return self.elapsed + running
+
+    def tokens_per_second(self):
+        seconds = self._training_seconds()
+        return round(self.collator.tokens / seconds, 1) if seconds else 0.0
+
+    def padding_ratio(self):
+        if not self.collator.padded_tokens:
+            return 0.0
+        return round(1 - self.collator.tokens / self.collator.padded_tokens, 3)
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.collator.counting = True
+        self._epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        self.collator.counting = False
+        if self._epoch_start is not None:
+            self.elapsed += time.perf_counter() - self._epoch_start
+            self._epoch_start = None
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs and 'loss' in logs:
+            logger.info(
+                f"Step {state.global_step}: loss {logs['loss']:.4f}, "
+                f"{self.tokens_per_second()} tokens/s, padding {self.padding_ratio():.1%}"
+            )
+
+
+def load_corrections(watermark=None, replay_size=0):
+    """
+    Stream corrected analyses made after the watermark, keeping the latest
+    label of each distinct text. Must run inside an app context.
+
+    Args:
+        watermark (dict, optional): {'corrected_at': ISO time or None, 'id': int}
+            of the last correction consumed by a previous run.
+        replay_size (int): Random older corrections to mix in.
+
+    Returns:
+        tuple: (texts, labels, new_watermark, replay_count)
+    """
+    from sqlalchemy import and_, or_, func
+    from extensions import db
+
+    columns = (Analysis.id, Analysis.text, Analysis.correction, Analysis.corrected_at)
+    corrected = db.session.query(*columns).filter(Analysis.correction.isnot(None))
+
+    newer = older = None
+    if watermark:
+        last_id = watermark['id']
+        if watermark.get('corrected_at'):
+            since = datetime.fromisoformat(watermark['corrected_at'])
+            newer = or_(
+                Analysis.corrected_at > since,
+                and_(Analysis.corrected_at == since, Analysis.id > last_id)
+            )
+            older = or_(Analysis.corrected_at.is_(None), ~newer)
+        else:
+            # The previous run only saw corrections made before corrected_at existed
+            newer = or_(Analysis.corrected_at.isnot(None), Analysis.id > last_id)
+            older = ~newer
+
+    query = corrected.filter(newer) if newer is not None else corrected
+    samples = {}  # text hash -> (text, label); a later correction of the same text wins
+    last = None
+    for row in query.order_by(Analysis.corrected_at, Analysis.id).yield_per(CORRECTIONS_BATCH_SIZE):
+        samples[text_hash(row.text)] = (row.text, row.correction)
+        last = row
+
+    if last is None:
+        return [], [], watermark, 0
+
+    new_watermark = {
+        'corrected_at': last.corrected_at.isoformat() if last.corrected_at else None,
+        'id': last.id
+    }
+
+    replay_count = 0
+    if replay_size and older is not None:
+        for row in corrected.filter(older).order_by(func.random()).limit(replay_size):
+            h = text_hash(row.text)
+            if h not in samples:
+                samples[h] = (row.text, row.correction)
+                replay_count += 1
+
+    texts = [text for text, _ in samples.values()]
+    labels = [label for _, label in samples.values()]
+    return texts, labels, new_watermark, replay_count
+
+
+def train(data_path=None, max_rows=None, incremental=None, replay_size=None, callbacks=None):
     """
     Fine-tune the model using user corrections from the database or a CSV file.
     Args:
         data_path (str, optional): Path to CSV file containing 'text' and 'label' columns.
+        max_rows (int, optional): Row limit, default TRAIN_MAX_ROWS (0 = no limit).
+        incremental (bool, optional): For corrections, continue from the active
+            model version with new corrections only (default TRAIN_INCREMENTAL).
+        replay_size (int, optional): Older corrections mixed into an incremental
+            run (default TRAIN_REPLAY_SIZE).
+        callbacks (list, optional): Extra TrainerCallbacks (progress reporting).
+    Returns:
+        str: The registered model version (not yet active), or None if nothing was trained.
     """
     logger.info("Starting Fine-Tuning Process...")
+    output_dir = os.path.join(STAGING_DIR, time.strftime('%Y%m%d-%H%M%S'))
+    incremental = INCREMENTAL if incremental is None else incremental
+    replay_size = REPLAY_SIZE if replay_size is None else replay_size
+
+    # Model to start from: the base model, or the active version for incremental runs
+    parent = get_active() if incremental and not data_path else None
+    base_model = parent[1] if parent else MODEL_NAME
+    watermark = read_manifest(parent[0]).get('corrections_watermark') if parent else None
+    replay_count = 0
     
     # 1. Load Data
     texts = []
@@ -36,12 +217,6 @@ def train(data_path=None):
                 logger.error("Error: CSV must contain 'text' and 'label' columns.")
                 return
             
-            # Limit to 500 rows for performance (MVP constraint)
-            # Limit to 500 rows for performance (MVP constraint)
-            if len(df) > 500:
-                logger.warning("Warning: Limiting dataset to 500 rows for performance.")
-                df = df.head(500)
-                
             texts = df['text'].astype(str).tolist()
             labels = df['label'].astype(str).tolist()
             logger.info(f"Loaded {len(texts)} samples from CSV.")
@@ -51,20 +226,31 @@ def train(data_path=None):
             return
             
     else:
-        # Load from Database
-        from app import app, db
+        # Load from Database (no need for the app to preload its model here)
+        os.environ.setdefault('SENTIMENT_PRELOAD_MODEL', '0')
+        from app import app
         with app.app_context():
-            # Fetch analyses that have a correction
-            corrected_data = Analysis.query.filter(Analysis.correction.isnot(None)).all()
+            # Fetch corrections made since the watermark (all of them without one)
+            texts, labels, watermark, replay_count = load_corrections(watermark, replay_size)
             
-            if not corrected_data:
+        if not texts:
+            if parent:
+                logger.warning(f"No new corrections since model version {parent[0]} was trained.")
+            else:
                 logger.warning("No corrected data found. Please provide feedback via the web UI first.")
-                return
+            return
 
-            logger.info(f"Found {len(corrected_data)} corrected samples from Database.")
-            
-            texts = [item.text for item in corrected_data]
-            labels = [item.correction for item in corrected_data]
+        logger.info(
+            f"Found {len(texts) - replay_count} new corrected samples from Database"
+            f" (+{replay_count} replayed), continuing from {base_model}."
+        )
+
+    # Corrections are not capped: the watermark must match what was consumed
+    max_rows = MAX_TRAIN_ROWS if max_rows is None else max_rows
+    if data_path and max_rows and len(texts) > max_rows:
+        logger.warning(f"Warning: Limiting dataset to {max_rows} rows (TRAIN_MAX_ROWS).")
+        texts = texts[:max_rows]
+        labels = labels[:max_rows]
 
     # 2. Prepare Dataset
     # Map labels to integers
@@ -89,28 +275,41 @@ def train(data_path=None):
 
     # 3. Tokenization
     logger.info("Loading Tokenizer...")
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    tokenizer = AutoTokenizer.from_pretrained(base_model)
 
+    if MAX_LENGTH == 'auto':
+        token_lengths = [
+            len(ids) for ids in tokenizer(texts, truncation=True, max_length=MODEL_MAX_LENGTH)['input_ids']
+        ]
+        max_length = choose_max_length(token_lengths)
+        logger.info(f"Max length {max_length} covers {LENGTH_PERCENTILE:g}% of the texts")
+    else:
+        max_length = int(MAX_LENGTH)
+
+    # No padding here: each batch is padded to its own longest text by the collator
     def tokenize_function(examples):
-        return tokenizer(examples["text"], padding="max_length", truncation=True, max_length=128)
+        return tokenizer(examples["text"], truncation=True, max_length=max_length)
 
-    tokenized_train = train_dataset.map(tokenize_function, batched=True)
-    tokenized_eval = eval_dataset.map(tokenize_function, batched=True)
+    tokenized_train = train_dataset.map(tokenize_function, batched=True, remove_columns=['text'])
+    tokenized_eval = eval_dataset.map(tokenize_function, batched=True, remove_columns=['text'])
+    data_collator = TokenCountingCollator(tokenizer)
+    throughput = ThroughputCallback(data_collator)
 
     # 4. Load Model
     logger.info("Loading Model...")
-    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME, num_labels=3)
+    model = AutoModelForSequenceClassification.from_pretrained(base_model, num_labels=3)
 
     # 5. Training Arguments
     # 5. Training Arguments
     training_args = TrainingArguments(
-        output_dir=OUTPUT_DIR,
+        output_dir=output_dir,
         eval_strategy="epoch" if len(dataset) > 5 else "no",
         learning_rate=2e-5,
         per_device_train_batch_size=8,
         per_device_eval_batch_size=8,
         num_train_epochs=3,
         weight_decay=0.01,
+        group_by_length=True,      # Batch texts of similar length together: less padding
         save_strategy="no",        # Disable saving checkpoints every epoch
         save_total_limit=1,        # Only keep the last checkpoint if saved
         logging_dir='./logs',
@@ -124,18 +323,50 @@ def train(data_path=None):
         args=training_args,
         train_dataset=tokenized_train,
         eval_dataset=tokenized_eval if len(dataset) > 5 else None,
+        data_collator=data_collator,
+        callbacks=[throughput] + list(callbacks or []),
     )
 
     # 7. Train
     logger.info("Training...")
     trainer.train()
+    logger.info(
+        f"Trained on {data_collator.tokens} tokens at {throughput.tokens_per_second()} tokens/s "
+        f"(padding {throughput.padding_ratio():.1%})"
+    )
 
     # 8. Save Model
     # 8. Save Model
-    logger.info(f"Saving model to {OUTPUT_DIR}...")
-    model.save_pretrained(OUTPUT_DIR)
-    tokenizer.save_pretrained(OUTPUT_DIR)
-    logger.info("Fine-tuning complete!")
+    logger.info(f"Saving model to {output_dir}...")
+    model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+    # 9. Register as a new model version
+    version = register(output_dir, metadata={
+        'base_model': MODEL_NAME,
+        'parent_version': parent[0] if parent else None,
+        'training_samples': len(texts),
+        'replay_samples': replay_count,
+        'data_source': data_path or 'corrections',
+        'corrections_watermark': None if data_path else watermark,
+        'max_length': max_length,
+        'tokens_per_second': throughput.tokens_per_second()
+    }, move=True)
+    logger.info(f"Fine-tuning complete! Registered model version {version}")
+    return version
 
 if __name__ == "__main__":
-    train()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Fine-tune the sentiment model")
+    parser.add_argument('--csv', default=None, help="CSV with 'text' and 'label' columns (default: corrections)")
+    parser.add_argument('--full', action='store_true',
+                        help='Retrain from the base model on all corrections instead of incrementally')
+    parser.add_argument('--replay', type=int, default=None, help='Older corrections mixed into an incremental run')
+    parser.add_argument('--max-rows', type=int, default=None)
+    args = parser.parse_args()
+
+    version = train(args.csv, max_rows=args.max_rows, incremental=not args.full, replay_size=args.replay)
+    if version:
+        # Running app workers pick up the new active version on their own
+        activate_version(version)
@@ -0,0 +1,307 @@
+"""
+Out-of-process training runner.
+
+Each training job runs in its own process (python training_runner.py JOB_ID)
+with a capped number of CPU threads, a lower scheduling priority and
+optionally a CPU affinity mask. Inference in the web workers keeps its share
+of the cores. Progress (epoch, step, loss, ETA), cancellation and the result
+live in the training_jobs table, so every app worker sees them. A file lock
+lets only one training job run at a time, whichever worker started it.
+
+When training succeeds, the training process registers the new model version
+and activates it in the registry itself, so the promotion does not depend on
+the app worker that started the job still being alive. Every app worker (or
+the inference server) follows the registry pointer, loading and warming the
+new version before it takes traffic. The app worker that starts a job only
+supervises the process, recording a crash as a failure.
+"""
+
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import TrainingJob
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# CPU budget of the training process
+TRAIN_THREADS = int(os.environ.get('TRAIN_NUM_THREADS', str(max(1, (os.cpu_count() or 2) // 2))))
+TRAIN_NICENESS = int(os.environ.get('TRAIN_NICENESS', '10'))
+# Optional CPU list for the training process, e.g. "4-7" or "2,3"
+TRAIN_CPU_AFFINITY = os.environ.get('TRAIN_CPU_AFFINITY', '')
+
+LOCK_PATH = os.environ.get('TRAIN_LOCK_PATH', os.path.join('instance', 'training.lock'))
+LOG_DIR = 'logs'
+# Seconds between progress writes to the database
+PROGRESS_INTERVAL = 2.0
+# Running jobs without a heartbeat for this long are considered dead
+JOB_STALE_SECONDS = int(os.environ.get('TRAINING_JOB_STALE_SECONDS', '900'))
+
+ACTIVE_STATUSES = ('queued', 'running')
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class TrainingCancelled(Exception):
+    pass
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _parse_cpu_list(spec):
+    """'0-3,6' -> {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def mark_if_stale(job):
+    """Fail a running job whose process stopped sending heartbeats."""
+    if job.status != 'running' or job.heartbeat_at is None:
+        return
+    if datetime.utcnow() - job.heartbeat_at > timedelta(seconds=JOB_STALE_SECONDS):
+        job.status = 'failed'
+        job.error = 'Training process stopped responding'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def get_active_job():
+    """The queued or running training job, if any."""
+    for job in TrainingJob.query.filter(TrainingJob.status.in_(ACTIVE_STATUSES)).all():
+        mark_if_stale(job)
+        if job.status in ACTIVE_STATUSES:
+            return job
+    return None
+
+
+def start_training_job(app, data_path=None, user_id=None):
+    """
+    Create a training job and start its process.
+    Returns: (job, None) or (None, error message) if a job is already active.
+    """
+    active = get_active_job()
+    if active is not None:
+        return None, f'Training job {active.id} is already {active.status}'
+
+    job = TrainingJob(id=uuid.uuid4().hex, user_id=user_id, data_path=data_path,
+                      message='Waiting for the training process...', worker=_worker_id())
+    db.session.add(job)
+    db.session.commit()
+
+    env = {
+        **os.environ,
+        'SENTIMENT_PRELOAD_MODEL': '0',
+        'OMP_NUM_THREADS': str(TRAIN_THREADS),
+        'MKL_NUM_THREADS': str(TRAIN_THREADS),
+        'TOKENIZERS_PARALLELISM': 'false',
+    }
+    os.makedirs(os.path.join(BASE_DIR, LOG_DIR), exist_ok=True)
+    log_path = os.path.join(BASE_DIR, LOG_DIR, f"training-{job.id}.log")
+    with open(log_path, 'ab') as log_file:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), job.id],
+            cwd=BASE_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT
+        )
+    logger.info(f"Training job {job.id} started in process {process.pid} (log: {log_path})")
+
+    threading.Thread(
+        target=_supervise, args=(app, job.id, process), name=f'training-{job.id[:8]}', daemon=True
+    ).start()
+    return job, None
+
+
+def _supervise(app, job_id, process):
+    """Wait for the training process and record a failure it could not record itself."""
+    returncode = process.wait()
+
+    with app.app_context():
+        try:
+            job = TrainingJob.query.get(job_id)
+            if job.status not in TERMINAL_STATUSES:
+                job.status = 'failed'
+                job.error = f'Training process exited with code {returncode}'
+                job.message = f'Training failed: {job.error}'
+                job.finished_at = datetime.utcnow()
+            db.session.commit()
+            logger.info(f"Training job {job_id} {job.status}")
+        finally:
+            db.session.remove()
+
+
+def request_cancel(job):
+    """Ask a training job to stop; the process checks the flag at every progress write."""
+    job.cancel_requested = True
+    if job.status == 'queued':
+        job.status = 'cancelled'
+        job.message = 'Training cancelled'
+        job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _progress_callback(job_id):
+    from transformers import TrainerCallback
+
+    class ProgressCallback(TrainerCallback):
+        """Writes progress to the job row and stops training when it is cancelled."""
+
+        def __init__(self):
+            self.started = None
+            self.last_write = 0.0
+            self.loss = None
+
+        def on_train_begin(self, args, state, control, **kwargs):
+            self.started = time.monotonic()
+            self._write(state, args)
+
+        def on_log(self, args, state, control, logs=None, **kwargs):
+            if logs and 'loss' in logs:
+                self.loss = logs['loss']
+
+        def on_step_end(self, args, state, control, **kwargs):
+            now = time.monotonic()
+            if now - self.last_write >= PROGRESS_INTERVAL or state.global_step >= state.max_steps:
+                self._write(state, args)
+
+        def _write(self, state, args):
+            self.last_write = time.monotonic()
+            elapsed = self.last_write - self.started
+            remaining = state.max_steps - state.global_step
+
+            job = TrainingJob.query.get(job_id)
+            job.epoch = state.epoch
+            job.num_epochs = args.num_train_epochs
+            job.step = state.global_step
+            job.total_steps = state.max_steps
+            job.loss = self.loss
+            job.eta_seconds = round(elapsed / state.global_step * remaining, 1) if state.global_step else None
+            job.message = f"Epoch {state.epoch or 0:.1f}/{args.num_train_epochs:g}, step {state.global_step}/{state.max_steps}"
+            job.heartbeat_at = datetime.utcnow()
+            cancel = job.cancel_requested
+            db.session.commit()
+
+            if cancel:
+                raise TrainingCancelled()
+
+    return ProgressCallback()
+
+
+def _try_lock(lock_file):
+    """Non-blocking exclusive lock; False if another process holds it."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _limit_resources():
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(TRAIN_NICENESS)
+        except OSError as e:
+            logger.warning(f"Could not lower training priority: {e}")
+
+    if TRAIN_CPU_AFFINITY and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, _parse_cpu_list(TRAIN_CPU_AFFINITY))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not set training CPU affinity: {e}")
+
+    import torch
+    torch.set_num_threads(TRAIN_THREADS)
+
+
+def run(job_id):
+    """Training process entry point."""
+    from app import app
+    from train import train
+    from model_registry import activate_version
+
+    _limit_resources()
+
+    with app.app_context():
+        # One training job at a time, across all app workers
+        os.makedirs(os.path.dirname(LOCK_PATH) or '.', exist_ok=True)
+        lock_file = open(LOCK_PATH, 'w')
+        if not _try_lock(lock_file):
+            job = TrainingJob.query.get(job_id)
+            job.status = 'failed'
+            job.error = 'Another training job is running'
+            job.message = f'Training failed: {job.error}'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return
+
+        now = datetime.utcnow()
+        claimed = TrainingJob.query.filter_by(id=job_id, status='queued').update({
+            'status': 'running',
+            'started_at': now,
+            'heartbeat_at': now,
+            'pid': os.getpid(),
+            'message': 'Training in progress...'
+        })
+        db.session.commit()
+        if not claimed:
+            return
+
+        job = TrainingJob.query.get(job_id)
+        logger.info(f"Training job {job_id} running with {TRAIN_THREADS} threads, nice {TRAIN_NICENESS}")
+        try:
+            version = train(data_path=job.data_path, callbacks=[_progress_callback(job_id)])
+            job = TrainingJob.query.get(job_id)
+            if version is None:
+                job.status = 'failed'
+                job.error = 'No model was trained, check the training data'
+                job.message = f'Training failed: {job.error}'
+            else:
+                # Workers load and warm it up, then switch over (see model_loader._follow_registry)
+                activate_version(version)
+                job.status = 'completed'
+                job.version = version
+                job.message = f'Training completed successfully! Model version {version} is now active.'
+        except TrainingCancelled:
+            db.session.rollback()
+            job = TrainingJob.query.get(job_id)
+            job.status = 'cancelled'
+            job.message = 'Training cancelled'
+        except Exception as e:
+            logger.error(f"Training job {job_id} failed: {e}", exc_info=True)
+            db.session.rollback()
+            job = TrainingJob.query.get(job_id)
+            job.status = 'failed'
+            job.error = str(e)
+            job.message = f'Training failed: {e}'
+
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        lock_file.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    run(sys.argv[1])
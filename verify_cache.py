@@ -0,0 +1,113 @@
+"""
+Behaviour check of the in-memory prediction cache (prediction_cache.py):
+normalized text keys, LRU order, the entry and byte bounds, TTL expiry and
+per-model keys.
+
+Usage:
+    python verify_cache.py
+"""
+
+import sys
+import threading
+import time
+
+from prediction_cache import PredictionCache, text_hash
+
+MODEL = 'aaaaaaaaaaaaaaaa'
+OTHER_MODEL = 'bbbbbbbbbbbbbbbb'
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+
+def main():
+    results = []
+
+    # Trivially different copies of a text share a key
+    results.append(check(
+        'Normalized text keys',
+        text_hash('Makanannya  enak\n sekali ') == text_hash('Makanannya enak sekali')
+        and text_hash('Makanannya enak') != text_hash('Makanannya enak sekali')
+    ))
+
+    # Keys of another model are separate entries
+    cache = PredictionCache(max_entries=10, max_bytes=0)
+    h = text_hash('Pelayanannya lambat')
+    cache.put((MODEL, h), ('Negatif', 0.9))
+    results.append(check(
+        'Keyed by model fingerprint',
+        cache.get((MODEL, h)) == ('Negatif', 0.9) and cache.get((OTHER_MODEL, h)) is None
+    ))
+
+    # The least recently used entry goes first
+    cache = PredictionCache(max_entries=3, max_bytes=0)
+    for key in 'abc':
+        cache.put(key, (key, 1.0))
+    cache.get('a')
+    cache.put('d', ('d', 1.0))
+    stats = cache.stats()
+    results.append(check(
+        'LRU eviction at max_entries',
+        cache.get('b') is None and all(cache.get(k) is not None for k in 'acd') and stats['evictions'] == 1,
+        f"{stats['entries']} entries, {stats['evictions']} evicted"
+    ))
+
+    # Replacing a key does not count its old size twice
+    cache = PredictionCache(max_entries=0, max_bytes=4096)
+    for i in range(200):
+        cache.put(f'key-{i}', ('Positif', 0.5))
+    cache.put('key-199', ('Negatif', 0.5))
+    stats = cache.stats()
+    results.append(check(
+        'Byte bound',
+        0 < stats['bytes'] <= 4096 and stats['evictions'] > 0 and cache.get('key-199') == ('Negatif', 0.5),
+        f"{stats['entries']} entries, {stats['bytes']} bytes"
+    ))
+    cache.put('big', 'x' * 8192)
+    results.append(check('Oversized values are not cached', cache.get('big') is None))
+
+    # Expired entries are misses and are dropped
+    cache = PredictionCache(max_entries=10, max_bytes=0, ttl=0.05)
+    cache.put('a', ('Netral', 0.7))
+    fresh = cache.get('a')
+    time.sleep(0.1)
+    stats_before = cache.stats()
+    expired = cache.get('a')
+    stats = cache.stats()
+    results.append(check(
+        'TTL expiry',
+        fresh == ('Netral', 0.7) and expired is None and stats['expirations'] == 1 and stats['entries'] == 0,
+        f"{stats_before['entries']} -> {stats['entries']} entries"
+    ))
+
+    # Concurrent writers keep the bounds and the byte count consistent
+    cache = PredictionCache(max_entries=100, max_bytes=0)
+
+    def writer(offset):
+        for i in range(2000):
+            cache.put(f'{offset}-{i % 300}', ('Positif', 0.5))
+            cache.get(f'{offset}-{(i * 7) % 300}')
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    expected_bytes = sum(size for _, size, _ in cache._data.values())
+    results.append(check(
+        'Concurrent access',
+        stats['entries'] == 100 and stats['bytes'] == expected_bytes,
+        f"{stats['entries']} entries, {stats['hits']} hits, {stats['misses']} misses"
+    ))
+
+    if not all(results):
+        print("\n❌ Cache check failed")
+        sys.exit(1)
+    print("\n✅ Cache check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Keyset pagination check of the analysis history (history.py) on a temporary
+SQLite database, with many rows sharing the same created_at (bulk inserts
+stamp a whole batch with one time): walking every page must return each row
+exactly once in newest-first order, also with a source filter and with rows
+added between page requests, and cursors must round-trip.
+
+Usage:
+    python verify_history_pagination.py
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from extensions import db
+from history import bulk_insert_analyses, decode_cursor, encode_cursor, history_page
+from models import Analysis, User
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def walk(user_id, per_page, source=None, between_pages=None):
+    """Ids of every page, following next cursors."""
+    ids = []
+    cursor = None
+    while True:
+        items, cursor = history_page(user_id, cursor=cursor, per_page=per_page, source=source)
+        ids.extend(item.id for item in items)
+        if cursor is None:
+            return ids
+        if between_pages:
+            between_pages()
+
+
+def newest_first(user_id, source=None):
+    query = Analysis.query.filter_by(user_id=user_id)
+    if source:
+        query = query.filter_by(source=source)
+    return [a.id for a in query.order_by(Analysis.created_at.desc(), Analysis.id.desc())]
+
+
+def main():
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'history.db'))
+        with app.app_context():
+            db.create_all()
+            user = User(username='user', email='user@example.com', password_hash='-')
+            db.session.add(user)
+            db.session.commit()
+
+            # Three bulk batches with one created_at each, plus ORM rows at
+            # the same instants and some with distinct times
+            tie = datetime(2024, 5, 1, 12, 0, 0, 123456)
+            for batch, source in enumerate(['file:a.csv', 'url:https://youtu.be/x', 'file:a.csv']):
+                bulk_insert_analyses([
+                    {'user_id': user.id, 'text': f'teks {batch}-{i}', 'sentiment': 'Positif',
+                     'source': source, 'created_at': tie + timedelta(seconds=batch)}
+                    for i in range(37)
+                ])
+            for i in range(12):
+                db.session.add(Analysis(user_id=user.id, text=f'klasifikasi {i}', sentiment='Netral',
+                                        created_at=tie + timedelta(seconds=i % 3)))
+            for i in range(5):
+                db.session.add(Analysis(user_id=user.id, text=f'lain {i}', sentiment='Negatif',
+                                        created_at=tie - timedelta(minutes=i)))
+            db.session.commit()
+
+            expected = newest_first(user.id)
+            ties = len(expected) - len({a.created_at for a in Analysis.query.all()})
+            for per_page in (1, 7, 10, 37, 100):
+                ids = walk(user.id, per_page)
+                results.append(check(
+                    f'All rows once, newest first ({per_page} per page)',
+                    ids == expected,
+                    f"{len(ids)} of {len(expected)} rows, {ties} created_at ties"
+                ))
+
+            ids = walk(user.id, 10, source='file:a.csv')
+            results.append(check(
+                'Saved run pages (source filter)',
+                ids == newest_first(user.id, 'file:a.csv'),
+                f"{len(ids)} rows"
+            ))
+
+            # Newer rows written while paging do not shift the pages already cursored
+            def add_newer():
+                bulk_insert_analyses([
+                    {'user_id': user.id, 'text': 'baru', 'sentiment': 'Positif', 'created_at': datetime.utcnow()}
+                ])
+                db.session.commit()
+
+            ids = walk(user.id, 10, between_pages=add_newer)
+            results.append(check('Stable under concurrent inserts', ids == expected, f"{len(ids)} rows"))
+
+            first = db.session.get(Analysis, expected[0])
+            created_at, analysis_id = decode_cursor(encode_cursor(first))
+            try:
+                decode_cursor('not-a-cursor')
+                rejected = False
+            except ValueError:
+                rejected = True
+            results.append(check(
+                'Cursor round-trip (microseconds kept), invalid cursors rejected',
+                (created_at, analysis_id) == (first.created_at, first.id) and rejected
+            ))
+
+    if not all(results):
+        print("\n❌ History pagination check failed")
+        sys.exit(1)
+    print("\n✅ History pagination check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Check of the write-behind history writer (history_writer.py) on a temporary
+SQLite database: rows submitted from several threads are written in batches
+and every future resolves to its row id, close() flushes what is still
+queued (rows queued behind the stop marker included), and the process-wide
+writer flushes its queue when the process exits.
+
+Usage:
+    python verify_history_writer.py
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from flask import Flask
+
+from extensions import db
+from history_writer import HistoryWriter, get_writer
+from models import Analysis, User
+
+SENTIMENTS = ['Positif', 'Negatif', 'Netral']
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def row(user_id, text):
+    return {'user_id': user_id, 'text': text, 'sentiment': SENTIMENTS[len(text) % 3], 'confidence': 0.9}
+
+
+def written_texts(ids):
+    """Row id -> text for the given ids."""
+    return dict(db.session.query(Analysis.id, Analysis.text).filter(Analysis.id.in_(ids)).all())
+
+
+def exit_with_pending(path, count):
+    """Child process: queue rows on the process-wide writer and exit without closing it."""
+    app = create_app(path)
+    writer = get_writer(app)
+    for i in range(count):
+        writer.submit(row(1, f'keluar {i}'))
+
+
+def main():
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.db')
+        app = create_app(path)
+        with app.app_context():
+            db.create_all()
+            user = User(username='user', email='user@example.com', password_hash='-')
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+
+            # Submitted from several threads, written in batches of flush_size
+            writer = HistoryWriter(app, flush_size=50, flush_interval=0.05)
+            submitted = {}
+
+            def submit(n):
+                for i in range(100):
+                    text = f'ulasan {n}-{i}'
+                    submitted[text] = writer.submit(row(user_id, text))
+
+            threads = [threading.Thread(target=submit, args=(n,)) for n in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            ids = {text: future.result(timeout=10) for text, future in submitted.items()}
+            stats = writer.stats()
+            results.append(check(
+                'Batched writes, futures resolve to their row ids',
+                written_texts(ids.values()) == {row_id: text for text, row_id in ids.items()}
+                and stats['written'] == 400 and 8 <= stats['batches'] < 400 and stats['failed'] == 0,
+                f"{stats['written']} rows in {stats['batches']} batches"
+            ))
+
+            # close() writes what is still queued before returning
+            writer.submit(row(user_id, 'sebelum ditutup'))
+            started = time.monotonic()
+            writer.close()
+            results.append(check(
+                'close() flushes the pending batch',
+                writer.stats()['written'] == 401 and Analysis.query.filter_by(text='sebelum ditutup').count() == 1,
+                f"closed in {time.monotonic() - started:.2f}s"
+            ))
+
+            # Rows submitted after close() started, while the last flush waits for
+            # the database, sit behind the stop marker and are drained too
+            writer = HistoryWriter(app, flush_size=50, flush_interval=0.05)
+            blocker = sqlite3.connect(path)
+            blocker.execute('BEGIN EXCLUSIVE')
+            first = writer.submit(row(user_id, 'sebelum berhenti'))
+            closer = threading.Thread(target=writer.close)
+            closer.start()
+            time.sleep(0.3)
+            behind = [writer.submit(row(user_id, f'di belakang {i}')) for i in range(5)]
+            blocker.rollback()
+            blocker.close()
+            closer.join()
+            ids = [future.result(timeout=1) for future in [first] + behind]
+            results.append(check(
+                'Rows behind the stop marker drained',
+                len(written_texts(ids)) == 6 and writer.stats() == {'pending': 0, 'written': 6, 'batches': 2, 'failed': 0},
+                f"{writer.stats()['written']} rows in {writer.stats()['batches']} batches"
+            ))
+
+        # The process-wide writer flushes at exit (atexit)
+        connection = sqlite3.connect(path)
+        before = connection.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        connection.close()
+        subprocess.run(
+            [sys.executable, '-c',
+             f"import verify_history_writer as v; v.exit_with_pending({path!r}, 25)"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        )
+        connection = sqlite3.connect(path)
+        exited = connection.execute("SELECT COUNT(*) FROM analyses WHERE text LIKE 'keluar %'").fetchone()[0]
+        total = connection.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        connection.close()
+        results.append(check(
+            'Queue flushed on process exit',
+            exited == 25 and total == before + 25,
+            f"{exited} of 25 rows written"
+        ))
+
+    if not all(results):
+        print("\n❌ History writer check failed")
+        sys.exit(1)
+    print("\n✅ History writer check passed")
+
+
+if __name__ == "__main__":
+    main()
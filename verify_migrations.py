@@ -0,0 +1,178 @@
+"""
+Check of the versioned migrations (migrations.py) on temporary SQLite
+databases: a database with the original analyses table is migrated by several
+processes starting together (each running the app's start-up: create_all and
+upgrade under schema_lock), exactly one of them applies the migrations and
+the others find nothing left to do; upgrading again changes nothing, a fresh
+create_all() database goes through every migration, a failing migration
+rolls back with its DDL, and schema_lock is exclusive across processes and
+re-entrant within one.
+
+Usage:
+    python verify_migrations.py
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from extensions import db
+import models  # noqa: F401  (registers the tables on db.metadata)
+import migrations
+from migrations import current_version, latest_version, schema_lock, upgrade
+
+ORIGINAL_ANALYSES = """
+CREATE TABLE analyses (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    text TEXT NOT NULL,
+    sentiment VARCHAR(20) NOT NULL,
+    confidence FLOAT,
+    created_at DATETIME
+)
+"""
+NEW_COLUMNS = {'correction', 'corrected_at', 'source', 'text_hash', 'model_fingerprint'}
+NEW_INDEXES = {'ix_analyses_corrected_at', 'ix_analyses_user_created', 'ix_analyses_user_source',
+               'ix_analyses_user_text_hash'}
+SENTIMENTS = ['Positif', 'Negatif', 'Netral']
+WORKERS = 4
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+
+def start_up(url):
+    """What every app worker does at import time."""
+    engine = create_engine(url)
+    try:
+        with schema_lock(engine):
+            db.metadata.create_all(engine)
+            return upgrade(engine)
+    finally:
+        engine.dispose()
+
+
+def wait_for_lock(url, acquired):
+    engine = create_engine(url)
+    with schema_lock(engine):
+        acquired.put(time.time())
+    engine.dispose()
+
+
+def create_original(url, rows):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        db.metadata.tables['users'].create(conn)
+        conn.exec_driver_sql(ORIGINAL_ANALYSES)
+        conn.exec_driver_sql("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'user', 'u@example.com', '-')")
+        for i in range(rows):
+            conn.exec_driver_sql(
+                "INSERT INTO analyses (user_id, text, sentiment, confidence, created_at) VALUES (1, ?, ?, 0.9, ?)",
+                (f'ulasan pelayanan nomor {i}', SENTIMENTS[i % 3], f'2024-05-{1 + i % 28:02d} 12:00:00')
+            )
+    return engine
+
+
+def schema(conn):
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(analyses)")}
+    indexes = {row[1] for row in conn.exec_driver_sql("PRAGMA index_list(analyses)")}
+    return columns, indexes
+
+
+def main():
+    results = []
+    spawn = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        # Workers starting together on a database from before the migrations
+        url = f"sqlite:///{os.path.join(tmp, 'original.db')}"
+        engine = create_original(url, rows=90)
+        with spawn.Pool(WORKERS) as pool:
+            applied = pool.map(start_up, [url] * WORKERS)
+        migrated = [versions for versions in applied if versions]
+        results.append(check(
+            'Concurrent start-up migrates once',
+            migrated == [list(range(1, latest_version() + 1))] and applied.count([]) == WORKERS - 1,
+            f"applied per worker: {applied}"
+        ))
+
+        with engine.connect() as conn:
+            columns, indexes = schema(conn)
+            version = current_version(conn)
+            term_rows = conn.exec_driver_sql("SELECT COUNT(*) FROM term_counts").scalar()
+            rolled_up = conn.exec_driver_sql("SELECT SUM(count) FROM sentiment_daily_counts").scalar()
+        results.append(check(
+            'Columns, indexes and backfills in place',
+            NEW_COLUMNS <= columns and NEW_INDEXES <= indexes and version == latest_version()
+            and term_rows > 0 and rolled_up == 90,
+            f"user_version {version}, {term_rows} term rows, {rolled_up} analyses rolled up"
+        ))
+        results.append(check('Upgrading again changes nothing', start_up(url) == []))
+        engine.dispose()
+
+        # A fresh database from create_all() goes through every migration unchanged
+        url = f"sqlite:///{os.path.join(tmp, 'fresh.db')}"
+        engine = create_engine(url)
+        db.metadata.create_all(engine)
+        with engine.connect() as conn:
+            before = schema(conn)
+        applied = start_up(url)
+        with engine.connect() as conn:
+            after = schema(conn)
+            version = current_version(conn)
+        results.append(check(
+            'Fresh database migrates without changes',
+            applied == list(range(1, latest_version() + 1)) and before == after and version == latest_version()
+        ))
+
+        # A failing migration rolls back together with its DDL and version bump
+        @migrations.migration("Broken migration")
+        def _broken(conn):
+            conn.exec_driver_sql("ALTER TABLE analyses ADD COLUMN half_done INTEGER")
+            raise RuntimeError("migration failed")
+
+        try:
+            upgrade(engine)
+            failed = False
+        except RuntimeError:
+            failed = True
+        finally:
+            migrations.MIGRATIONS.pop()
+        with engine.connect() as conn:
+            columns, _ = schema(conn)
+            version = current_version(conn)
+        results.append(check(
+            'Failed migration rolled back',
+            failed and 'half_done' not in columns and version == latest_version()
+        ))
+
+        # schema_lock: re-entrant here, exclusive against another process
+        acquired = spawn.Queue()
+        with schema_lock(engine):
+            with schema_lock(engine):
+                waiter = spawn.Process(target=wait_for_lock, args=(url, acquired))
+                waiter.start()
+                time.sleep(1.0)
+            released = time.time()
+        waiter.join(30)
+        acquired_at = acquired.get(timeout=5)
+        results.append(check(
+            'schema_lock re-entrant, exclusive across processes',
+            acquired_at >= released,
+            f"other process waited until {acquired_at - released:+.2f}s after release"
+        ))
+        engine.dispose()
+
+    if not all(results):
+        print("\n❌ Migrations check failed")
+        sys.exit(1)
+    print("\n✅ Migrations check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Export check for the ONNX and INT8 inference paths on a tiny, randomly
+initialized model (no download, runs in seconds on CPU).
+
+Builds a 2-layer BertForSequenceClassification with a vocabulary made from the
+sample texts, then:
+- exports it with onnx_backend and checks that ONNX Runtime returns the same
+  labels and scores as PyTorch, for one padded batch and text by text;
+- checks that loading it again reuses the cached graph;
+- quantizes it with quantization.py, checks that the persisted INT8 artifact
+  reloads to the same outputs and that its labels agree with the fp32 model.
+
+Usage:
+    python verify_onnx.py [--atol 1e-4] [--min-agreement 0.9]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import torch
+from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+from onnx_backend import load_onnx_classifier
+from quantization import load_or_quantize, load_quantized
+
+LABELS = {0: 'negative', 1: 'neutral', 2: 'positive'}
+SPECIAL_TOKENS = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]']
+
+TEXTS = [
+    "Makanannya enak sekali",
+    "Pelayanannya lambat dan kurang ramah",
+    "Biasa saja, tidak ada yang istimewa dari tempat ini",
+    "Harga terjangkau tapi antrian panjang sekali, pelayanan kurang cepat",
+    "Saya sangat senang dengan pelayanan ini, luar biasa!",
+    "Kualitas produk buruk, tidak sesuai dengan deskripsi, kecewa sekali dengan penjual",
+    "Pengiriman cepat",
+    "Tempatnya bersih, nyaman, parkir luas, makanannya enak dan harganya terjangkau untuk keluarga",
+]
+
+
+def build_tiny_model(model_dir):
+    """A random 2-layer BERT classifier and its tokenizer, saved to model_dir."""
+    words = sorted({
+        word for text in TEXTS
+        for word in text.lower().replace(',', ' ').replace('!', ' ').split()
+    })
+    os.makedirs(model_dir, exist_ok=True)
+    vocab_path = os.path.join(model_dir, 'vocab.txt')
+    with open(vocab_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(SPECIAL_TOKENS + words) + '\n')
+    tokenizer = BertTokenizerFast(vocab_file=vocab_path)
+
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=len(SPECIAL_TOKENS) + len(words),
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=37,
+        max_position_embeddings=128,
+        num_labels=len(LABELS),
+        id2label=LABELS,
+        label2id={label: i for i, label in LABELS.items()}
+    )
+    model = BertForSequenceClassification(config).eval()
+    # Spread the random logits so labels do not hinge on rounding noise
+    with torch.no_grad():
+        model.classifier.weight.mul_(20)
+
+    model.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+    return model, tokenizer
+
+
+def torch_predictions(model, tokenizer, texts):
+    """[(label, score), ...] from a PyTorch model, as the transformers pipeline computes them."""
+    encoded = tokenizer(texts, padding=True, truncation=True, max_length=128, return_tensors='pt')
+    with torch.no_grad():
+        probs = torch.softmax(model(**encoded).logits, dim=-1)
+    return [(LABELS[int(p.argmax())], float(p.max())) for p in probs]
+
+
+def compare(name, expected, actual, atol):
+    """Print how two prediction lists agree; True if every label matches and scores are within atol."""
+    matching = sum(e[0] == a[0] for e, a in zip(expected, actual))
+    max_diff = max(abs(e[1] - a[1]) for e, a in zip(expected, actual))
+    ok = matching == len(expected) and max_diff <= atol
+    print(f"{'✅' if ok else '❌'} {name}: {matching}/{len(expected)} labels equal, max score difference {max_diff:.2e}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the ONNX export and INT8 quantization on a tiny model")
+    parser.add_argument('--atol', type=float, default=1e-4, help='Maximum ONNX vs PyTorch score difference')
+    parser.add_argument('--min-agreement', type=float, default=0.9,
+                        help='Minimum share of INT8 labels equal to the fp32 ones')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = os.path.join(tmp, 'model')
+        model, tokenizer = build_tiny_model(model_dir)
+        expected = torch_predictions(model, tokenizer, TEXTS)
+
+        # ONNX export, batched and one text at a time (dynamic batch and sequence axes)
+        onnx_dir = os.path.join(tmp, 'onnx')
+        classifier = load_onnx_classifier(model, tokenizer, onnx_dir, 'tiny')
+        batched = [(r['label'], r['score']) for r in classifier(TEXTS, batch_size=len(TEXTS))]
+        single = [(r['label'], r['score']) for r in classifier(TEXTS, batch_size=1)]
+        failed |= not compare('ONNX batch vs PyTorch', expected, batched, args.atol)
+        failed |= not compare('ONNX single vs PyTorch', expected, single, args.atol)
+
+        exported_at = os.path.getmtime(classifier.onnx_path)
+        again = load_onnx_classifier(model, tokenizer, onnx_dir, 'tiny')
+        reused = again.onnx_path == classifier.onnx_path and os.path.getmtime(again.onnx_path) == exported_at
+        print(f"{'✅' if reused else '❌'} Cached ONNX graph reused")
+        failed |= not reused
+
+        # INT8: quantize from the saved fp32 model, persist, reload
+        int8_dir = os.path.join(tmp, 'int8')
+        qmodel = load_or_quantize(model_dir, int8_dir)
+        quantized = torch_predictions(qmodel, tokenizer, TEXTS)
+        reloaded = torch_predictions(load_quantized(int8_dir), tokenizer, TEXTS)
+        failed |= not compare('INT8 reloaded vs quantized', quantized, reloaded, 1e-6)
+
+        agreement = sum(e[0] == q[0] for e, q in zip(expected, quantized)) / len(expected)
+        ok = agreement >= args.min_agreement
+        print(f"{'✅' if ok else '❌'} INT8 vs fp32 label agreement {agreement:.0%} (minimum {args.min_agreement:.0%})")
+        failed |= not ok
+
+    if failed:
+        print("\n❌ Export check failed")
+        sys.exit(1)
+    print("\n✅ Export check passed")
+
+
+if __name__ == "__main__":
+    main()
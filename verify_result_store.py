@@ -0,0 +1,119 @@
+"""
+Behaviour check of the persistent prediction store (result_store.py) on a
+temporary database: per-model rows, visibility across connections (workers),
+least-recently-used eviction beyond max_entries, and compaction.
+
+Usage:
+    python verify_result_store.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import result_store
+from result_store import ResultStore
+
+MODEL = 'aaaaaaaaaaaaaaaa'
+OTHER_MODEL = 'bbbbbbbbbbbbbbbb'
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+
+def set_last_access(store, model, hashes, when):
+    placeholders = ','.join('?' * len(hashes))
+    store._connection().execute(
+        f"UPDATE predictions SET last_access = ? WHERE model = ? AND text_hash IN ({placeholders})",
+        [int(when), model] + list(hashes)
+    )
+
+
+def main():
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'store.db')
+
+        # Rows are per model, and another instance (another worker) sees them
+        store = ResultStore(path, max_entries=0)
+        store.put_many(MODEL, [('h1', 'Positif', 0.9), ('h2', 'Negatif', 0.8)])
+        store.put_many(OTHER_MODEL, [('h1', 'Netral', 0.6)])
+        other = ResultStore(path, max_entries=0)
+        found = other.get_many(MODEL, ['h1', 'h2', 'h3'])
+        results.append(check(
+            'Shared across instances, keyed by model',
+            found == {'h1': ('Positif', 0.9), 'h2': ('Negatif', 0.8)}
+            and other.get_many(OTHER_MODEL, ['h1']) == {'h1': ('Netral', 0.6)},
+            f"{len(found)} of 3 found"
+        ))
+
+        # Each thread uses its own connection
+        errors = []
+
+        def writer(n):
+            try:
+                thread_store = ResultStore(path, max_entries=0)
+                for i in range(20):
+                    thread_store.put_many(MODEL, [(f't{n}-{i}', 'Positif', 0.5)])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results.append(check('Concurrent writers', not errors and store.count() == 83, f"{store.count()} rows"))
+
+        # Reads refresh last_access (at most once per ACCESS_REFRESH_INTERVAL)
+        old = time.time() - 2 * result_store.ACCESS_REFRESH_INTERVAL
+        set_last_access(store, MODEL, ['h1'], old)
+        store.get_many(MODEL, ['h1'])
+        last_access = store._connection().execute(
+            "SELECT last_access FROM predictions WHERE model = ? AND text_hash = 'h1'", (MODEL,)
+        ).fetchone()[0]
+        results.append(check('Reads refresh last_access', last_access > old))
+
+        # Beyond max_entries, the least recently used rows go first
+        path = os.path.join(tmp, 'bounded.db')
+        store = ResultStore(path, max_entries=10)
+        store.put_many(MODEL, [(f'h{i}', 'Positif', 0.5) for i in range(15)])
+        set_last_access(store, MODEL, [f'h{i}' for i in range(5)], time.time() - 1000)
+        evicted = store.evict()
+        remaining = store.get_many(MODEL, [f'h{i}' for i in range(15)])
+        results.append(check(
+            'LRU eviction beyond max_entries',
+            evicted == 5 and store.count() == 10 and not any(f'h{i}' in remaining for i in range(5)),
+            f"{evicted} evicted, {store.count()} rows left"
+        ))
+
+        # Eviction also runs by itself every EVICTION_CHECK_EVERY written rows
+        store.put_many(MODEL, [(f'bulk{i}', 'Netral', 0.5) for i in range(result_store.EVICTION_CHECK_EVERY)])
+        results.append(check('Automatic eviction on writes', store.count() == 10, f"{store.count()} rows"))
+
+        # Compaction drops other models and old rows, then reclaims space
+        path = os.path.join(tmp, 'compact.db')
+        store = ResultStore(path, max_entries=0)
+        store.put_many(MODEL, [(f'h{i}', 'Positif', 0.5) for i in range(2000)])
+        store.put_many(OTHER_MODEL, [(f'h{i}', 'Negatif', 0.5) for i in range(2000)])
+        set_last_access(store, MODEL, [f'h{i}' for i in range(100)], time.time() - 40 * 86400)
+        result = store.compact(keep_models=[MODEL], max_age_days=30)
+        models = {row[0] for row in store._connection().execute("SELECT DISTINCT model FROM predictions")}
+        results.append(check(
+            'Compaction',
+            result == {'before': 4000, 'after': 1900} and models == {MODEL},
+            f"{result['before']} -> {result['after']} rows"
+        ))
+
+    if not all(results):
+        print("\n❌ Result store check failed")
+        sys.exit(1)
+    print("\n✅ Result store check passed")
+
+
+if __name__ == "__main__":
+    main()
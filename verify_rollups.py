@@ -0,0 +1,145 @@
+"""
+Consistency check of the daily sentiment rollups (rollups.py) on a temporary
+SQLite database: analyses are written through every path that maintains them
+(ORM adds and deletes through the after_flush hook in history.py, bulk
+inserts, a rolled-back flush), then the incrementally maintained
+sentiment_daily_counts must equal a rebuild from scratch, and trend() and
+count_analyses() must match counts taken directly from the analyses table.
+
+Usage:
+    python verify_rollups.py
+"""
+
+import os
+import sys
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from extensions import db
+from history import bulk_insert_analyses
+from models import Analysis, SentimentDailyCount, User
+import rollups
+
+SENTIMENTS = ['Positif', 'Negatif', 'Netral', 'Positif', 'Negatif', 'Positif', 'Netral']
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def rollup_rows():
+    return {
+        (row.user_id, row.day, row.sentiment): row.count
+        for row in SentimentDailyCount.query.all()
+    }
+
+
+def write_history(user_ids):
+    now = datetime.utcnow()
+    for user_id in user_ids:
+        # ORM adds, several per flush (after_flush hook)
+        for day, sentiment in enumerate(SENTIMENTS * 3):
+            db.session.add(Analysis(
+                user_id=user_id, text=f'ulasan {day}', sentiment=sentiment, created_at=now - timedelta(days=day)
+            ))
+            if day % 4 == 3:
+                db.session.commit()
+        db.session.commit()
+
+        # Bulk inserts bypass the ORM and count the rows themselves
+        bulk_insert_analyses([
+            {'user_id': user_id, 'text': f'komentar {i}', 'sentiment': sentiment, 'confidence': 0.8,
+             'created_at': now - timedelta(days=i % 40)}
+            for i, sentiment in enumerate(SENTIMENTS * 20)
+        ])
+        db.session.commit()
+
+    # A flushed, then rolled back, write is not counted
+    db.session.add(Analysis(user_id=user_ids[0], text='dibatalkan', sentiment='Negatif', created_at=now))
+    db.session.flush()
+    db.session.rollback()
+
+    # ORM deletes are subtracted
+    for analysis in Analysis.query.filter_by(user_id=user_ids[0]).order_by(Analysis.id).limit(9):
+        db.session.delete(analysis)
+    db.session.commit()
+
+
+def expected_trend(user_id, days, bucket):
+    """trend() computed straight from the analyses table."""
+    today = datetime.utcnow().date()
+    first = today - timedelta(days=days - 1)
+    counts = Counter()
+    for analysis in Analysis.query.filter_by(user_id=user_id):
+        day = analysis.created_at.date()
+        if day >= first:
+            label = rollups._bucket_start(day, bucket).strftime('%Y-%m-%d')
+            counts[(label, analysis.sentiment)] += 1
+    return counts
+
+
+def main():
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'history.db'))
+        with app.app_context():
+            db.create_all()
+            users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='-') for i in range(2)]
+            db.session.add_all(users)
+            db.session.commit()
+            user_ids = [user.id for user in users]
+
+            write_history(user_ids)
+            incremental = rollup_rows()
+            rollups.rebuild()
+            rebuilt = rollup_rows()
+            difference = set(incremental.items()) ^ set(rebuilt.items())
+            results.append(check(
+                'Incremental rollups equal a rebuild',
+                incremental == rebuilt,
+                f"{len(rebuilt)} rollup rows, {len(difference)} differ"
+            ))
+
+            user_id = user_ids[0]
+            total = Analysis.query.filter_by(user_id=user_id).count()
+            results.append(check(
+                'count_analyses',
+                rollups.count_analyses(user_id) == total and rollups.count_analyses() == Analysis.query.count(),
+                f"{total} analyses of user {user_id}"
+            ))
+
+            for days, bucket in [(7, 'day'), (30, 'day'), (90, 'week')]:
+                trend = rollups.trend(user_id, days=days, bucket=bucket)
+                expected = expected_trend(user_id, days, bucket)
+                actual = Counter({
+                    (label, sentiment): trend[sentiment][i]
+                    for i, label in enumerate(trend['dates'])
+                    for sentiment in rollups.SENTIMENT_LABELS
+                    if trend[sentiment][i]
+                })
+                results.append(check(
+                    f'trend over {days} days per {bucket}',
+                    actual == expected,
+                    f"{len(trend['dates'])} buckets, {sum(actual.values())} analyses"
+                ))
+
+    if not all(results):
+        print("\n❌ Rollups check failed")
+        sys.exit(1)
+    print("\n✅ Rollups check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Behaviour check of the YouTube scraper against a local fake downloader (no
+network): cache hits, incremental refresh, URL de-duplication and error
+reporting.
+
+Usage:
+    python verify_scraper.py
+"""
+
+import sys
+import threading
+
+from scraper import CommentCache, Scraper, SORT_NEWEST
+
+VIDEO = 'AAAAAAAAAAA'
+BROKEN = 'BBBBBBBBBBB'
+
+
+class FakeDownloader:
+    """
+    Serves comments from memory, newest first, and counts what is read.
+    Fetching BROKEN fails after its first comment.
+    """
+
+    def __init__(self):
+        self.comments = {VIDEO: [], BROKEN: [{'cid': 'b1', 'text': 'komentar b1'}]}
+        self.calls = 0
+        self.read = 0
+        self._lock = threading.Lock()
+
+    def add(self, video, count, prefix):
+        # Newer comments go first, as with sort_by=SORT_NEWEST
+        new = [{'cid': f'{prefix}{i}', 'text': f'komentar {prefix}{i}'} for i in range(count)]
+        self.comments[video] = new + self.comments[video]
+
+    def get_comments_from_url(self, url, sort_by=0):
+        assert sort_by == SORT_NEWEST
+        with self._lock:
+            self.calls += 1
+        video = VIDEO if VIDEO in url else BROKEN
+        for comment in list(self.comments[video]):
+            with self._lock:
+                self.read += 1
+            yield comment
+            if video == BROKEN:
+                raise ConnectionError('fake network error')
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+
+def main():
+    fake = FakeDownloader()
+    fake.add(VIDEO, 10, 'old')
+    cache = CommentCache(ttl=60)
+    scraper = Scraper(downloader_factory=lambda: fake, cache=cache, max_workers=2)
+    url = f'https://www.youtube.com/watch?v={VIDEO}'
+    results = []
+
+    # First fetch downloads, the second one within the TTL is a cache hit
+    info = {}
+    first = list(scraper.iter_comments(url, 5, info))
+    calls = fake.calls
+    info = {}
+    second = list(scraper.iter_comments(url, 5, info))
+    results.append(check(
+        'Cache hit within the TTL',
+        second == first and info['from_cache'] and fake.calls == calls,
+        f"from_cache={info['from_cache']}, downloads {calls} -> {fake.calls}"
+    ))
+
+    # After the TTL, only comments newer than the cached ones are downloaded
+    cache.get(VIDEO).fetched_at -= cache.ttl
+    fake.add(VIDEO, 3, 'new')
+    read = fake.read
+    info = {}
+    refreshed = list(scraper.iter_comments(url, 5, info))
+    expected = ['komentar new0', 'komentar new1', 'komentar new2'] + first[:2]
+    results.append(check(
+        'Incremental refresh',
+        refreshed == expected and info['new'] == 3 and fake.read - read == 4,
+        f"{info['new']} new, {fake.read - read} comments read (3 new + 1 to catch up)"
+    ))
+
+    # The same video under several URL forms is fetched once
+    calls = fake.calls
+    urls = [url, f'https://youtu.be/{VIDEO}', f'https://www.youtube.com/shorts/{VIDEO}?feature=share']
+    events = list(scraper.iter_batches(urls, 20, batch_size=4))
+    done = [event for event in events if event[0] == 'done']
+    texts = [text for kind, _, payload in events if kind == 'comments' for text in payload]
+    results.append(check(
+        'iter_batches de-duplicates URL forms',
+        len(done) == 1 and fake.calls - calls == 1 and len(texts) == 13 and all(len(e[2]) <= 4 for e in events if e[0] == 'comments'),
+        f"{len(done)} done events, {fake.calls - calls} downloads, {len(texts)} comments"
+    ))
+
+    # A failing download ends the stream and is reported in info['error']
+    info = {}
+    partial = list(scraper.iter_comments(f'https://youtu.be/{BROKEN}', 5, info))
+    results.append(check(
+        "Errors reported in info['error']",
+        partial == ['komentar b1'] and info['error'] == 'fake network error',
+        f"error={info['error']!r}"
+    ))
+    events = list(scraper.iter_batches([f'https://youtu.be/{BROKEN}'], 5, batch_size=4))
+    results.append(check(
+        "Errors reported in iter_batches 'done' events",
+        events[-1][0] == 'done' and events[-1][2]['error'] == 'fake network error'
+    ))
+
+    if not all(results):
+        print("\n❌ Scraper check failed")
+        sys.exit(1)
+    print("\n✅ Scraper check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Start-up profile check for app.py.
+
+Imports the app in a fresh interpreter with ``-X importtime``, answers one
+/api/health request, and fails if a heavy stack was imported on the way or if
+start-up to the first health response is over budget.
+
+Usage:
+    python verify_startup.py [--budget-ms 1500] [--top 15]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Must not be imported before a route needs them
+HEAVY_MODULES = ['torch', 'transformers', 'datasets', 'pandas', 'youtube_comment_downloader', 'onnxruntime']
+
+DEFAULT_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', '1500'))
+
+CHILD_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/api/health')
+answered = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'first_health_ms': (answered - start) * 1000,
+    'health_status': response.status_code,
+    'heavy_modules': [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Top-level imports from ``-X importtime`` output as (module, cumulative_ms).
+    Nested imports are indented in the last column and skipped.
+    """
+    results = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, _, rest = line.partition('import time:')
+        fields = rest.split('|')
+        if len(fields) != 3:
+            continue
+        name = fields[2].rstrip()
+        if name.startswith('  '):
+            continue
+        results.append((name.strip(), int(fields[1]) / 1000))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check app start-up time and lazy imports")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help='Maximum process start to first /api/health response')
+    parser.add_argument('--top', type=int, default=15, help='Slowest top-level imports to show')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        # The background model preload would import torch during the check
+        env={**os.environ, 'SENTIMENT_PRELOAD_MODEL': '0'},
+        capture_output=True,
+        text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    if proc.returncode != 0:
+        print(proc.stderr[-4000:])
+        print("❌ Importing the app failed")
+        sys.exit(1)
+
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    print(f"Import app:            {report['import_ms']:.0f} ms")
+    print(f"First /api/health:     {report['first_health_ms']:.0f} ms (HTTP {report['health_status']})")
+    print(f"Process wall time:     {wall_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    print(f"\nSlowest top-level imports:")
+    for name, ms in sorted(parse_importtime(proc.stderr), key=lambda item: -item[1])[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failed = False
+    if report['heavy_modules']:
+        print(f"\n❌ Heavy modules imported at start-up: {', '.join(report['heavy_modules'])}")
+        failed = True
+    if report['health_status'] != 200:
+        print(f"\n❌ /api/health returned {report['health_status']}")
+        failed = True
+    if wall_ms > args.budget_ms:
+        print(f"\n❌ Start-up took {wall_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("\n✅ Start-up check passed")
+
+
+if __name__ == "__main__":
+    main()
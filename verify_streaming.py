@@ -0,0 +1,111 @@
+"""
+Framing check of the streaming responses (streaming.py) through a Flask test
+client: NDJSON lines and SSE events round-trip their payloads (non-ASCII and
+newlines included), the format is picked from ?stream= or the Accept header,
+and a stream closed early by the client closes the event generator.
+
+Usage:
+    python verify_streaming.py
+"""
+
+import json
+import sys
+
+from flask import Flask, request
+
+from streaming import requested_stream_format, stream_events
+
+EVENTS = [
+    ('result', {'text': 'Makanannya enak sekali 😋', 'sentiment': 'Positif', 'confidence': 0.98}),
+    ('result', {'text': 'baris satu\nbaris dua: "kutipan"', 'sentiment': 'Netral', 'confidence': 0.51}),
+    ('stats', {'stats': {'Positif': 1, 'Netral': 1, 'Negatif': 0}, 'total': 2}),
+]
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+
+def parse_ndjson(body):
+    return [json.loads(line) for line in body.split('\n') if line]
+
+
+def parse_sse(body):
+    events = []
+    for frame in body.split('\n\n'):
+        if not frame:
+            continue
+        fields = dict(line.split(': ', 1) for line in frame.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def build_app(closed):
+    app = Flask(__name__)
+
+    def events():
+        try:
+            yield from EVENTS
+        finally:
+            closed.append(True)
+
+    @app.route('/events')
+    def stream():
+        return stream_events(events(), requested_stream_format(request) or 'ndjson')
+
+    return app
+
+
+def main():
+    closed = []
+    client = build_app(closed).test_client()
+    results = []
+
+    response = client.get('/events?stream=ndjson')
+    body = response.get_data(as_text=True)
+    lines = parse_ndjson(body)
+    results.append(check(
+        'NDJSON framing',
+        response.mimetype == 'application/x-ndjson'
+        and body.count('\n') == len(EVENTS)
+        and lines == [{'type': event_type, **payload} for event_type, payload in EVENTS],
+        f"{len(lines)} lines"
+    ))
+
+    response = client.get('/events', headers={'Accept': 'text/event-stream'})
+    events = parse_sse(response.get_data(as_text=True))
+    results.append(check(
+        'SSE framing (from the Accept header)',
+        response.mimetype == 'text/event-stream' and events == EVENTS,
+        f"{len(events)} events"
+    ))
+    results.append(check(
+        'No proxy buffering or caching',
+        response.headers.get('X-Accel-Buffering') == 'no' and response.headers.get('Cache-Control') == 'no-cache'
+    ))
+
+    with build_app([]).test_request_context('/events?stream=SSE', headers={'Accept': 'application/x-ndjson'}):
+        query_first = requested_stream_format(request)
+    with build_app([]).test_request_context('/events', headers={'Accept': 'application/json'}):
+        plain = requested_stream_format(request)
+    results.append(check('?stream= wins over Accept, JSON otherwise', query_first == 'sse' and plain is None))
+
+    # A client that goes away after the first event
+    closed.clear()
+    response = client.get('/events?stream=ndjson', buffered=False)
+    first = next(iter(response.response))
+    response.close()
+    results.append(check(
+        'Early close reaches the event generator',
+        json.loads(first)['type'] == 'result' and closed == [True]
+    ))
+
+    if not all(results):
+        print("\n❌ Streaming check failed")
+        sys.exit(1)
+    print("\n✅ Streaming check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Consistency check of the word cloud term index (term_index.py) on a
+temporary SQLite database: analyses are written through every path that
+maintains it (ORM adds and deletes through the after_flush hook in
+history.py, bulk inserts, a rolled-back flush), then the incrementally
+maintained term_counts must equal a rebuild from scratch, and top_terms must
+match counts taken directly from the texts.
+
+Usage:
+    python verify_term_index.py
+"""
+
+import os
+import sys
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from extensions import db
+from history import bulk_insert_analyses
+from models import Analysis, TermCount, User
+import term_index
+
+TEXTS = [
+    ('Makanannya enak sekali, pelayanan ramah', 'Positif'),
+    ('Pelayanan lambat, makanannya dingin', 'Negatif'),
+    ('Tempatnya bersih dan pelayanan cepat', 'Positif'),
+    ('Harga mahal untuk makanan biasa', 'Netral'),
+    ('Pengiriman cepat, barang sesuai pesanan', 'Positif'),
+]
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    return ok
+
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def index_rows():
+    return {
+        (row.user_id, row.period, row.sentiment, row.term): row.count
+        for row in TermCount.query.all()
+    }
+
+
+def write_history(user_ids):
+    """Analyses over the last days through every write path; returns the ids deleted again."""
+    now = datetime.utcnow()
+    for user_id in user_ids:
+        # ORM adds, one flush per commit (after_flush hook)
+        for day, (text, sentiment) in enumerate(TEXTS):
+            db.session.add(Analysis(
+                user_id=user_id, text=text, sentiment=sentiment, created_at=now - timedelta(days=day)
+            ))
+            db.session.commit()
+
+        # Bulk inserts bypass the ORM and index the rows themselves
+        bulk_insert_analyses([
+            {'user_id': user_id, 'text': text, 'sentiment': sentiment, 'confidence': 0.9,
+             'created_at': now - timedelta(days=day * 3)}
+            for day, (text, sentiment) in enumerate(TEXTS * 4)
+        ])
+        db.session.commit()
+
+    # A flushed, then rolled back, write leaves no trace in the index
+    db.session.add(Analysis(user_id=user_ids[0], text='Transaksi dibatalkan sebelum commit', sentiment='Negatif'))
+    db.session.flush()
+    db.session.rollback()
+
+    # ORM deletes subtract their terms
+    deleted = [a.id for a in Analysis.query.filter_by(user_id=user_ids[0]).order_by(Analysis.id).limit(7)]
+    for analysis in Analysis.query.filter(Analysis.id.in_(deleted)):
+        db.session.delete(analysis)
+    db.session.commit()
+    return deleted
+
+
+def main():
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'history.db'))
+        with app.app_context():
+            db.create_all()
+            users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='-') for i in range(2)]
+            db.session.add_all(users)
+            db.session.commit()
+            user_ids = [user.id for user in users]
+
+            write_history(user_ids)
+            incremental = index_rows()
+            indexed = term_index.rebuild()
+            rebuilt = index_rows()
+            difference = set(incremental.items()) ^ set(rebuilt.items())
+            results.append(check(
+                'Incremental index equals a rebuild',
+                incremental == rebuilt,
+                f"{len(rebuilt)} term rows from {indexed} analyses, {len(difference)} differ"
+            ))
+            results.append(check(
+                'Rolled-back write not indexed',
+                not any(term == 'dibatalkan' for (_, _, _, term) in incremental)
+            ))
+
+            # top_terms against counts taken straight from the stored texts
+            user_id = user_ids[0]
+            stored = Analysis.query.filter_by(user_id=user_id).all()
+            expected = Counter()
+            for analysis in stored:
+                expected.update(term_index.tokenize(analysis.text))
+            top = dict(term_index.top_terms(user_id, limit=100))
+            results.append(check('All-time top_terms', top == dict(expected), f"{len(top)} terms"))
+
+            since = datetime.utcnow().date() - timedelta(days=6)
+            expected = Counter()
+            for analysis in stored:
+                if analysis.sentiment == 'Positif' and analysis.created_at.date() >= since:
+                    expected.update(term_index.tokenize(analysis.text))
+            top = dict(term_index.top_terms(user_id, limit=100, days=7, sentiment='Positif'))
+            results.append(check('7-day, per-sentiment top_terms', top == dict(expected), f"{len(top)} terms"))
+
+    if not all(results):
+        print("\n❌ Term index check failed")
+        sys.exit(1)
+    print("\n✅ Term index check passed")
+
+
+if __name__ == "__main__":
+    main()